@@ -0,0 +1,69 @@
+"""
+DATABASES['default'] built from the environment.
+
+DB_ENGINE picks the backend:
+
+- ``sqlite`` (default): a local file tuned for concurrent workers. WAL lets
+  status polls read while a worker writes, ``synchronous=NORMAL`` syncs on
+  checkpoints rather than every commit (safe from corruption in WAL mode),
+  the busy timeout makes a writer wait for the lock instead of failing with
+  "database is locked", and IMMEDIATE transactions take the write lock up
+  front so a read-then-write transaction can't hit a lock upgrade conflict,
+  which the busy timeout does not cover.
+- ``postgres``: persistent connections (DB_CONN_MAX_AGE) with health
+  checks, or a psycopg connection pool with DB_POOL (needs
+  ``psycopg[pool]``; Django keeps pooled connections itself, so
+  CONN_MAX_AGE is then 0).
+"""
+import os
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() == 'true'
+
+
+def sqlite_config(base_dir):
+    journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    synchronous = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', str(base_dir / 'db.sqlite3')),
+        'OPTIONS': {
+            # Run on every new connection
+            'init_command': f'PRAGMA journal_mode={journal_mode}; PRAGMA synchronous={synchronous};',
+            'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', '20')),  # seconds
+            'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }
+
+
+def postgres_config():
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'serge'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),  # seconds, 0 closes after each request
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {},
+    }
+    if env_bool('DB_POOL', False):
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),  # seconds to wait for a free connection
+        }
+    return config
+
+
+def database_config(base_dir):
+    """The default database described by DB_ENGINE and its variables"""
+    engine = os.environ.get('DB_ENGINE', 'sqlite').lower()
+    if engine == 'sqlite':
+        return sqlite_config(base_dir)
+    if engine in ('postgres', 'postgresql'):
+        return postgres_config()
+    raise ValueError(f"Unknown DB_ENGINE '{engine}', use sqlite or postgres")
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from .database import database_config
 
 # Load environment variables from .env file
 load_dotenv()
@@ -39,10 +40,72 @@ DJANGO_BACKEND_URL = os.environ.get('DJANGO_BACKEND_URL', 'http://localhost:8000
 CLICKDROP_API_KEY = os.environ.get('CLICKDROP_API_KEY', '')
 # Use Clipdrop official base URL; endpoints will append paths like /remove-text/v1
 CLICKDROP_API_URL = os.environ.get('CLICKDROP_API_URL', 'https://clipdrop-api.co')
+# Shared keep-alive connection pool used for ClickDrop requests
+CLICKDROP_POOL_CONNECTIONS = int(os.environ.get('CLICKDROP_POOL_CONNECTIONS', '4'))
+CLICKDROP_POOL_MAXSIZE = int(os.environ.get('CLICKDROP_POOL_MAXSIZE', '10'))
+CLICKDROP_MAX_CONCURRENCY_PER_HOST = int(os.environ.get('CLICKDROP_MAX_CONCURRENCY_PER_HOST', '4'))
+CLICKDROP_CONNECT_TIMEOUT = float(os.environ.get('CLICKDROP_CONNECT_TIMEOUT', '5'))
+CLICKDROP_READ_TIMEOUT = float(os.environ.get('CLICKDROP_READ_TIMEOUT', '60'))
+# Size budget for media/processed/ before least recently used results are evicted (0 = unlimited)
+PROCESSED_CACHE_MAX_BYTES = int(os.environ.get('PROCESSED_CACHE_MAX_BYTES', '0'))
+# Resized renditions: widths requests are snapped up to, encoder quality, and the
+# size budget for media/renditions/ before least recently served files are evicted
+RENDITION_WIDTHS = [int(width) for width in os.environ.get('RENDITION_WIDTHS', '160,320,640,1024,1920').split(',') if width.strip()]
+RENDITION_QUALITY = int(os.environ.get('RENDITION_QUALITY', '80'))
+RENDITION_CACHE_MAX_BYTES = int(os.environ.get('RENDITION_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
 
 # VQGAN Model Configuration
 VQGAN_MODEL_PATH = os.environ.get('VQGAN_MODEL_PATH', None)
 VQGAN_ENABLED = os.environ.get('VQGAN_ENABLED', 'True').lower() == 'true'
+# Tiled mode keeps full resolution by running overlapping 64x64 tiles;
+# when off, images are squashed to a single 64x64 input
+VQGAN_TILED = os.environ.get('VQGAN_TILED', 'True').lower() == 'true'
+VQGAN_TILE_OVERLAP = int(os.environ.get('VQGAN_TILE_OVERLAP', '16'))  # pixels shared by neighbouring tiles
+VQGAN_TILE_BATCH_SIZE = int(os.environ.get('VQGAN_TILE_BATCH_SIZE', '32'))  # tiles per forward pass
+# Batch compression: images per VQGAN forward batch and PIL worker processes (0 = one per CPU)
+COMPRESSION_BATCH_SIZE = int(os.environ.get('COMPRESSION_BATCH_SIZE', '8'))
+COMPRESSION_WORKERS = int(os.environ.get('COMPRESSION_WORKERS', '0'))
+# Formats tried by format=AUTO compression; the smallest output is kept
+COMPRESSION_AUTO_FORMATS = [name.strip().upper() for name in os.environ.get('COMPRESSION_AUTO_FORMATS', 'JPEG,WEBP,AVIF').split(',') if name.strip()]
+# Optional .npy of 1024 codebook index counts used as a shared rANS table for .vqz files
+VQZ_FREQUENCY_TABLE = os.environ.get('VQZ_FREQUENCY_TABLE', None)
+
+# Models are loaded on first use. List model names ('blip', 'vqgan' or 'all')
+# to start loading them in the background when the server boots instead.
+MODEL_WARMUP = [name.strip() for name in os.environ.get('MODEL_WARMUP', '').split(',') if name.strip()]
+
+# Background job queue (text removal runs outside the request thread)
+# 'sqlite' persists jobs in JOB_QUEUE_PATH, 'memory' keeps them in-process (tests)
+JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'sqlite')
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', str(BASE_DIR / 'jobs.sqlite3'))
+JOB_QUEUE_CONCURRENCY = int(os.environ.get('JOB_QUEUE_CONCURRENCY', '2'))
+JOB_QUEUE_MAX_RETRIES = int(os.environ.get('JOB_QUEUE_MAX_RETRIES', '3'))
+JOB_QUEUE_RETRY_BACKOFF = float(os.environ.get('JOB_QUEUE_RETRY_BACKOFF', '2.0'))  # seconds, doubled per attempt
+JOB_QUEUE_AUTOSTART = os.environ.get('JOB_QUEUE_AUTOSTART', 'True').lower() == 'true'
+# Seconds a running job stays leased to its process without a heartbeat before
+# another process requeues it; heartbeats run every third of this
+JOB_QUEUE_LEASE = float(os.environ.get('JOB_QUEUE_LEASE', '60'))
+
+# Threads used by async views for PIL/torch work (captioning, compression)
+INFERENCE_MAX_WORKERS = int(os.environ.get('INFERENCE_MAX_WORKERS', '2'))
+
+# BLIP CPU inference: 'fp32', 'int8' (dynamic quantization of linear layers)
+# or 'traced' (TorchScript vision encoder). 0 threads keeps torch's default.
+CAPTION_BACKEND = os.environ.get('CAPTION_BACKEND', 'fp32')
+CAPTION_NUM_THREADS = int(os.environ.get('CAPTION_NUM_THREADS', '0'))
+
+# Caption requests arriving together are run as one BLIP batch
+CAPTION_MAX_BATCH_SIZE = int(os.environ.get('CAPTION_MAX_BATCH_SIZE', '8'))
+CAPTION_MAX_WAIT_MS = float(os.environ.get('CAPTION_MAX_WAIT_MS', '10'))
+
+# Caption cache keyed by perceptual hash (dHash); images within
+# CAPTION_CACHE_MAX_DISTANCE differing bits share a caption
+CAPTION_CACHE_ENABLED = os.environ.get('CAPTION_CACHE_ENABLED', 'True').lower() == 'true'
+CAPTION_CACHE_MAX_DISTANCE = int(os.environ.get('CAPTION_CACHE_MAX_DISTANCE', '3'))
+CAPTION_CACHE_TTL = int(os.environ.get('CAPTION_CACHE_TTL', '86400'))  # seconds
+CAPTION_CACHE_MAX_ENTRIES = int(os.environ.get('CAPTION_CACHE_MAX_ENTRIES', '1024'))  # memory tier
+CAPTION_CACHE_PATH = os.environ.get('CAPTION_CACHE_PATH', str(BASE_DIR / 'caption_cache.sqlite3'))  # '' disables the disk tier
+CAPTION_CACHE_DISK_MAX_ENTRIES = int(os.environ.get('CAPTION_CACHE_DISK_MAX_ENTRIES', '100000'))
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
@@ -99,12 +162,10 @@ WSGI_APPLICATION = 'Backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite (tuned with WAL) or Postgres, chosen by DB_ENGINE; see Backend/database.py
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
 
@@ -147,6 +208,22 @@ STATIC_URL = 'static/'
 # Media files (User uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# How downloads and MEDIA_URL files are sent: '' streams them from Python,
+# 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect' (nginx) hands the file
+# to the front proxy. MEDIA_ACCEL_PREFIX is the internal nginx location that
+# aliases MEDIA_ROOT.
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '').lower()
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Uploads are streamed to disk and checked as they arrive (Image/upload_handlers.py):
+# larger files and types not sniffed as one of these are refused
+MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', str(5 * 1024 * 1024)))  # bytes
+ALLOWED_IMAGE_TYPES = [name.strip() for name in os.environ.get('ALLOWED_IMAGE_TYPES', 'image/jpeg,image/png,image/gif,image/webp').split(',') if name.strip()]
+# Bulk uploads (/image/upload-batch/): images per batch, counting archive
+# members, and the largest zip/tar accepted. Django's own file-count limit
+# is raised to match.
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', '500'))
+MAX_ARCHIVE_SIZE = int(os.environ.get('MAX_ARCHIVE_SIZE', str(512 * 1024 * 1024)))  # bytes
+DATA_UPLOAD_MAX_NUMBER_FILES = MAX_BATCH_FILES
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,6 +1,22 @@
+import threading
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ImageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Image'
+
+    def ready(self):
+        # Models load lazily on first use; MODEL_WARMUP lets server
+        # processes start loading them in the background at boot instead
+        names = getattr(settings, 'MODEL_WARMUP', [])
+        if names:
+            from .model_registry import registry
+            warm_names = None if 'all' in names else names
+            threading.Thread(
+                target=registry.warm_up,
+                args=(warm_names,),
+                name='model-warmup',
+                daemon=True,
+            ).start()
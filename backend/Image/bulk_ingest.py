@@ -0,0 +1,164 @@
+import logging
+import os
+import tarfile
+import uuid
+import zipfile
+import zlib
+from django.conf import settings
+from .job_queue import job_queue, QUEUED, RUNNING
+from .models import Image
+from .upload_handlers import ARCHIVE_TYPES, spool_image
+
+logger = logging.getLogger(__name__)
+
+# Errors a truncated or corrupt zip/tar (or its compression) can raise mid-read
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, OSError)
+
+
+def _archive_members(upload):
+    """(path, open stream) for every regular file in a zip or tar upload"""
+    if upload.content_type == 'application/zip':
+        with zipfile.ZipFile(upload) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as stream:
+                        yield info.filename, stream
+    else:
+        # Read front to back in one pass; gzip, bz2 and xz tars are unpacked on the fly
+        with tarfile.open(fileobj=upload, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+
+
+def collect_images(files, max_files=None):
+    """
+    The images in a bulk upload: uploaded images as they are, plus every
+    image inside zip and tar uploads, spooled to temporary files with the
+    same type and size checks as a single upload.
+    Returns: (images, rejected) where each rejected item is {'name', 'status', 'error'}
+    """
+    max_files = max_files if max_files is not None else getattr(settings, 'MAX_BATCH_FILES', 500)
+    images, rejected = [], []
+
+    def add(file):
+        if len(images) >= max_files:
+            file.close()
+            rejected.append({'name': file.name, 'status': 413, 'error': f'A batch holds at most {max_files} images'})
+        else:
+            images.append(file)
+
+    for upload in files:
+        if upload.content_type not in ARCHIVE_TYPES:
+            add(upload)
+            continue
+        try:
+            for path, stream in _archive_members(upload):
+                name = os.path.basename(path)
+                # Skip folders' metadata such as macOS resource forks and .DS_Store
+                if not name or name.startswith('.') or '__MACOSX/' in path:
+                    continue
+                file, error = spool_image(stream, name)
+                if error:
+                    rejected.append({'name': path, 'status': error[0], 'error': error[1]})
+                else:
+                    add(file)
+        except ARCHIVE_ERRORS as e:
+            rejected.append({'name': upload.name, 'status': 400, 'error': f'Could not read archive: {e}'})
+        finally:
+            upload.close()
+    return images, rejected
+
+
+def ingest_batch(files, created_by, date, time, max_files=None):
+    """
+    Store a bulk upload as one batch: the images are moved into storage,
+    inserted with a single bulk_create, and their text removal jobs queued
+    in a single broker write.
+    Returns: dict with 'batch_id', the created 'images' and the 'rejected' files
+    """
+    batch_id = uuid.uuid4().hex
+    uploads, rejected = collect_images(files, max_files)
+
+    instances = []
+    try:
+        for upload in uploads:
+            # Job ids are reserved up front so the worker never sees a row without one
+            instance = Image(
+                created_by=created_by,
+                date=date,
+                time=time,
+                content_hash=upload.content_hash,
+                batch_id=batch_id,
+                text_removal_job_id=job_queue.new_job_id(),
+            )
+            # Renames the temporary file into storage now, so the INSERT carries only names
+            instance.image.save(upload.name, upload, save=False)
+            instances.append(instance)
+        Image.objects.bulk_create(instances)
+    except Exception:
+        for instance in instances:
+            instance.image.delete(save=False)
+        raise
+    finally:
+        for upload in uploads:
+            upload.close()
+
+    if instances and instances[0].pk is None:
+        # Databases that can't return ids from a bulk INSERT
+        ids = dict(Image.objects.filter(batch_id=batch_id).values_list('text_removal_job_id', 'id'))
+        for instance in instances:
+            instance.pk = ids[instance.text_removal_job_id]
+
+    job_queue.enqueue_many('remove_text', [(instance.text_removal_job_id, {'image_id': instance.pk}) for instance in instances])
+    logger.info(f"Batch {batch_id}: {len(instances)} image(s) queued, {len(rejected)} rejected")
+    return {'batch_id': batch_id, 'images': instances, 'rejected': rejected}
+
+
+def batch_progress(batch_id):
+    """
+    Text removal progress of every image in a batch, read with one query
+    and one job queue lookup. Returns None for an unknown batch.
+    """
+    rows = list(
+        Image.objects.filter(batch_id=batch_id).order_by('id')
+        .values('id', 'image', 'text_removal_status', 'text_removed', 'text_removal_job_id')
+    )
+    if not rows:
+        return None
+
+    jobs = job_queue.get_jobs(row['text_removal_job_id'] for row in rows)
+    storage = Image._meta.get_field('image').storage
+    counts = {'pending': 0, 'processing': 0, 'completed': 0, 'failed': 0}
+    items = []
+    for row in rows:
+        job = jobs.get(row['text_removal_job_id'])
+        # Queued or running jobs (including retries) are in progress whatever the row says
+        status = row['text_removal_status']
+        if job and job['state'] == QUEUED:
+            status = 'pending'
+        elif job and job['state'] == RUNNING:
+            status = 'processing'
+        counts[status] = counts.get(status, 0) + 1
+        items.append({
+            'id': row['id'],
+            'url': storage.url(row['image']),
+            'status': status,
+            'text_removed': row['text_removed'],
+            'job': {
+                'id': job['id'],
+                'state': job['state'],
+                'attempts': job['attempts'],
+                'error': job['error'],
+            } if job else None,
+        })
+
+    finished = counts['completed'] + counts['failed']
+    return {
+        'batch_id': batch_id,
+        'total': len(rows),
+        'counts': counts,
+        'progress': round(finished / len(rows), 4),
+        'done': finished == len(rows),
+        'items': items,
+    }
@@ -0,0 +1,208 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+from .metrics import get_counter
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BAND_BITS = 16
+BANDS = HASH_BITS // BAND_BITS
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: survives re-encoding, resizing and small edits"""
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class CaptionCache:
+    """Two-tier caption cache keyed by perceptual hash.
+
+    Lookups match any cached hash within ``max_distance`` bits (Hamming
+    distance), so a re-encoded or resized copy of an image reuses the
+    caption. The memory tier is an LRU of ``max_entries``; the optional
+    disk tier is a SQLite file holding up to ``disk_max_entries``, evicted
+    least recently used first. Entries older than ``ttl`` seconds expire.
+    The disk tier is pruned of expired and excess rows on the first write
+    and then every ``prune_every`` writes, so between prunes it may hold up
+    to that many rows over its limit; lookups skip expired rows regardless.
+    """
+
+    def __init__(self, max_distance=3, ttl=86400, max_entries=1024, path=None, disk_max_entries=100000, prune_every=256):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = str(path) if path else None
+        self.disk_max_entries = disk_max_entries
+        self.prune_every = prune_every
+        self._disk_writes = 0
+        self.stats = get_counter('caption_cache')
+        self.disk_stats = get_counter('caption_cache_disk')
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.path:
+            self._init_disk()
+
+    # -- memory tier --
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            candidates = [key] if key in self._memory else sorted(
+                (cached for cached in self._memory if hamming(cached, key) <= self.max_distance),
+                key=lambda cached: hamming(cached, key),
+            )
+            for cached in candidates:
+                caption, expires_at = self._memory[cached]
+                if expires_at <= now:
+                    del self._memory[cached]
+                    continue
+                self._memory.move_to_end(cached)
+                return caption
+        return None
+
+    def _memory_set(self, key, caption, now):
+        with self._lock:
+            self._memory[key] = (caption, now + self.ttl)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # -- disk tier --
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_disk(self):
+        conn = self._connect()
+        band_columns = ', '.join(f'band{i} INTEGER NOT NULL' for i in range(BANDS))
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS captions (
+                phash INTEGER PRIMARY KEY,
+                caption TEXT NOT NULL,
+                {band_columns},
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        for i in range(BANDS):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS captions_band{i} ON captions (band{i})')
+        conn.execute('CREATE INDEX IF NOT EXISTS captions_last_used ON captions (last_used)')
+
+    def _disk_get(self, key, now):
+        conn = self._connect()
+        fresh_after = now - self.ttl
+        if self.max_distance < BANDS:
+            # Pigeonhole: hashes within fewer than BANDS bits of each other
+            # share at least one whole band, so only those rows are checked
+            where = ' OR '.join(f'band{i} = ?' for i in range(BANDS))
+            rows = conn.execute(
+                f'SELECT phash, caption FROM captions WHERE created_at > ? AND ({where})',
+                (fresh_after, *_bands(key)),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT phash, caption FROM captions WHERE created_at > ?', (fresh_after,)
+            ).fetchall()
+
+        best = None
+        for phash, caption in rows:
+            distance = hamming(_to_unsigned(phash), key)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, phash, caption)
+        if best is None:
+            return None
+
+        conn.execute('UPDATE captions SET last_used = ? WHERE phash = ?', (now, best[1]))
+        return best[2]
+
+    def _disk_set(self, key, caption, now):
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO captions (phash, caption, {', '.join(f'band{i}' for i in range(BANDS))}, "
+            f"created_at, last_used) VALUES (?, ?, {', '.join('?' for _ in range(BANDS))}, ?, ?)",
+            (_to_signed(key), caption, *_bands(key), now, now),
+        )
+        with self._lock:
+            prune = self._disk_writes % self.prune_every == 0
+            self._disk_writes += 1
+        if prune:
+            self._disk_prune(now)
+
+    def _disk_prune(self, now):
+        # Sorts the whole table, so it runs every prune_every writes, not per write
+        conn = self._connect()
+        conn.execute('DELETE FROM captions WHERE created_at <= ?', (now - self.ttl,))
+        conn.execute(
+            'DELETE FROM captions WHERE phash IN ('
+            'SELECT phash FROM captions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.disk_max_entries,),
+        )
+
+    # -- public API --
+
+    def get(self, key):
+        """Return the cached caption for a perceptual hash, or None"""
+        now = time.time()
+        caption = self._memory_get(key, now)
+        if caption is None and self.path:
+            try:
+                caption = self._disk_get(key, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Caption cache disk lookup failed: {e}")
+            if caption is None:
+                self.disk_stats.miss()
+            else:
+                self.disk_stats.hit()
+                self._memory_set(key, caption, now)
+
+        if caption is None:
+            self.stats.miss()
+        else:
+            self.stats.hit()
+        return caption
+
+    def set(self, key, caption):
+        now = time.time()
+        self._memory_set(key, caption, now)
+        if self.path:
+            try:
+                self._disk_set(key, caption, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Caption cache disk write failed: {e}")
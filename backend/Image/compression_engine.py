@@ -0,0 +1,239 @@
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PIL import Image
+from .encoders import AUTO, AUTO_FORMATS, get_encoder, usable_formats
+from .imaging import flatten, has_alpha, reduce_on_load
+from .quality import MAX_PSNR, search_quality
+
+logger = logging.getLogger(__name__)
+
+
+def encode_candidate(encoder, img, quality, target=None):
+    """Encode ``img`` with one encoder, searching its quality when there is a ``target``"""
+    start = time.perf_counter()
+    measured = {}
+    if target and encoder.lossy:
+        measured = search_quality(img, encoder.encode, **target)
+        data = measured.pop('data')
+        quality = measured.pop('quality')
+    else:
+        data = encoder.encode(img, quality)
+        if not encoder.lossy:
+            quality = None
+            if target:
+                # Lossless output is identical to its input; only a byte budget can be missed
+                measured = {
+                    'ssim': 1.0,
+                    'psnr': MAX_PSNR,
+                    'target_met': len(data) <= target.get('max_bytes', len(data)),
+                    'encodes': 1,
+                }
+    return {
+        'format': encoder.format,
+        'data': data,
+        'quality': quality,
+        **measured,
+        'ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def pick_candidate(candidates, target=None):
+    """
+    The smallest output among candidates that met the target (all of them
+    when none did). Under a byte budget, where every candidate lands near
+    the budget, the best SSIM wins instead.
+    """
+    met = [c for c in candidates if c.get('target_met', True)] or candidates
+    if target and 'max_bytes' in target:
+        return max(met, key=lambda c: (c['ssim'], -len(c['data'])))
+    return min(met, key=lambda c: len(c['data']))
+
+
+def encode_image(fp, original_size, max_width, max_height, quality, format='JPEG', target=None, auto_formats=AUTO_FORMATS):
+    """
+    PIL compression of one image: LANCZOS thumbnail to fit max_width x
+    max_height, then encode with the ``format`` encoder (see encoders.py).
+    Alpha is kept for formats that support it and flattened onto white for
+    the rest. With format 'AUTO' every available ``auto_formats`` encoder
+    runs in parallel threads and the smallest output wins. With a ``target``
+    (max_bytes, min_ssim or min_psnr) each encoder's quality is searched
+    for instead of using ``quality``.
+    Returns: dict with compression results, output in 'compressed_bytes' and
+    per-format size and time in 'stats'
+    """
+    try:
+        format = str(format).upper()
+        encoders = [get_encoder(name) for name in (usable_formats(auto_formats) if format == AUTO else [format])]
+
+        # Open the image, decoding oversized ones at a reduced scale
+        with Image.open(fp) as source, reduce_on_load(source, (max_width, max_height)) as img:
+            img = img.convert('RGBA' if has_alpha(img) else 'RGB')
+
+            # Resize if too large
+            if img.width > max_width or img.height > max_height:
+                img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+
+            # An alpha channel that is fully opaque carries nothing worth keeping
+            if img.mode == 'RGBA' and img.getchannel('A').getextrema() == (255, 255):
+                img = img.convert('RGB')
+            flat = flatten(img) if img.mode == 'RGBA' and not all(e.alpha for e in encoders) else img
+
+            # Encode into memory; the caller decides where it is stored.
+            # PIL releases the GIL while encoding, so candidates run in parallel
+            jobs = [(encoder, img if encoder.alpha else flat, quality, target) for encoder in encoders]
+            if len(jobs) > 1:
+                with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+                    candidates = list(pool.map(lambda job: encode_candidate(*job), jobs))
+            else:
+                candidates = [encode_candidate(*jobs[0])]
+
+            best = pick_candidate(candidates, target)
+            compressed_bytes = best['data']
+            measured = {key: best[key] for key in ('ssim', 'psnr', 'target_met', 'encodes') if key in best}
+            stats = {
+                'format': best['format'],
+                'candidates': {
+                    c['format']: {'size': len(c['data']), **{k: v for k, v in c.items() if k not in ('format', 'data')}}
+                    for c in candidates
+                },
+            }
+
+            # Get compressed size
+            compressed_size = len(compressed_bytes)
+            compression_ratio = compressed_size / original_size if original_size > 0 else 0
+
+            return {
+                'success': True,
+                'original_size': original_size,
+                'compressed_size': compressed_size,
+                'compression_ratio': compression_ratio,
+                'compressed_bytes': compressed_bytes,
+                'format': best['format'],
+                'quality': best['quality'],
+                **measured,
+                'stats': stats,
+                'method': 'PIL',
+                'message': f'PIL compressed from {original_size} to {compressed_size} bytes as {best["format"]} ({compression_ratio:.2%} of original)'
+            }
+
+    except Exception as e:
+        logger.error(f"Compression error: {e}")
+        return {
+            'success': False,
+            'error': str(e),
+            'method': 'PIL',
+            'message': f'Compression failed: {str(e)}'
+        }
+
+
+def _attach(name):
+    """Open a shared memory block created by the parent, which stays its owner"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Workers share the parent's resource tracker, where the block is already
+    # registered, and the parent's unlink() unregisters it
+    return shared_memory.SharedMemory(name=name)
+
+
+def _encode_shared(name, size, max_width, max_height, quality, format, target, auto_formats):
+    """Worker entry point: compress ``size`` bytes read from a shared memory block"""
+    block = _attach(name)
+    try:
+        view = block.buf[:size]
+        try:
+            data = io.BytesIO(view)
+        finally:
+            view.release()
+    finally:
+        block.close()
+    return encode_image(data, size, max_width, max_height, quality, format, target, auto_formats)
+
+
+class CompressionEngine:
+    """
+    PIL compression on a pool of worker processes.
+
+    Image bytes are copied once into a shared memory block that the worker
+    maps by name, instead of being pickled through the pool's pipe. Workers
+    are spawned rather than forked because the server runs worker threads.
+    """
+
+    def __init__(self, workers=None, max_width=1920, max_height=1080, quality=85, auto_formats=AUTO_FORMATS):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        # AUTO only tries the formats this Pillow build can write
+        self.auto_formats = usable_formats(auto_formats)
+        if len(self.auto_formats) < len(auto_formats):
+            logger.warning(
+                f"AUTO compression formats {', '.join(auto_formats)} include some this Pillow build can't write; "
+                f"using {', '.join(self.auto_formats)}"
+            )
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+        return self._executor
+
+    def submit_bytes(self, data, format='JPEG', target=None):
+        """Queue ``data`` for compression; returns a Future of the result dict"""
+        block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        block.buf[:len(data)] = data
+        try:
+            future = self._submit(block.name, len(data), format, target)
+        except Exception:
+            block.close()
+            block.unlink()
+            raise
+
+        def release(_):
+            block.close()
+            block.unlink()
+
+        future.add_done_callback(release)
+        return future
+
+    def _submit(self, name, size, format, target):
+        args = (_encode_shared, name, size, self.max_width, self.max_height, self.quality, format, target, self.auto_formats)
+        try:
+            return self.executor.submit(*args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); start a fresh pool once
+            logger.warning("Compression process pool broken, restarting it")
+            with self._lock:
+                self._executor = None
+            return self.executor.submit(*args)
+
+    def submit_file(self, image_path, format='JPEG', target=None):
+        with open(image_path, 'rb') as f:
+            return self.submit_bytes(f.read(), format, target)
+
+    def compress_bytes(self, data, format='JPEG', target=None):
+        return self.submit_bytes(data, format, target).result()
+
+    def compress_file(self, image_path, format='JPEG', target=None):
+        return self.submit_file(image_path, format, target).result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
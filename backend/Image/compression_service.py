@@ -1,40 +1,122 @@
-import os
+import hashlib
 import logging
+from asgiref.sync import sync_to_async
+from concurrent.futures import FIRST_COMPLETED, wait
 from django.conf import settings
-from PIL import Image
-import io
-from .vqgan_model import vqgan_service
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import QuerySet
+from .compression_engine import CompressionEngine
+from .encoders import AUTO, AUTO_FORMATS, available_formats, get_encoder
+from .executors import run_blocking
+from .model_registry import registry
 
 logger = logging.getLogger(__name__)
 
+def load_vqgan():
+    """Load the VQGAN checkpoint; returns None when it is unavailable"""
+    model_path = getattr(settings, 'VQGAN_MODEL_PATH', None)
+    if not getattr(settings, 'VQGAN_ENABLED', True) or not model_path:
+        logger.info("VQGAN model path not configured, using PIL compression")
+        return None
+
+    # Imported here so torch is only loaded once VQGAN is actually needed
+    from .vqgan_model import VQGANCompressionService
+    from .vqz import load_frequency_table
+    table_path = getattr(settings, 'VQZ_FREQUENCY_TABLE', None)
+    vqgan_service = VQGANCompressionService(
+        tiled=getattr(settings, 'VQGAN_TILED', True),
+        tile_overlap=getattr(settings, 'VQGAN_TILE_OVERLAP', 16),
+        tile_batch_size=getattr(settings, 'VQGAN_TILE_BATCH_SIZE', 32),
+        frequency_table=load_frequency_table(table_path, 1024) if table_path else None,
+    )
+    if vqgan_service.load_model(model_path):
+        logger.info("VQGAN model loaded successfully")
+        return vqgan_service
+
+    logger.warning("Failed to load VQGAN model, falling back to PIL compression")
+    return None
+
 class ImageCompressionService:
+    # Image fields written by apply_result()
+    RESULT_FIELDS = [
+        'compression_processed', 'compression_status', 'compression_error',
+        'compressed_image', 'compressed_codes', 'original_size',
+        'compressed_size', 'compression_ratio', 'compression_quality',
+        'compression_ssim', 'compression_psnr', 'compression_stats',
+        'compressed_hash', 'codes_hash',
+    ]
+    # Request parameters naming a quality search target
+    TARGETS = {'target_bytes': ('max_bytes', int), 'min_ssim': ('min_ssim', float), 'min_psnr': ('min_psnr', float)}
+    
     def __init__(self):
         self.max_width = 1920
         self.max_height = 1080
         self.quality = 85
-        self.supported_formats = ['JPEG', 'PNG', 'WEBP']
+        self.batch_size = getattr(settings, 'COMPRESSION_BATCH_SIZE', 8)
+        # PIL work runs in worker processes; the pool starts on first use
+        self.engine = CompressionEngine(
+            workers=getattr(settings, 'COMPRESSION_WORKERS', 0),
+            max_width=self.max_width,
+            max_height=self.max_height,
+            quality=self.quality,
+            auto_formats=getattr(settings, 'COMPRESSION_AUTO_FORMATS', AUTO_FORMATS),
+        )
+        # Encoders whose codec is compiled into this Pillow build
+        self.supported_formats = available_formats()
         self.use_vqgan = True  # Enable VQGAN by default
         self.vqgan_model_path = getattr(settings, 'VQGAN_MODEL_PATH', None)
         
-        # Try to load VQGAN model
-        if self.use_vqgan and self.vqgan_model_path:
-            if vqgan_service.load_model(self.vqgan_model_path):
-                logger.info("VQGAN model loaded successfully")
-            else:
-                logger.warning("Failed to load VQGAN model, falling back to PIL compression")
-                self.use_vqgan = False
-        else:
-            logger.info("VQGAN model path not configured, using PIL compression")
+        # The VQGAN checkpoint is loaded by the model registry on first use
+        if not self.vqgan_model_path:
             self.use_vqgan = False
     
-    def compress_image(self, image_path, output_path=None):
+    @property
+    def vqgan(self):
+        """The loaded VQGAN service, or None if compression should use PIL"""
+        if not self.use_vqgan:
+            return None
+        return registry.get('vqgan')
+    
+    def parse_options(self, data):
         """
-        Compress an image using VQGAN (if available) or PIL fallback
-        Returns: dict with compression results
+        Read compression options from request data: 'format' (one of
+        supported_formats, or AUTO for the smallest of several) and at most
+        one target of 'target_bytes', 'min_ssim' or 'min_psnr'.
+        Returns: (format, target dict or None); raises ValueError when invalid
+        """
+        format = str(data.get('format') or 'JPEG').upper()
+        if format != AUTO:
+            try:
+                format = get_encoder(format).format
+            except ValueError:
+                raise ValueError(f"Unsupported format '{format}', use one of {', '.join(self.supported_formats + [AUTO])}")
+        
+        target = {}
+        for param, (name, cast) in self.TARGETS.items():
+            if data.get(param) not in (None, ''):
+                try:
+                    target[name] = cast(data[param])
+                except (TypeError, ValueError):
+                    raise ValueError(f"'{param}' must be a number")
+                if target[name] <= 0:
+                    raise ValueError(f"'{param}' must be positive")
+        if len(target) > 1:
+            raise ValueError(f"Give only one of {', '.join(self.TARGETS)}")
+        return format, target or None
+    
+    def compress_image(self, image_path, format='JPEG', target=None):
+        """
+        Compress an image using VQGAN (if available) or PIL fallback.
+        A quality search ``target`` (see parse_options) always uses PIL, as
+        VQGAN has no quality setting to search.
+        Returns: dict with compression results; the encoded output is
+        returned in memory as 'compressed_bytes'
         """
         # Try VQGAN compression first
-        if self.use_vqgan:
-            vqgan_result = vqgan_service.compress_image(image_path, output_path)
+        vqgan_service = None if target else self.vqgan
+        if vqgan_service:
+            vqgan_result = vqgan_service.compress_image(image_path)
             if vqgan_result['success']:
                 vqgan_result['method'] = 'VQGAN'
                 return vqgan_result
@@ -43,68 +125,162 @@ class ImageCompressionService:
         
         # Fallback to PIL compression
         try:
-            # Open the image
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary (for JPEG output)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # Create a white background
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Get original size
-                original_size = os.path.getsize(image_path)
-                
-                # Resize if too large
-                if img.width > self.max_width or img.height > self.max_height:
-                    img.thumbnail((self.max_width, self.max_height), Image.Resampling.LANCZOS)
-                
-                # Determine output format
-                if output_path is None:
-                    output_path = image_path.replace('.', '_compressed.')
-                
-                # Save with compression
-                img.save(
-                    output_path,
-                    'JPEG',
-                    quality=self.quality,
-                    optimize=True,
-                    progressive=True
-                )
-                
-                # Get compressed size
-                compressed_size = os.path.getsize(output_path)
-                compression_ratio = compressed_size / original_size if original_size > 0 else 0
-                
-                return {
-                    'success': True,
-                    'original_size': original_size,
-                    'compressed_size': compressed_size,
-                    'compression_ratio': compression_ratio,
-                    'output_path': output_path,
-                    'method': 'PIL',
-                    'message': f'PIL compressed from {original_size} to {compressed_size} bytes ({compression_ratio:.2%} of original)'
-                }
-                
+            return self.engine.compress_file(image_path, format, target)
         except Exception as e:
-            logger.error(f"Compression error: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'method': 'PIL',
-                'message': f'Compression failed: {str(e)}'
-            }
+            return self._engine_error(e)
+    
+    def compress_many(self, image_paths, format='JPEG', target=None):
+        """
+        Compress many files; yields (position, result) pairs as each one finishes.
+        VQGAN runs batch_size images per batched forward pass; PIL work is
+        spread over the compression engine's worker processes.
+        """
+        pending = list(enumerate(image_paths))
+        
+        vqgan_service = None if target else self.vqgan
+        if vqgan_service:
+            fallback = []
+            for start in range(0, len(pending), self.batch_size):
+                group = pending[start:start + self.batch_size]
+                results = vqgan_service.compress_images([path for _, path in group])
+                for (position, path), result in zip(group, results):
+                    if result['success']:
+                        result['method'] = 'VQGAN'
+                        yield position, result
+                    else:
+                        logger.warning(f"VQGAN compression failed for {path}: {result['error']}, falling back to PIL")
+                        fallback.append((position, path))
+            pending = fallback
+        
+        # Keep a bounded number of files in flight so results are not held in memory
+        window = self.engine.workers * 2
+        queue = iter(pending)
+        in_flight = {}
+        while True:
+            for position, path in queue:
+                try:
+                    future = self.engine.submit_file(path, format, target)
+                except Exception as e:
+                    yield position, self._engine_error(e)
+                    continue
+                in_flight[future] = position
+                if len(in_flight) >= window:
+                    break
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = in_flight.pop(future)
+                try:
+                    yield position, future.result()
+                except Exception as e:
+                    yield position, self._engine_error(e)
+    
+    def apply_result(self, image, result):
+        """
+        Copy a compression result onto an Image and write its files to storage.
+        The row itself is not saved; see RESULT_FIELDS.
+        """
+        if not result['success']:
+            image.compression_status = 'failed'
+            image.compression_error = result['error']
+            return
+        
+        filename = image.image.name.split('/')[-1]
+        compressed_name = f"compressed_{filename}"
+        if result.get('method') == 'PIL':
+            compressed_name = f"compressed_{filename.rsplit('.', 1)[0]}.{get_encoder(result['format']).extension}"
+        image.compressed_image.save(compressed_name, ContentFile(result['compressed_bytes']), save=False)
+        image.compressed_hash = hashlib.sha256(result['compressed_bytes']).hexdigest()
+        if result.get('codes_bytes'):
+            # VQGAN output: the .vqz is the compressed artifact, the image a preview of it
+            image.compressed_codes.save(
+                f"{filename.rsplit('.', 1)[0]}.vqz", ContentFile(result['codes_bytes']), save=False
+            )
+            image.codes_hash = hashlib.sha256(result['codes_bytes']).hexdigest()
+        else:
+            image.compressed_codes = None
+            image.codes_hash = None
+        
+        image.compression_processed = True
+        image.compression_status = 'completed'
+        image.original_size = result['original_size']
+        image.compressed_size = result['compressed_size']
+        image.compression_ratio = result['compression_ratio']
+        image.compression_quality = result.get('quality')
+        image.compression_ssim = result.get('ssim')
+        image.compression_psnr = result.get('psnr')
+        image.compression_stats = result.get('stats')
+        image.compression_error = None
+    
+    def summarize(self, image, result):
+        """Per-image JSON payload reported by the batch endpoint"""
+        if not result['success']:
+            return {'id': image.id, 'success': False, 'error': result['error']}
+        return {
+            'id': image.id,
+            'success': True,
+            'method': result.get('method'),
+            'original_size': result['original_size'],
+            'compressed_size': result['compressed_size'],
+            'compression_ratio': result['compression_ratio'],
+            'quality': result.get('quality'),
+            'ssim': result.get('ssim'),
+            'psnr': result.get('psnr'),
+            'target_met': result.get('target_met'),
+            'format': result.get('format'),
+            'stats': result.get('stats'),
+            'compressed_url': image.compressed_image.url if image.compressed_image else None,
+            'codes_url': image.compressed_codes.url if image.compressed_codes else None,
+        }
+    
+    def load_batch(self, images):
+        """
+        Resolve a queryset or list of Image ids into the rows to compress.
+        Returns (images, summaries for rows that can't be compressed)
+        """
+        from .models import Image as ImageModel
+        
+        errors = []
+        if isinstance(images, QuerySet):
+            found = list(images)
+        else:
+            ids = list(images)
+            found = list(ImageModel.objects.filter(id__in=ids))
+            for missing in sorted(set(ids) - {image.id for image in found}):
+                errors.append({'id': missing, 'success': False, 'error': 'Image not found'})
+        
+        todo = []
+        for image in found:
+            if image.image:
+                todo.append(image)
+            else:
+                errors.append({'id': image.id, 'success': False, 'error': 'No image to compress'})
+        return todo, errors
+    
+    def batch(self, images, format='JPEG', target=None):
+        """A CompressionBatch over a queryset or list of Image ids"""
+        return CompressionBatch(self, images, format, target)
+    
+    def compress_queryset(self, images, format='JPEG', target=None):
+        """
+        Compress a queryset or list of Image ids, yielding one summary dict per
+        image as it finishes. Results are saved and unfinished rows released
+        when the batch ends, including when the caller stops iterating early.
+        """
+        batch = self.batch(images, format, target)
+        try:
+            yield from batch
+        finally:
+            batch.close()
     
     def compress_image_bytes(self, image_bytes, format='JPEG'):
         """
         Compress image from bytes using VQGAN (if available) or PIL fallback
         """
         # Try VQGAN compression first
-        if self.use_vqgan:
+        vqgan_service = self.vqgan
+        if vqgan_service:
             vqgan_result = vqgan_service.compress_image_bytes(image_bytes, format)
             if vqgan_result['success']:
                 vqgan_result['method'] = 'VQGAN'
@@ -114,48 +290,142 @@ class ImageCompressionService:
         
         # Fallback to PIL compression
         try:
-            # Open image from bytes
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize if too large
-            if img.width > self.max_width or img.height > self.max_height:
-                img.thumbnail((self.max_width, self.max_height), Image.Resampling.LANCZOS)
-            
-            # Compress to bytes
-            output = io.BytesIO()
-            img.save(
-                output,
-                format=format,
-                quality=self.quality,
-                optimize=True,
-                progressive=True
-            )
-            
-            return {
-                'success': True,
-                'compressed_bytes': output.getvalue(),
-                'original_size': len(image_bytes),
-                'compressed_size': len(output.getvalue()),
-                'method': 'PIL'
-            }
-            
+            return self.engine.compress_bytes(image_bytes, format)
         except Exception as e:
-            logger.error(f"Compression error: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'method': 'PIL'
-            }
+            return self._engine_error(e)
+    
+    def _engine_error(self, e):
+        """Result for a file that could not be read or handed to a worker"""
+        logger.error(f"Compression error: {e}")
+        return {
+            'success': False,
+            'error': str(e),
+            'method': 'PIL',
+            'message': f'Compression failed: {str(e)}'
+        }
+
+class CompressionBatch:
+    """
+    One batch compression run over Image rows.
+
+    Rows are marked processing a chunk at a time, just before the chunk is
+    submitted, and finished rows are saved with one bulk_update per chunk.
+    A row that is already processing is not claimed; it is reported as a
+    conflict, as the single-image endpoint answers 409.
+    close() saves what has finished and releases every claimed row that
+    never got a result (see Image.release), so a run that is stopped early
+    (a dropped stream, a crash) leaves no row stuck in processing.
+
+    Iterate with iter() from sync code or aiter() from async code; both
+    yield one summary dict per image and close the batch when they end.
+    """
+    
+    def __init__(self, service, images, format='JPEG', target=None):
+        self.service = service
+        self.images = images
+        self.format = format
+        self.target = target
+        # Large enough to keep VQGAN batches and the engine's window full
+        self.chunk_size = max(service.batch_size, service.engine.workers * 2)
+        self.todo = []
+        self.errors = []
+        self.claimed = set()  # ids of claimed rows without a result yet
+        self.finished = []  # rows with a result that is not saved yet
+        self.closed = False
+    
+    def load(self):
+        self.todo, self.errors = self.service.load_batch(self.images)
+        return self.errors
+    
+    def chunks(self):
+        for start in range(0, len(self.todo), self.chunk_size):
+            yield self.todo[start:start + self.chunk_size]
+    
+    def claim(self, chunk):
+        """
+        Mark a chunk's rows processing, each only from a STARTABLE status as
+        the single-image endpoint does. Returns (rows claimed, summaries for
+        rows another run is already processing)
+        """
+        from .models import STARTABLE, StatusConflict
+        
+        claimed, conflicts = [], []
+        with transaction.atomic():
+            for image in chunk:
+                try:
+                    image.transition('compression_status', 'processing', from_states=STARTABLE)
+                except StatusConflict:
+                    conflicts.append({'id': image.id, 'success': False, 'error': 'Compression already in progress'})
+                    continue
+                self.claimed.add(image.id)
+                claimed.append(image)
+        return claimed, conflicts
+    
+    def results(self, chunk):
+        """(image, result) pairs for a claimed chunk as each image finishes; blocking"""
+        for position, result in self.service.compress_many([image.image.path for image in chunk], self.format, self.target):
+            yield chunk[position], result
+    
+    def finish(self, image, result):
+        """Apply a result (writing its files) and return the image's summary"""
+        self.service.apply_result(image, result)
+        self.claimed.discard(image.id)
+        self.finished.append(image)
+        return self.service.summarize(image, result)
+    
+    def save(self):
+        """Write the finished rows with a single bulk_update"""
+        from .models import Image as ImageModel
+        
+        finished, self.finished = self.finished, []
+        if finished:
+            ImageModel.objects.bulk_update(finished, self.service.RESULT_FIELDS)
+    
+    def close(self):
+        """Save finished rows and release unfinished claims; safe to call more than once"""
+        from .models import Image as ImageModel
+        
+        if self.closed:
+            return
+        self.closed = True
+        self.save()
+        claimed, self.claimed = self.claimed, set()
+        if claimed:
+            released = ImageModel.release_many(claimed, 'compression_status', 'Compression was interrupted')
+            logger.warning(f"Compression batch stopped early, released {released} images")
+    
+    def __iter__(self):
+        try:
+            yield from self.load()
+            for chunk in self.chunks():
+                claimed, conflicts = self.claim(chunk)
+                yield from conflicts
+                for image, result in self.results(claimed):
+                    yield self.finish(image, result)
+                self.save()
+        finally:
+            self.close()
+    
+    async def __aiter__(self):
+        # Database work runs through sync_to_async; compression and file
+        # writes on the inference pool, one result at a time
+        try:
+            for error in await sync_to_async(self.load)():
+                yield error
+            for chunk in self.chunks():
+                claimed, conflicts = await sync_to_async(self.claim)(chunk)
+                for conflict in conflicts:
+                    yield conflict
+                results = self.results(claimed)
+                while True:
+                    item = await run_blocking(next, results, None)
+                    if item is None:
+                        break
+                    yield await run_blocking(self.finish, *item)
+                await sync_to_async(self.save)()
+        finally:
+            await sync_to_async(self.close)()
+
 
 # Create a singleton instance
 compression_service = ImageCompressionService()
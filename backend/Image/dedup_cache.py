@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+import threading
+from django.conf import settings
+from .metrics import get_counter
+from .models import Image
+
+logger = logging.getLogger(__name__)
+
+# Eviction frees space down to this share of the budget, so a full cache
+# rescans its directory once per tenth of the budget written, not per result
+EVICT_TO = 0.9
+
+
+def hash_file(field_file, chunk_size=64 * 1024):
+    """SHA-256 of a stored file, read in chunks"""
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks(chunk_size):
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+class ProcessedImageCache:
+    """Reuse text-removal results for uploads with identical content.
+
+    Results are keyed by the SHA-256 of the uploaded bytes, stored in the
+    indexed ``Image.content_hash`` column, so the cache survives restarts.
+    Processed files under ``MEDIA_ROOT/processed/`` are evicted least
+    recently used first once they exceed ``max_bytes`` (0 disables eviction).
+
+    The directory's size is scanned once and then kept as a running total
+    of recorded files; it is rescanned only when that total passes the
+    budget. Deduplicated rows share one processed file, so evicting it
+    resets every row that points at it to pending, to be processed again.
+    """
+
+    def __init__(self, max_bytes=0, directory='processed'):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.stats = get_counter('text_removal_dedup')
+        # Bytes under the directory; None until the first scan
+        self.size = None
+        self._lock = threading.Lock()
+
+    def hash_file(self, field_file, chunk_size=64 * 1024):
+        return hash_file(field_file, chunk_size)
+
+    def lookup(self, content_hash, exclude_id=None):
+        """Return the stored processed file name for ``content_hash``, if any"""
+        candidates = (
+            Image.objects
+            .filter(content_hash=content_hash, text_removed=True)
+            .exclude(processed_image='')
+            .exclude(processed_image__isnull=True)
+            .exclude(pk=exclude_id)
+            .order_by('-id')
+            .values_list('processed_image', flat=True)
+        )
+        for name in candidates[:5]:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if os.path.exists(path):
+                self.stats.hit()
+                self._touch(path)
+                return name
+
+        self.stats.miss()
+        return None
+
+    def record(self, name):
+        """Note a freshly stored processed file and enforce the size budget"""
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        self._touch(path)
+        if not self.max_bytes:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self._lock:
+            if self.size is not None:
+                self.size += size
+                if self.size <= self.max_bytes:
+                    return
+            self.evict(keep=path)
+
+    def _touch(self, path):
+        # The file's mtime doubles as its last-used time for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used processed files until back under budget,
+        resetting the rows that used them; returns the number of files removed
+        """
+        root = os.path.join(settings.MEDIA_ROOT, self.directory)
+        paths, self.size = evict_lru(root, self.max_bytes, keep=keep, low_water=int(self.max_bytes * EVICT_TO))
+        evicted = 0
+        for path in paths:
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            evicted += 1
+            # Rows that pointed at the file need processing again
+            Image.objects.filter(processed_image=name).update(
+                processed_image=None,
+                processed_hash=None,
+                text_removed=False,
+                text_removal_status='pending',
+            )
+            logger.info(f"Evicted cached processed image {name}")
+        return evicted
+
+
+def evict_lru(root, max_bytes, keep=None, low_water=None):
+    """
+    Once the files directly under ``root`` total more than ``max_bytes``
+    (0 means no budget), delete the least recently used (oldest mtime)
+    until they total at most ``low_water`` (default ``max_bytes``).
+    Returns the paths removed and the bytes left under ``root``.
+    """
+    if not max_bytes:
+        return [], None
+
+    keep = os.path.normpath(keep) if keep else None
+    entries = []
+    total = 0
+    for entry in os.scandir(root) if os.path.isdir(root) else ():
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return [], total
+
+    low_water = max_bytes if low_water is None else low_water
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= low_water:
+            break
+        if os.path.normpath(path) == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not evict {path}: {e}")
+            continue
+        total -= size
+        removed.append(path)
+    return removed, total
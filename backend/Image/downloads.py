@@ -0,0 +1,208 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+from .dedup_cache import hash_file
+from .models import Image
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Read size when Python streams a file itself; bounds memory per download
+CHUNK_SIZE = 256 * 1024
+# Cache lifetime for a download requested with ?v=<its content hash>
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def parse_range(header, size):
+    """
+    The inclusive (start, end) byte range a Range header asks for, or None
+    to send the whole file (no header, a malformed one, or several ranges).
+    Raises ValueError when the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the final ``last`` bytes
+        if int(last) == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Range starts past the end of the file')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class FileStream:
+    """
+    ``length`` bytes of an open file from ``start``, in CHUNK_SIZE reads.
+
+    Use iter() under WSGI and aiter() under ASGI. The async iterator does
+    each read in a worker thread, where Django would otherwise read a sync
+    iterator (including a plain FileResponse) into memory in full before
+    sending it.
+    """
+
+    def __init__(self, f, start=0, length=None):
+        self.f = f
+        self.start = start
+        self.remaining = os.fstat(f.fileno()).st_size - start if length is None else length
+
+    def _read(self):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.f.read(min(CHUNK_SIZE, self.remaining))
+        self.remaining -= len(chunk)
+        return chunk
+
+    def __iter__(self):
+        try:
+            self.f.seek(self.start)
+            while chunk := self._read():
+                yield chunk
+        finally:
+            self.f.close()
+
+    async def __aiter__(self):
+        read = sync_to_async(self._read, thread_sensitive=False)
+        try:
+            self.f.seek(self.start)
+            while chunk := await read():
+                yield chunk
+        finally:
+            self.f.close()
+
+
+def offload_header(path):
+    """(header, value) handing ``path`` to the front proxy per MEDIA_OFFLOAD, or None to stream it"""
+    mode = getattr(settings, 'MEDIA_OFFLOAD', '')
+    if mode == 'x-sendfile':
+        return 'X-Sendfile', os.path.abspath(path)
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        if relative.startswith(os.pardir):
+            return None
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/').rstrip('/')
+        return 'X-Accel-Redirect', f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+    return None
+
+
+def _stream(request, f, size, etag, content_type):
+    """200 or 206 response streaming ``f`` in-process, honouring Range and If-Range"""
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or (etag and if_range.strip() == etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            f.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None and not isinstance(request, ASGIRequest):
+        # The WSGI server's wsgi.file_wrapper can send this with sendfile()
+        response = FileResponse(f, content_type=content_type)
+        response.block_size = CHUNK_SIZE
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    stream = FileStream(f, start, end - start + 1)
+    response = StreamingHttpResponse(
+        aiter(stream) if isinstance(request, ASGIRequest) else iter(stream),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_path(request, f, etag=None, last_modified=None, content_type=None, as_attachment=False, immutable=False):
+    """
+    Response for an open file: 304 when the client's copy is current, a
+    MEDIA_OFFLOAD header for the front proxy to send the file, or the file
+    (or one byte range of it) streamed from Python. ``last_modified``
+    defaults to the file's mtime. ``immutable`` responses may be cached for
+    a year; the rest revalidate every time.
+    """
+    stat = os.fstat(f.fileno())
+    filename = os.path.basename(f.name)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    last_modified = stat.st_mtime if last_modified is None else last_modified
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    offload = None if response is not None else offload_header(f.name)
+    if response is not None or offload:
+        f.close()
+        if response is None:
+            # The proxy sends the body and handles Range itself
+            response = HttpResponse(content_type=content_type)
+            response[offload[0]] = offload[1]
+    else:
+        response = _stream(request, f, stat.st_size, etag, content_type)
+        if response.status_code == 416:
+            return response
+
+    if response.status_code != 304:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def stored_hash(image, field_name, hash_field):
+    """SHA-256 of one of the image's files, hashed and saved on first use for rows that predate the hash field"""
+    content_hash = getattr(image, hash_field)
+    if not content_hash:
+        content_hash = hash_file(getattr(image, field_name))
+        Image.objects.filter(pk=image.pk, **{field_name: getattr(image, field_name).name}).update(**{hash_field: content_hash})
+        setattr(image, hash_field, content_hash)
+    return content_hash
+
+
+def serve_file(request, field_file, content_hash, content_type=None):
+    """
+    Download response for a stored file whose strong ETag is its SHA-256,
+    so If-Range resumes only the same content. Requests that name the
+    current hash in ``?v=`` get an immutable response, as that URL can
+    never change content.
+    """
+    return serve_path(
+        request,
+        open(field_file.path, 'rb'),
+        etag=f'"{content_hash}"',
+        content_type=content_type,
+        as_attachment=True,
+        immutable=request.GET.get('v') == content_hash,
+    )
+
+
+def serve_media(request, path):
+    """MEDIA_URL files, served in-process or offloaded per MEDIA_OFFLOAD (replaces static())"""
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    try:
+        f = open(safe_join(settings.MEDIA_ROOT, path), 'rb')
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File not found')
+    return serve_path(request, f)
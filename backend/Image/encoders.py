@@ -0,0 +1,115 @@
+import io
+from PIL import features
+
+# Format name that encodes every AUTO_FORMATS candidate and keeps the smallest
+AUTO = 'AUTO'
+# PNG is left out by default: lossless output rarely wins on photos and is slow to optimize
+AUTO_FORMATS = ('JPEG', 'WEBP', 'AVIF')
+
+
+class Encoder:
+    """An output format: how to encode a prepared image and what it can carry"""
+    format = None
+    extension = None
+    content_type = None
+    alpha = False  # keeps an alpha channel instead of flattening onto white
+    lossy = True  # has a quality setting for the quality search to drive
+    feature = None  # PIL feature that must be compiled in
+
+    def available(self):
+        return self.feature is None or bool(features.check(self.feature))
+
+    def options(self, quality):
+        return {'quality': quality}
+
+    def encode(self, img, quality):
+        output = io.BytesIO()
+        img.save(output, format=self.format, **self.options(quality))
+        return output.getvalue()
+
+
+class JPEGEncoder(Encoder):
+    format = 'JPEG'
+    content_type = 'image/jpeg'
+    extension = 'jpg'
+
+    def options(self, quality):
+        return {'quality': quality, 'optimize': True, 'progressive': True}
+
+
+class WebPEncoder(Encoder):
+    format = 'WEBP'
+    content_type = 'image/webp'
+    extension = 'webp'
+    alpha = True
+    feature = 'webp'
+
+    def options(self, quality):
+        return {'quality': quality, 'method': 4}
+
+
+class AVIFEncoder(Encoder):
+    format = 'AVIF'
+    content_type = 'image/avif'
+    extension = 'avif'
+    alpha = True
+    feature = 'avif'
+
+    def options(self, quality):
+        return {'quality': quality, 'speed': 6}
+
+
+class PNGEncoder(Encoder):
+    format = 'PNG'
+    content_type = 'image/png'
+    extension = 'png'
+    alpha = True
+    lossy = False
+
+    def options(self, quality):
+        # Lossless: the quality setting does not apply
+        return {'optimize': True}
+
+
+ENCODERS = {}
+
+
+def register_encoder(encoder):
+    """Add an Encoder instance to the registry under its format name"""
+    ENCODERS[encoder.format] = encoder
+    return encoder
+
+
+for _encoder in (JPEGEncoder(), WebPEncoder(), AVIFEncoder(), PNGEncoder()):
+    register_encoder(_encoder)
+
+
+def available_formats():
+    return [name for name, encoder in ENCODERS.items() if encoder.available()]
+
+
+def get_encoder(format):
+    """Registered encoder for a format name (case-insensitive); raises ValueError"""
+    name = str(format).upper()
+    if name == 'JPG':
+        name = 'JPEG'
+    encoder = ENCODERS.get(name)
+    if encoder is None or not encoder.available():
+        raise ValueError(f"Unsupported format '{format}', use one of {', '.join(available_formats())}")
+    return encoder
+
+
+def usable_formats(formats):
+    """
+    The names in ``formats`` this Pillow build can encode, in order (AVIF
+    needs Pillow 11.3+). Raises ValueError when none of them is left.
+    """
+    usable = []
+    for name in formats:
+        try:
+            usable.append(get_encoder(name).format)
+        except ValueError:
+            continue
+    if not usable:
+        raise ValueError(f"None of the formats {', '.join(formats)} is supported, use one of {', '.join(available_formats())}")
+    return tuple(usable)
@@ -0,0 +1,28 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor():
+    """Bounded thread pool for CPU-heavy work (PIL, torch) called from async views"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'INFERENCE_MAX_WORKERS', 2),
+                    thread_name_prefix='inference',
+                )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run ``func`` on the inference pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_inference_executor(), functools.partial(func, *args, **kwargs))
+
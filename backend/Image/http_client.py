@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledHTTPClient:
+    """Shared keep-alive HTTP session with per-host concurrency limits.
+
+    One ``requests.Session`` is reused by every thread so TCP+TLS
+    connections to the same host are kept alive and recycled from a
+    connection pool instead of being opened for each request.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_per_host=8,
+                 connect_timeout=5.0, read_timeout=60.0):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_per_host = max_per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self._session = None
+        self._lock = threading.Lock()
+        self._host_limits = {}
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    @contextmanager
+    def _host_slot(self, url):
+        """Hold one of the host's concurrency slots for the duration of a request"""
+        if not self.max_per_host:
+            yield
+            return
+
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._host_limits.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_per_host)
+                self._host_limits[host] = semaphore
+        with semaphore:
+            yield
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._host_slot(url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class AsyncPooledHTTPClient:
+    """Keep-alive ``httpx.AsyncClient`` for async views.
+
+    httpx connection pools belong to the event loop that opened them, so
+    one client is kept per running loop. ``max_per_host`` caps the
+    connections each client opens, which is a per-host limit because every
+    caller of a given instance talks to a single API host.
+    """
+
+    def __init__(self, pool_maxsize=10, max_per_host=8, connect_timeout=5.0, read_timeout=60.0):
+        self.limits = httpx.Limits(
+            max_connections=max_per_host or None,
+            max_keepalive_connections=pool_maxsize,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            self._clients[loop] = client
+        return client
+
+    async def request(self, method, url, **kwargs):
+        return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
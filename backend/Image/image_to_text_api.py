@@ -1,32 +1,94 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework import status
+import asyncio
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
-import torch
-import io
+from .batching import MicroBatcher
+from .caption_cache import CaptionCache, dhash
+from .executors import run_blocking
+from .imaging import reduce_on_load
+from .model_registry import registry
 
-# Load BLIP model and processor once at server start
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+BLIP_IMAGE_SIZE = 384  # the processor resizes every image to this square
+
+def load_blip(backend=None, num_threads=None):
+    """Load the BLIP processor and model; called once by the model registry.
+
+    ``backend`` and ``num_threads`` default to the CAPTION_BACKEND and
+    CAPTION_NUM_THREADS settings.
+    """
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+    from .inference_backends import prepare_caption_model
+
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME)
+    model = prepare_caption_model(
+        model,
+        backend=backend or getattr(settings, 'CAPTION_BACKEND', 'fp32'),
+        num_threads=getattr(settings, 'CAPTION_NUM_THREADS', 0) if num_threads is None else num_threads,
+        image_size=model.config.vision_config.image_size,
+    )
+    return processor, model
+
+def generate_captions(images, blip=None):
+    """Caption a list of RGB images with one batched generate() call"""
+    import torch
+
+    processor, model = blip or registry.get('blip')
+    # The processor resizes every image to the same resolution, so the
+    # pixel batch needs no further padding
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.no_grad():
+        out = model.generate(**inputs, max_new_tokens=20)
+    return processor.batch_decode(out, skip_special_tokens=True)
 
 def generate_caption(image):
-    inputs = processor(images=image, return_tensors="pt")
-    out = model.generate(**inputs, max_new_tokens=20)
-    caption = processor.decode(out[0], skip_special_tokens=True)
-    return caption
-
-class ImageToTextAPIView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-
-    def post(self, request, *args, **kwargs):
-        image_file = request.FILES.get('image')
-        if not image_file:
-            return Response({'success': False, 'error': 'No image uploaded'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            image = Image.open(image_file)
-            caption = generate_caption(image)
-            return Response({'success': True, 'caption': caption})
-        except Exception as e:
-            return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return generate_captions([image])[0]
+
+# Concurrent requests are coalesced into batches for generate()
+caption_batcher = MicroBatcher(
+    generate_captions,
+    max_batch_size=getattr(settings, 'CAPTION_MAX_BATCH_SIZE', 8),
+    max_wait_ms=getattr(settings, 'CAPTION_MAX_WAIT_MS', 10),
+    name='caption-batcher',
+)
+
+# Captions are reused for identical or near-identical images
+caption_cache = CaptionCache(
+    max_distance=getattr(settings, 'CAPTION_CACHE_MAX_DISTANCE', 3),
+    ttl=getattr(settings, 'CAPTION_CACHE_TTL', 86400),
+    max_entries=getattr(settings, 'CAPTION_CACHE_MAX_ENTRIES', 1024),
+    path=getattr(settings, 'CAPTION_CACHE_PATH', None),
+    disk_max_entries=getattr(settings, 'CAPTION_CACHE_DISK_MAX_ENTRIES', 100000),
+) if getattr(settings, 'CAPTION_CACHE_ENABLED', True) else None
+
+def decode_upload(image_file):
+    """Decode an uploaded file to RGB and look up its caption; runs on the inference pool"""
+    with Image.open(image_file) as source:
+        # No need to decode beyond what the processor keeps
+        image = reduce_on_load(source, (BLIP_IMAGE_SIZE, BLIP_IMAGE_SIZE), fit=False).convert('RGB')
+    if caption_cache is None:
+        return image, None, None
+    key = dhash(image)
+    return image, key, caption_cache.get(key)
+
+@csrf_exempt
+async def image_to_text(request):
+    if request.method != "POST":
+        return JsonResponse({'success': False, 'error': 'POST request required'}, status=405)
+
+    image_file = request.FILES.get('image')
+    if not image_file:
+        return JsonResponse({'success': False, 'error': 'No image uploaded'}, status=400)
+    try:
+        image, key, caption = await run_blocking(decode_upload, image_file)
+        if caption is not None:
+            return JsonResponse({'success': True, 'caption': caption, 'cached': True})
+
+        caption = await asyncio.wrap_future(caption_batcher.submit(image))
+        if caption_cache is not None:
+            await run_blocking(caption_cache.set, key, caption)
+        return JsonResponse({'success': True, 'caption': caption, 'cached': False})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
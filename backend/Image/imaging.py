@@ -0,0 +1,48 @@
+from PIL import Image
+
+# Modes reduce() can't handle, mapped to the mode they are widened to first
+REDUCIBLE_MODES = {'P': 'RGBA', '1': 'L', 'I;16': 'I'}
+
+
+def fit_size(size, box):
+    """Size of ``size`` scaled down to fit inside ``box``, keeping the aspect ratio"""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def reduce_on_load(img, size, fit=True):
+    """
+    Decode a freshly opened image at the smallest scale that still covers
+    ``size``, so big uploads are never fully decoded just to be shrunk.
+
+    With ``fit`` the image will later be fitted inside the ``size`` box
+    (thumbnail); otherwise it will be resized to exactly ``size``. JPEGs are
+    decoded at 1/2, 1/4 or 1/8 scale in the DCT domain via draft(); other
+    formats are box-reduced by an integer factor after decoding. The caller
+    still does the final high quality resize.
+    """
+    target = fit_size(img.size, size) if fit else size
+
+    # Only has an effect before the image is loaded, and only for JPEG
+    img.draft(None, target)
+
+    factor = min(img.width // target[0], img.height // target[1])
+    if factor < 2:
+        img.load()
+        return img
+
+    if img.mode in REDUCIBLE_MODES:
+        img = img.convert(REDUCIBLE_MODES[img.mode])
+    return img.reduce(factor)
+
+
+def has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+
+def flatten(img):
+    """Composite an RGBA image onto white, for formats without alpha"""
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel('A'))
+    return background
@@ -0,0 +1,70 @@
+import logging
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# Selectable CPU inference backends for BLIP captioning
+CAPTION_BACKENDS = ('fp32', 'int8', 'traced')
+
+
+class TracedVisionEncoder(nn.Module):
+    """Drop-in replacement for BLIP's vision model backed by a TorchScript trace.
+
+    ``generate()`` calls the vision model with keyword arguments and reads
+    ``outputs[0]``, so the trace only needs to map pixels to the last
+    hidden state.
+    """
+
+    def __init__(self, traced):
+        super().__init__()
+        self.traced = traced
+
+    def forward(self, pixel_values, interpolate_pos_encoding=False, **kwargs):
+        return (self.traced(pixel_values),)
+
+
+class _LastHiddenState(nn.Module):
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values, return_dict=False)[0]
+
+
+def trace_vision_model(model, image_size):
+    """Replace the model's vision encoder with a traced graph"""
+    example = torch.zeros(1, 3, image_size, image_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(_LastHiddenState(model.vision_model).eval(), example, check_trace=False)
+        traced = torch.jit.freeze(traced)
+    model.vision_model = TracedVisionEncoder(traced)
+    return model
+
+
+def quantize_linear_layers(model):
+    """Dynamic int8 quantization of every nn.Linear (weights int8, activations fp32)"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_caption_model(model, backend='fp32', num_threads=0, image_size=384):
+    """Configure a loaded BLIP model for the selected CPU inference backend"""
+    if backend not in CAPTION_BACKENDS:
+        raise ValueError(f"Unknown caption backend '{backend}', expected one of {CAPTION_BACKENDS}")
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    model.eval()
+    if backend == 'int8':
+        model = quantize_linear_layers(model)
+    elif backend == 'traced':
+        try:
+            model = trace_vision_model(model, image_size)
+        except Exception as e:
+            # Tracing depends on the transformers version; eager still works
+            logger.warning(f"Tracing the BLIP vision encoder failed, using fp32: {e}")
+
+    logger.info(f"Caption model ready: backend={backend}, threads={torch.get_num_threads()}")
+    return model
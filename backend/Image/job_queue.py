@@ -0,0 +1,432 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Job states reported to clients
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class PermanentJobError(Exception):
+    """Raised by a task to fail its job without further retries"""
+
+
+class InMemoryBroker:
+    """Process-local broker, used by tests and single-process development"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def push(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def push_many(self, jobs):
+        with self._lock:
+            for job in jobs:
+                self._jobs[job['id']] = dict(job)
+
+    def claim(self, worker=None):
+        """Atomically take the next runnable job and mark it running"""
+        now = time.time()
+        with self._lock:
+            runnable = [
+                job for job in self._jobs.values()
+                if job['state'] == QUEUED and job['run_after'] <= now
+            ]
+            if not runnable:
+                return None
+            job = min(runnable, key=lambda j: (j['run_after'], j['created_at']))
+            job['state'] = RUNNING
+            job['attempts'] += 1
+            job['worker'] = worker
+            job['updated_at'] = now
+            return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            fields['updated_at'] = time.time()
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_many(self, job_ids):
+        with self._lock:
+            return [dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs]
+
+    def heartbeat(self, worker):
+        return 0
+
+    def recover(self, lease):
+        """Nothing survives a restart, so there is nothing to recover"""
+        return 0
+
+
+class SQLiteBroker:
+    """Broker persisted in a local SQLite file so queued jobs survive restarts"""
+
+    COLUMNS = (
+        'id', 'name', 'payload', 'state', 'attempts', 'max_retries',
+        'run_after', 'error', 'result', 'created_at', 'updated_at', 'worker',
+    )
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_retries INTEGER NOT NULL DEFAULT 0,
+                    run_after REAL NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    worker TEXT
+                )
+                """
+            )
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'worker' not in columns:
+                # Job files created before leases
+                conn.execute('ALTER TABLE jobs ADD COLUMN worker TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (state, run_after)')
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, keep one per worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _row(self, job):
+        values = dict(job)
+        values['payload'] = json.dumps(job['payload'])
+        values['result'] = json.dumps(job['result']) if job.get('result') is not None else None
+        return [values.get(column) for column in self.COLUMNS]
+
+    def _insert_sql(self):
+        placeholders = ', '.join('?' for _ in self.COLUMNS)
+        return f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({placeholders})"
+
+    def push(self, job):
+        self._connect().execute(self._insert_sql(), self._row(job))
+
+    def push_many(self, jobs):
+        """Insert every job in one transaction: a single commit instead of one per job"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(self._insert_sql(), [self._row(job) for job in jobs])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def claim(self, worker=None):
+        """Atomically take the next runnable job and mark it running, leased to ``worker``"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = ? AND run_after <= ? "
+                "ORDER BY run_after, created_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, worker = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, worker, now, row['id']),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        job = self._to_job(row)
+        job['state'] = RUNNING
+        job['attempts'] += 1
+        job['worker'] = worker
+        return job
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result']) if fields['result'] is not None else None
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        self._connect().execute(
+            f'UPDATE jobs SET {assignments} WHERE id = ?',
+            [*fields.values(), job_id],
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def get_many(self, job_ids):
+        job_ids = list(job_ids)
+        jobs = []
+        # Stays under SQLite's bound-parameter limit
+        for offset in range(0, len(job_ids), 500):
+            chunk = job_ids[offset:offset + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self._connect().execute(f'SELECT * FROM jobs WHERE id IN ({placeholders})', chunk).fetchall()
+            jobs.extend(self._to_job(row) for row in rows)
+        return jobs
+
+    def heartbeat(self, worker):
+        """Renew the lease on every job ``worker`` is running"""
+        cursor = self._connect().execute(
+            'UPDATE jobs SET updated_at = ? WHERE state = ? AND worker = ?',
+            (time.time(), RUNNING, worker),
+        )
+        return cursor.rowcount
+
+    def recover(self, lease):
+        """
+        Requeue running jobs whose lease has expired: their worker process
+        died. Jobs still heartbeating in another live process are left alone.
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE jobs SET state = ?, worker = NULL, updated_at = ? WHERE state = ? AND updated_at < ?',
+            (QUEUED, now, RUNNING, now - lease),
+        )
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Runs registered tasks on a pool of worker threads fed by a broker"""
+
+    def __init__(self, broker, concurrency=2, max_retries=3, retry_backoff=2.0,
+                 poll_interval=0.5, autostart=True, lease=60.0):
+        self.broker = broker
+        # Running jobs are leased to this process and renewed every lease / 3 seconds
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.lease = float(lease)
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = float(retry_backoff)
+        self.poll_interval = poll_interval
+        self.autostart = autostart
+        self.tasks = {}
+        self._workers = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def task(self, name):
+        """Decorator registering a function as the handler for ``name`` jobs"""
+        def decorator(func):
+            self.tasks[name] = func
+            return func
+        return decorator
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def _new_job(self, name, job_id, max_retries, payload):
+        if name not in self.tasks:
+            raise KeyError(f"No task registered under '{name}'")
+
+        now = time.time()
+        return {
+            'id': job_id or self.new_job_id(),
+            'name': name,
+            'payload': payload,
+            'state': QUEUED,
+            'attempts': 0,
+            'max_retries': self.max_retries if max_retries is None else max_retries,
+            'run_after': now,
+            'error': None,
+            'result': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    def _wake(self):
+        if self.autostart:
+            self.start()
+        self._wakeup.set()
+
+    def enqueue(self, name, job_id=None, max_retries=None, **payload):
+        """Queue a job and return its id. Payload must be JSON serialisable."""
+        job = self._new_job(name, job_id, max_retries, payload)
+        self.broker.push(job)
+        self._wake()
+        return job['id']
+
+    def enqueue_many(self, name, jobs, max_retries=None):
+        """
+        Queue one ``name`` job per (job_id, payload) pair in a single broker
+        write; a job_id of None gets a new one. Returns the job ids in order.
+        """
+        jobs = [self._new_job(name, job_id, max_retries, payload) for job_id, payload in jobs]
+        if jobs:
+            self.broker.push_many(jobs)
+            self._wake()
+        return [job['id'] for job in jobs]
+
+    def get_job(self, job_id):
+        """Return the public view of a job, or None if it is unknown"""
+        job = self.broker.get(job_id) if job_id else None
+        return self._public(job) if job else None
+
+    def get_jobs(self, job_ids):
+        """Public views of the known jobs among ``job_ids``, keyed by id, in one broker read"""
+        jobs = self.broker.get_many([job_id for job_id in job_ids if job_id])
+        return {job['id']: self._public(job) for job in jobs}
+
+    def _public(self, job):
+        return {
+            'id': job['id'],
+            'name': job['name'],
+            'state': job['state'],
+            'attempts': job['attempts'],
+            'max_retries': job['max_retries'],
+            'error': job['error'],
+            'result': job['result'],
+        }
+
+    def start(self):
+        """Start the worker threads once per process"""
+        with self._start_lock:
+            if self._workers:
+                return
+            self._recover()
+            self._stopping.clear()
+            for index in range(self.concurrency):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'job-worker-{index}',
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+            heartbeat.start()
+            self._workers.append(heartbeat)
+
+    def _recover(self):
+        recovered = self.broker.recover(self.lease)
+        if recovered:
+            logger.info(f"Requeued {recovered} job(s) whose worker stopped heartbeating")
+
+    def _heartbeat_loop(self):
+        # Keeps this process's leases alive and reclaims jobs from dead processes
+        while not self._stopping.wait(self.lease / 3):
+            try:
+                self.broker.heartbeat(self.worker_id)
+                self._recover()
+            except Exception as e:
+                logger.warning(f"Job queue heartbeat failed: {e}")
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def run_pending(self):
+        """Run every runnable job in the calling thread; returns the number run"""
+        count = 0
+        while True:
+            job = self.broker.claim(self.worker_id)
+            if job is None:
+                return count
+            self._execute(job)
+            count += 1
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            job = self.broker.claim(self.worker_id)
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._execute(job)
+            finally:
+                close_old_connections()
+
+    def _execute(self, job):
+        func = self.tasks.get(job['name'])
+        try:
+            if func is None:
+                raise PermanentJobError(f"No task registered under '{job['name']}'")
+            result = func(**job['payload'])
+        except Exception as e:
+            retryable = not isinstance(e, PermanentJobError)
+            if retryable and job['attempts'] <= job['max_retries']:
+                delay = self.retry_backoff * (2 ** (job['attempts'] - 1))
+                logger.warning(
+                    f"Job {job['id']} ({job['name']}) failed on attempt {job['attempts']}, "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                self.broker.update(job['id'], state=QUEUED, run_after=time.time() + delay, error=str(e))
+            else:
+                logger.error(f"Job {job['id']} ({job['name']}) failed: {e}")
+                self.broker.update(job['id'], state=FAILED, error=str(e))
+            return
+
+        self.broker.update(job['id'], state=DONE, error=None, result=result)
+
+
+def build_job_queue():
+    """Create the job queue described by the JOB_QUEUE_* settings"""
+    backend = getattr(settings, 'JOB_QUEUE_BACKEND', 'sqlite')
+    if backend == 'memory':
+        broker = InMemoryBroker()
+    elif backend == 'sqlite':
+        broker = SQLiteBroker(getattr(settings, 'JOB_QUEUE_PATH', 'jobs.sqlite3'))
+    else:
+        raise ValueError(f"Unknown JOB_QUEUE_BACKEND '{backend}'")
+
+    return JobQueue(
+        broker,
+        concurrency=getattr(settings, 'JOB_QUEUE_CONCURRENCY', 2),
+        max_retries=getattr(settings, 'JOB_QUEUE_MAX_RETRIES', 3),
+        retry_backoff=getattr(settings, 'JOB_QUEUE_RETRY_BACKOFF', 2.0),
+        autostart=getattr(settings, 'JOB_QUEUE_AUTOSTART', True),
+        lease=getattr(settings, 'JOB_QUEUE_LEASE', 60.0),
+    )
+
+
+# Global instance
+job_queue = build_job_queue()
@@ -0,0 +1,112 @@
+import base64
+import datetime
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Image
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Columns a listing reads; the ImageFields are turned into URLs
+LIST_FIELDS = (
+    'id', 'image', 'processed_image', 'compressed_image', 'created_by', 'created_at',
+    'date', 'time', 'batch_id', 'text_removal_status', 'text_removed',
+    'compression_status', 'original_size', 'compressed_size', 'compression_ratio',
+)
+FILE_FIELDS = ('image', 'processed_image', 'compressed_image')
+STATUS_FILTERS = ('text_removal_status', 'compression_status')
+EXACT_FILTERS = ('created_by', 'batch_id') + STATUS_FILTERS
+
+
+def encode_cursor(row):
+    """Opaque cursor for the page after ``row``: its created_at and id"""
+    value = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from encode_cursor output; raises ValueError"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, image_id = value.split('|')
+        created_at = datetime.datetime.fromisoformat(created_at)
+        return created_at, int(image_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def parse_timestamp(value, name, end_of_day=False):
+    """Aware datetime from an ISO datetime or date (a date means its start, or its end with ``end_of_day``)"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{name}' must be an ISO date or datetime")
+        moment = datetime.datetime.combine(day, datetime.time.max if end_of_day else datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filtered_images(params):
+    """
+    Image queryset for the listing filters in ``params`` (created_by,
+    batch_id, text_removal_status, compression_status, created_after,
+    created_before). Raises ValueError for an unknown status or a bad date.
+    """
+    queryset = Image.objects.all()
+    for name in EXACT_FILTERS:
+        value = params.get(name)
+        if not value:
+            continue
+        if name in STATUS_FILTERS:
+            choices = [choice for choice, _ in Image._meta.get_field(name).choices]
+            if value not in choices:
+                raise ValueError(f"'{name}' must be one of {', '.join(choices)}")
+        queryset = queryset.filter(**{name: value})
+
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=parse_timestamp(params['created_after'], 'created_after'))
+    if params.get('created_before'):
+        queryset = queryset.filter(created_at__lte=parse_timestamp(params['created_before'], 'created_before', end_of_day=True))
+    return queryset
+
+
+def list_images(params):
+    """
+    One page of images, newest first, read with keyset pagination: the
+    page after ``cursor`` starts where the previous one ended, so deep
+    pages cost the same as the first (no OFFSET) and rows inserted
+    meanwhile never shift or repeat results.
+    Raises ValueError for bad parameters.
+    Returns: dict with 'results' and 'next_cursor' (None on the last page)
+    """
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"'limit' must be between 1 and {MAX_LIMIT}")
+
+    queryset = filtered_images(params)
+    if params.get('cursor'):
+        created_at, image_id = decode_cursor(params['cursor'])
+        # The first condition alone bounds an index range scan; the second
+        # breaks ties between rows created in the same instant
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=image_id))
+        )
+
+    # One more row than asked for tells whether there is another page
+    rows = list(queryset.order_by('-created_at', '-id').values(*LIST_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+    storages = {field: Image._meta.get_field(field).storage for field in FILE_FIELDS}
+    results = []
+    for row in rows[:limit]:
+        for field, storage in storages.items():
+            name = row.pop(field)
+            row[f'{field}_url'] = storage.url(name) if name else None
+        results.append(row)
+    return {'results': results, 'next_cursor': next_cursor}
@@ -0,0 +1,53 @@
+import threading
+
+# Every counter created through get_counter(), keyed by name
+_counters = {}
+_registry_lock = threading.Lock()
+
+
+class HitMissCounter:
+    """Thread-safe hit/miss tally for a cache"""
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def snapshot(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+
+def get_counter(name):
+    """Return the process-wide counter called ``name``, creating it on first use"""
+    with _registry_lock:
+        counter = _counters.get(name)
+        if counter is None:
+            counter = _counters[name] = HitMissCounter(name)
+        return counter
+
+
+def snapshot_all():
+    with _registry_lock:
+        counters = list(_counters.values())
+    return {counter.name: counter.snapshot() for counter in counters}
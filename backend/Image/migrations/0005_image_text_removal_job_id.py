@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0004_image_compressed_image_image_compressed_size_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='text_removal_job_id',
+            field=models.CharField(blank=True, help_text='Background job queue id', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0006_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='compressed_codes',
+            field=models.FileField(blank=True, help_text='VQGAN codebook indices (.vqz)', null=True, upload_to='vqz/'),
+        ),
+    ]
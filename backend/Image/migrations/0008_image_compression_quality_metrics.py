@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0007_image_compressed_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='compression_psnr',
+            field=models.FloatField(blank=True, help_text='PSNR in dB of the compressed image (quality search only)', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='compression_quality',
+            field=models.IntegerField(blank=True, help_text='Encoder quality setting used', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='compression_ssim',
+            field=models.FloatField(blank=True, help_text='SSIM of the compressed image (quality search only)', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0008_image_compression_quality_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='compression_stats',
+            field=models.JSONField(blank=True, help_text='Chosen output format and per-format size and encode time', null=True),
+        ),
+    ]
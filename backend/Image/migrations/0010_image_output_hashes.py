@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0009_image_compression_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='codes_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of compressed_codes, used as its ETag', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='compressed_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of compressed_image, used as its ETag', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='processed_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of processed_image, used as its ETag', max_length=64, null=True),
+        ),
+    ]
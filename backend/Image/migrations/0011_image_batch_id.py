@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Image', '0010_image_output_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='batch_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Bulk upload this image arrived in', max_length=32, null=True),
+        ),
+    ]
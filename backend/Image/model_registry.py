@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Loads each model on first use, at most once per process.
+
+    Loaders are registered by dotted path so registering costs nothing;
+    the loader module (and torch/transformers with it) is only imported
+    when the model is first requested.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """Register a loader callable, or its dotted import path, under ``name``"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks[name] = threading.Lock()
+            self._models.pop(name, None)
+
+    def get(self, name):
+        """Return the loaded model, loading it first if needed"""
+        try:
+            return self._models[name]
+        except KeyError:
+            pass
+
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+
+            loader = self._loaders[name]
+            if isinstance(loader, str):
+                loader = import_string(loader)
+
+            start = time.perf_counter()
+            model = loader()
+            self._models[name] = model
+            logger.info(f"Loaded model '{name}' in {time.perf_counter() - start:.2f}s")
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def unload(self, name):
+        with self._lock:
+            self._models.pop(name, None)
+
+    def names(self):
+        return list(self._loaders)
+
+    def warm_up(self, names=None):
+        """Load the given models (all registered ones by default) now"""
+        for name in names or self.names():
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Warm-up of model '{name}' failed: {e}")
+
+
+registry = ModelRegistry()
+registry.register('blip', 'Image.image_to_text_api.load_blip')
+registry.register('vqgan', 'Image.compression_service.load_vqgan')
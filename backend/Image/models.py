@@ -1,5 +1,17 @@
 from django.db import models
 
+
+class StatusConflict(Exception):
+    """Raised when a status transition finds the row no longer in an allowed state"""
+
+
+# States a new processing run may start from; 'processing' means one is under way
+STARTABLE = ('pending', 'completed', 'failed')
+# States a queued job may claim from: a retry resumes the run its crashed
+# worker left 'processing'
+RESUMABLE = STARTABLE + ('processing',)
+
+
 class Image(models.Model):
     # Basic image fields
     image = models.ImageField(upload_to='uploads/')
@@ -7,6 +19,8 @@ class Image(models.Model):
     created_by = models.CharField(max_length=255)
     date = models.CharField(max_length=20)
     time = models.CharField(max_length=20)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text='SHA-256 of the uploaded bytes')
+    batch_id = models.CharField(max_length=32, blank=True, null=True, db_index=True, help_text='Bulk upload this image arrived in')
     
     # Text removal fields
     text_removed = models.BooleanField(default=False)
@@ -23,6 +37,8 @@ class Image(models.Model):
     text_removal_error = models.TextField(blank=True, null=True)
     processed_image = models.ImageField(upload_to='processed/', blank=True, null=True)
     clickdrop_task_id = models.CharField(max_length=255, blank=True, null=True)
+    text_removal_job_id = models.CharField(max_length=64, blank=True, null=True, help_text='Background job queue id')
+    processed_hash = models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of processed_image, used as its ETag')
     
     # Image compression fields
     compression_processed = models.BooleanField(default=False)
@@ -38,9 +54,86 @@ class Image(models.Model):
     )
     compression_error = models.TextField(blank=True, null=True)
     compressed_image = models.ImageField(upload_to='compressed/', blank=True, null=True)
+    compressed_codes = models.FileField(upload_to='vqz/', blank=True, null=True, help_text='VQGAN codebook indices (.vqz)')
+    compressed_hash = models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of compressed_image, used as its ETag')
+    codes_hash = models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of compressed_codes, used as its ETag')
     original_size = models.IntegerField(blank=True, null=True, help_text='Original file size in bytes')
     compressed_size = models.IntegerField(blank=True, null=True, help_text='Compressed file size in bytes')
     compression_ratio = models.FloatField(blank=True, null=True, help_text='Compression ratio (0-1)')
+    compression_quality = models.IntegerField(blank=True, null=True, help_text='Encoder quality setting used')
+    compression_ssim = models.FloatField(blank=True, null=True, help_text='SSIM of the compressed image (quality search only)')
+    compression_psnr = models.FloatField(blank=True, null=True, help_text='PSNR in dB of the compressed image (quality search only)')
+    compression_stats = models.JSONField(blank=True, null=True, help_text='Chosen output format and per-format size and encode time')
+
+    class Meta:
+        # The listing API filters on one of these columns and pages newest
+        # first, so each index serves both the filter and the keyset order
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='image_created_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='image_owner_created_idx'),
+            models.Index(fields=['text_removal_status', '-created_at', '-id'], name='image_text_status_idx'),
+            models.Index(fields=['compression_status', '-created_at', '-id'], name='image_compress_status_idx'),
+        ]
+
+    def _transition_update(self, field, to, from_states, update_fields):
+        filters = {'pk': self.pk}
+        if from_states is not None:
+            filters[f'{field}__in'] = from_states
+        values = {name: getattr(self, name) for name in update_fields if name != field}
+        values[field] = to
+        return type(self).objects.filter(**filters), values
+
+    def _transitioned(self, field, to, from_states, updated):
+        if not updated:
+            raise StatusConflict(f"Image {self.pk} {field.replace('_', ' ')} is not {' or '.join(from_states)}")
+        setattr(self, field, to)
+
+    def transition(self, field, to, from_states=None, update_fields=()):
+        """
+        Set status ``field`` (text_removal_status or compression_status) to
+        ``to`` with one UPDATE that writes only it and the instance's current
+        values of ``update_fields``. With ``from_states`` the row must still
+        be in one of them, checked by that same UPDATE, so of two concurrent
+        requests only one can move it; the other gets StatusConflict.
+        """
+        queryset, values = self._transition_update(field, to, from_states, update_fields)
+        self._transitioned(field, to, from_states, queryset.update(**values))
+
+    async def atransition(self, field, to, from_states=None, update_fields=()):
+        """Async variant of transition for ASGI views"""
+        queryset, values = self._transition_update(field, to, from_states, update_fields)
+        self._transitioned(field, to, from_states, await queryset.aupdate(**values))
+
+    @classmethod
+    def _release_update(cls, ids, field, error):
+        error_field = field.replace('_status', '_error')
+        queryset = cls.objects.filter(pk__in=ids, **{field: 'processing'})
+        return queryset, {field: 'failed', error_field: error}
+
+    @classmethod
+    def release_many(cls, ids, field, error):
+        """release() for the rows ``ids`` with one UPDATE; returns the number released"""
+        queryset, values = cls._release_update(ids, field, error)
+        return queryset.update(**values)
+
+    def release(self, field, error):
+        """
+        Mark an interrupted run failed: move ``field`` from processing to
+        failed with ``error``, unless the row has already moved on. Called
+        when a run is cancelled or interrupted after claiming the row, so
+        its claim does not hold the row in processing for good.
+        """
+        queryset, values = self._release_update([self.pk], field, error)
+        if queryset.update(**values):
+            for name, value in values.items():
+                setattr(self, name, value)
+
+    async def arelease(self, field, error):
+        """Async variant of release for ASGI views"""
+        queryset, values = self._release_update([self.pk], field, error)
+        if await queryset.aupdate(**values):
+            for name, value in values.items():
+                setattr(self, name, value)
 
     def __str__(self):
         status = f" - Text removal: {self.text_removal_status}"
@@ -0,0 +1,125 @@
+import io
+import numpy as np
+from PIL import Image
+
+# Quality settings the search may pick from
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+
+# Stop searching once a result is this close to the target
+BYTES_TOLERANCE = 0.05  # fraction of max_bytes left unused
+SSIM_TOLERANCE = 0.002
+PSNR_TOLERANCE = 0.25  # dB
+
+SSIM_WINDOW = 7
+MAX_PSNR = 100.0  # reported for identical images instead of infinity, which JSON can't carry
+
+
+def _window_mean(x, size):
+    """Mean over every size x size window ('valid' positions), via an integral image"""
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[size:, size:] - c[:-size, size:] - c[size:, :-size] + c[:-size, :-size]) / (size * size)
+
+
+def ssim(a, b, data_range=255.0):
+    """Mean SSIM of two greyscale arrays with a uniform window"""
+    size = min(SSIM_WINDOW, *a.shape)
+    mu_a = _window_mean(a, size)
+    mu_b = _window_mean(b, size)
+    var_a = _window_mean(a * a, size) - mu_a ** 2
+    var_b = _window_mean(b * b, size) - mu_b ** 2
+    covariance = _window_mean(a * b, size) - mu_a * mu_b
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    score = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(score.mean())
+
+
+def psnr(a, b, data_range=255.0):
+    mse = float(np.mean((a - b) ** 2))
+    if mse == 0:
+        return MAX_PSNR
+    return min(MAX_PSNR, float(10 * np.log10(data_range ** 2 / mse)))
+
+
+class ImageMetrics:
+    """SSIM (on luma) and PSNR (on RGB) of encodes against one decoded reference"""
+
+    def __init__(self, reference):
+        # Converted once and reused for every candidate encode
+        self.luma = np.asarray(reference.convert('L'), dtype=np.float64)
+        self.rgb = np.asarray(reference.convert('RGB'), dtype=np.float64)
+
+    def measure(self, data):
+        with Image.open(io.BytesIO(data)) as decoded:
+            decoded = decoded.convert('RGB')
+        return {
+            'ssim': ssim(self.luma, np.asarray(decoded.convert('L'), dtype=np.float64)),
+            'psnr': psnr(self.rgb, np.asarray(decoded, dtype=np.float64)),
+        }
+
+
+def search_quality(img, encode, max_bytes=None, min_ssim=None, min_psnr=None):
+    """
+    Binary-search the quality passed to ``encode(img, quality)`` against
+    one target: the highest quality that fits in ``max_bytes``, or the
+    lowest quality whose SSIM/PSNR reaches ``min_ssim``/``min_psnr``. Every
+    encode is in memory, and the search stops early once a result is within
+    tolerance.
+
+    Returns: dict with 'quality', 'data', 'ssim', 'psnr', 'target_met' and
+    'encodes' (number of trial encodes). When the target can't be met the
+    closest end of the quality range is returned.
+    """
+    if max_bytes is None and min_ssim is None and min_psnr is None:
+        raise ValueError('A max_bytes, min_ssim or min_psnr target is required')
+
+    metrics = ImageMetrics(img)
+    encodes = {}
+    measured = {}
+
+    def trial(quality):
+        if quality not in encodes:
+            encodes[quality] = encode(img, quality)
+        return encodes[quality]
+
+    def quality_of(quality):
+        if quality not in measured:
+            measured[quality] = metrics.measure(trial(quality))
+        return measured[quality]
+
+    best = None
+    low, high = MIN_QUALITY, MAX_QUALITY
+    while low <= high:
+        quality = (low + high) // 2
+        data = trial(quality)
+        if max_bytes is not None:
+            ok = len(data) <= max_bytes
+            close = ok and len(data) >= max_bytes * (1 - BYTES_TOLERANCE)
+        else:
+            scores = quality_of(quality)
+            ok = ((min_ssim is None or scores['ssim'] >= min_ssim)
+                  and (min_psnr is None or scores['psnr'] >= min_psnr))
+            close = ok and ((min_ssim is None or scores['ssim'] - min_ssim <= SSIM_TOLERANCE)
+                            and (min_psnr is None or scores['psnr'] - min_psnr <= PSNR_TOLERANCE))
+
+        if ok:
+            best = quality
+            if close:
+                break
+        # Larger files and better scores both come with higher quality
+        if max_bytes is not None:
+            low, high = (quality + 1, high) if ok else (low, quality - 1)
+        else:
+            low, high = (low, quality - 1) if ok else (quality + 1, high)
+
+    target_met = best is not None
+    if not target_met:
+        best = MIN_QUALITY if max_bytes is not None else MAX_QUALITY
+    return {
+        'quality': best,
+        'data': trial(best),
+        **quality_of(best),
+        'target_met': target_met,
+        'encodes': len(encodes),
+    }
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from django.conf import settings
+from PIL import Image
+from .dedup_cache import evict_lru
+from .encoders import get_encoder
+from .imaging import flatten, has_alpha, reduce_on_load
+from .metrics import get_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = 'WEBP'
+
+
+class RenditionCache:
+    """
+    Resized copies of an image for responsive display, made on first request.
+
+    Requested widths are snapped up to one of ``widths`` so the number of
+    variants per image stays bounded. Files live flat under
+    ``MEDIA_ROOT/renditions/`` and are named after the source file's
+    identity, so a new processed image never serves a stale rendition.
+    Least recently served files are evicted past ``max_bytes`` (0 disables
+    eviction).
+    """
+
+    def __init__(self, widths=(160, 320, 640, 1024, 1920), quality=80, max_bytes=0, directory='renditions'):
+        self.widths = sorted(widths)
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.stats = get_counter('renditions')
+        # One lock per rendition being generated, so concurrent misses encode it once
+        self._generating = {}
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return os.path.join(settings.MEDIA_ROOT, self.directory)
+
+    def snap_width(self, width):
+        """Smallest configured width covering ``width`` (the largest if none does)"""
+        for candidate in self.widths:
+            if candidate >= width:
+                return candidate
+        return self.widths[-1]
+
+    def source(self, image):
+        """Best stored version to resize: the text-removed image, else the upload"""
+        for field in (image.processed_image, image.image):
+            if field and os.path.exists(field.path):
+                return field
+        return None
+
+    def get(self, image, width, format=DEFAULT_FORMAT):
+        """
+        Open the rendition of ``image`` at ``width`` in ``format``, generating
+        it on a miss. Raises ValueError for an unknown format and
+        FileNotFoundError when the image has no stored file.
+        Returns: dict with the open 'file', 'content_type', a strong 'etag'
+        and 'last_modified' (the source file's mtime)
+        """
+        encoder = get_encoder(format)
+        source = self.source(image)
+        if source is None:
+            raise FileNotFoundError('No image file to render')
+
+        width = self.snap_width(width)
+        stat = os.stat(source.path)
+        version = hashlib.sha1(f'{source.name}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:12]
+        name = f'{image.id}_{width}_{version}.{encoder.extension}'
+        path = os.path.join(self.root, name)
+
+        with self._lock:
+            lock = self._generating.setdefault(name, threading.Lock())
+        try:
+            with lock:
+                try:
+                    # Opened before eviction can remove it; the handle outlives an unlink
+                    f = open(path, 'rb')
+                    self.stats.hit()
+                    self._touch(path)
+                except FileNotFoundError:
+                    self.stats.miss()
+                    self._store(path, self.render(source.path, width, encoder))
+                    f = open(path, 'rb')
+        finally:
+            with self._lock:
+                self._generating.pop(name, None)
+
+        return {
+            'file': f,
+            'content_type': encoder.content_type,
+            'etag': f'"{name}"',
+            'last_modified': stat.st_mtime,
+        }
+
+    def render(self, path, width, encoder):
+        """Encode the image at ``path`` scaled down to ``width`` pixels wide"""
+        with Image.open(path) as source, reduce_on_load(source, (width, source.height)) as img:
+            img = img.convert('RGBA' if has_alpha(img) else 'RGB')
+            if img.width > width:
+                img.thumbnail((width, img.height), Image.Resampling.LANCZOS)
+            if img.mode == 'RGBA' and not encoder.alpha:
+                img = flatten(img)
+            return encoder.encode(img, self.quality)
+
+    def _store(self, path, data):
+        # Written next to the cache and renamed in, so readers never see a partial file
+        staging = os.path.join(self.root, '.tmp')
+        os.makedirs(staging, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        evicted_paths, _ = evict_lru(self.root, self.max_bytes, keep=path)
+        for evicted in evicted_paths:
+            logger.info(f"Evicted rendition {os.path.basename(evicted)}")
+
+    def _touch(self, path):
+        # The file's mtime doubles as its last-used time for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+# Create a singleton instance
+rendition_cache = RenditionCache(
+    widths=getattr(settings, 'RENDITION_WIDTHS', (160, 320, 640, 1024, 1920)),
+    quality=getattr(settings, 'RENDITION_QUALITY', 80),
+    max_bytes=getattr(settings, 'RENDITION_CACHE_MAX_BYTES', 0),
+)
@@ -0,0 +1,31 @@
+import logging
+from .job_queue import job_queue, PermanentJobError
+from .models import Image, RESUMABLE, StatusConflict
+from .text_removal_service import text_removal_service
+
+logger = logging.getLogger(__name__)
+
+
+@job_queue.task('remove_text')
+def remove_text_task(image_id):
+    """Run ClickDrop text removal for an uploaded image"""
+    if not text_removal_service.api_key:
+        raise PermanentJobError('API key not configured')
+
+    try:
+        image_instance = Image.objects.get(id=image_id)
+    except Image.DoesNotExist:
+        raise PermanentJobError(f"Image {image_id} no longer exists")
+
+    # A retry after a crash finds the row still 'processing', so the job may
+    # claim it from there too
+    try:
+        result = text_removal_service.remove_text_from_image(image_instance, from_states=RESUMABLE)
+    except StatusConflict as e:
+        # A request run completed or reset the image meanwhile; retrying
+        # would only call ClickDrop again for a result that is not kept
+        raise PermanentJobError(str(e))
+    if not result['success']:
+        # Raising hands the job back to the queue for a retry with backoff
+        raise Exception(result['error'])
+    return result
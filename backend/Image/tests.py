@@ -1,3 +1,918 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from hashlib import sha256
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+import numpy as np
+from PIL import Image as PILImage
+from .caption_cache import CaptionCache
+from .compression_engine import CompressionEngine, encode_image
+from .compression_service import compression_service
+from .dedup_cache import ProcessedImageCache
+from .downloads import parse_range
+from .encoders import AUTO, ENCODERS
+from .job_queue import DONE, FAILED, QUEUED, RUNNING, InMemoryBroker, JobQueue, PermanentJobError, SQLiteBroker
+from .models import Image, StatusConflict
+from .job_queue import job_queue
+from .quality import MAX_PSNR, MAX_QUALITY, MIN_QUALITY, ImageMetrics, psnr, search_quality, ssim
+from .tasks import remove_text_task
+from .text_removal_service import text_removal_service
+from .upload_handlers import StreamingImageUploadHandler
+from . import vqz
 
-# Create your tests here.
+try:
+    import torch
+    from .vqgan_model import VectorQuantizerEMA
+except ImportError:  # torch is only needed for VQGAN compression
+    torch = None
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png_bytes(color='red'):
+    output = io.BytesIO()
+    PILImage.new('RGB', (8, 8), color).save(output, format='PNG')
+    return output.getvalue()
+
+
+def compress_result():
+    data = b'compressed'
+    return {
+        'success': True,
+        'method': 'PIL',
+        'message': 'Image compressed successfully',
+        'format': 'JPEG',
+        'compressed_bytes': data,
+        'original_size': 100,
+        'compressed_size': len(data),
+        'compression_ratio': 0.9,
+    }
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.image = Image(created_by='tester', date='2025-01-01', time='12:00:00', content_hash='0' * 64)
+        self.image.image.save('in.png', ContentFile(png_bytes()), save=False)
+        self.image.save()
+
+    def set_status(self, **fields):
+        Image.objects.filter(pk=self.image.pk).update(**fields)
+
+
+class TransitionTests(ImageTestCase):
+    def test_writes_only_named_fields(self):
+        # A column changed by someone else since the instance was loaded survives
+        self.set_status(created_by='someone else')
+        self.image.compression_error = 'boom'
+        self.image.transition('compression_status', 'failed', update_fields=['compression_error'])
+
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.compression_status, 'failed')
+        self.assertEqual(row.compression_error, 'boom')
+        self.assertEqual(row.created_by, 'someone else')
+        self.assertEqual(self.image.compression_status, 'failed')
+
+    def test_conflict_when_not_in_from_states(self):
+        self.set_status(compression_status='processing')
+        with self.assertNumQueries(1), self.assertRaises(StatusConflict):
+            self.image.transition('compression_status', 'processing', from_states=['pending', 'completed', 'failed'])
+        self.assertEqual(self.image.compression_status, 'pending')
+
+
+class CompressImageQueryTests(ImageTestCase):
+    def test_compress_is_one_read_and_two_updates(self):
+        with mock.patch.object(compression_service, 'compress_image', return_value=compress_result()):
+            # Load the row, claim it, write the result
+            with self.assertNumQueries(3):
+                response = self.client.post(f'/image/compress/{self.image.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.compression_status, 'completed')
+        self.assertEqual(row.compressed_size, len(b'compressed'))
+        self.assertTrue(row.compressed_image.name.endswith('.jpg'))
+
+    def test_failure_is_one_read_and_two_updates(self):
+        with mock.patch.object(compression_service, 'compress_image', side_effect=RuntimeError('encoder crashed')):
+            with self.assertNumQueries(3):
+                response = self.client.post(f'/image/compress/{self.image.pk}/')
+
+        self.assertFalse(response.json()['success'])
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.compression_status, 'failed')
+        self.assertEqual(row.compression_error, 'encoder crashed')
+
+    def test_concurrent_compress_gets_409(self):
+        self.set_status(compression_status='processing')
+        with mock.patch.object(compression_service, 'compress_image') as compress:
+            with self.assertNumQueries(2):
+                response = self.client.post(f'/image/compress/{self.image.pk}/')
+
+        self.assertEqual(response.status_code, 409)
+        compress.assert_not_called()
+        self.assertEqual(Image.objects.get(pk=self.image.pk).compression_status, 'processing')
+
+    def test_cancelled_compress_releases_claim(self):
+        with mock.patch.object(compression_service, 'compress_image', side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                self.client.post(f'/image/compress/{self.image.pk}/')
+
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.compression_status, 'failed')
+        self.assertEqual(row.compression_error, 'Compression was interrupted')
+
+
+class RemoveTextQueryTests(ImageTestCase):
+    def setUp(self):
+        super().setUp()
+        response = SimpleNamespace(status_code=200, content=png_bytes('blue'))
+        patches = [
+            mock.patch.object(text_removal_service, 'api_key', 'test-key'),
+            mock.patch.object(text_removal_service.async_http, 'post', mock.AsyncMock(return_value=response)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_remove_text_is_two_reads_and_two_updates(self):
+        # Load the row, look for a cached result, claim it, write the result
+        with self.assertNumQueries(4):
+            response = self.client.post(f'/image/remove-text/{self.image.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.text_removal_status, 'completed')
+        self.assertTrue(row.text_removed)
+        self.assertIsNotNone(row.processed_hash)
+
+    def test_concurrent_remove_text_gets_409(self):
+        self.set_status(text_removal_status='processing')
+        with self.assertNumQueries(3):
+            response = self.client.post(f'/image/remove-text/{self.image.pk}/')
+
+        self.assertEqual(response.status_code, 409)
+        text_removal_service.async_http.post.assert_not_called()
+        self.assertEqual(Image.objects.get(pk=self.image.pk).text_removal_status, 'processing')
+
+    def test_cancelled_remove_text_releases_claim(self):
+        text_removal_service.async_http.post.side_effect = asyncio.CancelledError
+        with self.assertRaises(asyncio.CancelledError):
+            self.client.post(f'/image/remove-text/{self.image.pk}/')
+
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.text_removal_status, 'failed')
+        self.assertEqual(row.text_removal_error, 'Text removal was interrupted')
+
+
+class RemoveTextTaskTests(ImageTestCase):
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.object(text_removal_service, 'api_key', 'test-key')
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def post(self, side_effect=None):
+        def post(*args, **kwargs):
+            if side_effect:
+                side_effect()
+            return SimpleNamespace(status_code=200, content=png_bytes('blue'))
+        return mock.patch.object(text_removal_service.http, 'post', side_effect=post)
+
+    def test_retry_resumes_a_processing_row(self):
+        # Left 'processing' by a worker that crashed mid-run
+        self.set_status(text_removal_status='processing')
+        with self.post():
+            result = remove_text_task(self.image.pk)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(Image.objects.get(pk=self.image.pk).text_removal_status, 'completed')
+
+    def test_losing_a_race_is_permanent_and_keeps_no_file(self):
+        processed = os.path.join(MEDIA_ROOT, 'processed')
+        os.makedirs(processed, exist_ok=True)
+        before = set(os.listdir(processed))
+        # A request run completes the image while the job waits on ClickDrop
+        with self.post(lambda: self.set_status(text_removal_status='completed')):
+            with self.assertRaises(PermanentJobError):
+                remove_text_task(self.image.pk)
+
+        row = Image.objects.get(pk=self.image.pk)
+        self.assertEqual(row.text_removal_status, 'completed')
+        self.assertFalse(row.processed_image)
+        self.assertEqual(set(os.listdir(processed)), before)
+
+
+class ProcessedImageCacheTests(ImageTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.root))
+        os.makedirs(os.path.join(self.root, 'processed'))
+        super().setUp()
+        self.scandir = self.enterContext(mock.patch.object(os, 'scandir', wraps=os.scandir))
+
+    def store(self, name, size, age):
+        path = os.path.join(self.root, 'processed', name)
+        with open(path, 'wb') as f:
+            f.write(bytes(size))
+        # Recorded results are touched, so backdate after recording
+        return lambda: os.utime(path, (time.time() - age,) * 2)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, 'processed', name))
+
+    def test_running_total_rescans_only_past_budget(self):
+        cache = ProcessedImageCache(max_bytes=1000)
+        for name, size, age in [('a.png', 300, 30), ('b.png', 300, 20)]:
+            backdate = self.store(name, size, age)
+            cache.record(f'processed/{name}')
+            backdate()
+        self.assertEqual((cache.size, self.scandir.call_count), (600, 1))
+
+        self.store('c.png', 500, 0)
+        cache.record('processed/c.png')
+
+        # 1100 bytes passes the budget: one rescan frees down to 900
+        self.assertEqual((cache.size, self.scandir.call_count), (800, 2))
+        self.assertEqual([self.exists(n) for n in ('a.png', 'b.png', 'c.png')], [False, True, True])
+
+    def test_evicting_a_shared_file_resets_every_row_using_it(self):
+        completed = {'processed_image': 'processed/a.png', 'text_removed': True, 'text_removal_status': 'completed'}
+        self.set_status(**completed)
+        duplicate = Image.objects.create(created_by='tester', image=self.image.image.name, content_hash='0' * 64, **completed)
+        other = Image.objects.create(created_by='tester', image=self.image.image.name, **dict(completed, processed_image='processed/b.png'))
+        self.store('a.png', 600, 30)()
+        self.store('b.png', 600, 0)
+
+        ProcessedImageCache(max_bytes=1000).record('processed/b.png')
+
+        self.assertFalse(self.exists('a.png'))
+        for row in Image.objects.filter(pk__in=[self.image.pk, duplicate.pk]):
+            self.assertEqual((bool(row.processed_image), row.text_removed, row.text_removal_status), (False, False, 'pending'))
+        self.assertEqual(Image.objects.get(pk=other.pk).text_removal_status, 'completed')
+
+    def test_unlimited_cache_never_scans(self):
+        cache = ProcessedImageCache(max_bytes=0)
+        self.store('a.png', 600, 0)
+        cache.record('processed/a.png')
+
+        self.assertEqual(self.scandir.call_count, 0)
+        self.assertTrue(self.exists('a.png'))
+
+
+class CompressBatchTests(ImageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Image(created_by='tester', date='2025-01-01', time='12:00:00')
+        self.other.image.save('other.png', ContentFile(png_bytes('blue')), save=False)
+        self.other.save()
+        results = lambda paths, *args: iter([(position, compress_result()) for position in range(len(paths))])
+        patch = mock.patch.object(compression_service, 'compress_many', side_effect=results)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def statuses(self):
+        return dict(Image.objects.values_list('id', 'compression_status'))
+
+    def test_stopping_early_saves_finished_and_releases_the_rest(self):
+        summaries = compression_service.compress_queryset([self.image.pk, self.other.pk])
+        self.assertTrue(next(summaries)['success'])
+        self.assertEqual(self.statuses(), {self.image.pk: 'processing', self.other.pk: 'processing'})
+        summaries.close()
+
+        self.assertEqual(self.statuses(), {self.image.pk: 'completed', self.other.pk: 'failed'})
+        self.assertTrue(Image.objects.get(pk=self.image.pk).compressed_image)
+        self.assertEqual(Image.objects.get(pk=self.other.pk).compression_error, 'Compression was interrupted')
+
+    async def test_dropped_stream_releases_unfinished_rows(self):
+        response = await self.async_client.post(
+            '/image/compress-batch/', {'ids': [self.image.pk, self.other.pk]}, content_type='application/json',
+        )
+        lines = response.streaming_content
+        self.assertEqual(json.loads(await anext(lines))['id'], self.image.pk)
+        # The client goes away: the server stops reading and closes the
+        # response, which releases the batch from a task on the loop
+        await lines.aclose()
+        response.close()
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not asyncio.current_task()))
+
+        statuses = await sync_to_async(self.statuses)()
+        self.assertEqual(statuses, {self.image.pk: 'completed', self.other.pk: 'failed'})
+
+    def test_image_already_processing_is_a_conflict(self):
+        self.set_status(compression_status='processing')
+        summaries = list(compression_service.compress_queryset([self.image.pk, self.other.pk]))
+
+        self.assertEqual(
+            summaries[0], {'id': self.image.pk, 'success': False, 'error': 'Compression already in progress'}
+        )
+        self.assertEqual([summary['id'] for summary in summaries[1:]], [self.other.pk])
+        self.assertEqual(self.statuses(), {self.image.pk: 'processing', self.other.pk: 'completed'})
+
+
+class UploadBatchTests(ImageTestCase):
+    def test_archive_without_images_is_400(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('.DS_Store', b'finder')
+            zf.writestr('__MACOSX/._photo.png', b'resource fork')
+        upload = ContentFile(archive.getvalue(), name='photos.zip')
+
+        response = self.client.post('/image/upload-batch/', {'files': upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'No images found in upload')
+        self.assertEqual(Image.objects.count(), 1)
+
+
+class AutoFormatTests(SimpleTestCase):
+    def test_auto_skips_formats_pillow_cannot_write(self):
+        data = png_bytes()
+        with mock.patch.object(ENCODERS['AVIF'], 'available', return_value=False):
+            with self.assertLogs('Image.compression_engine', 'WARNING'):
+                engine = CompressionEngine(workers=1, auto_formats=('JPEG', 'WEBP', 'AVIF'))
+            result = encode_image(io.BytesIO(data), len(data), 64, 64, 85, AUTO, auto_formats=('JPEG', 'WEBP', 'AVIF'))
+
+        self.assertEqual(engine.auto_formats, ('JPEG', 'WEBP'))
+        self.assertTrue(result['success'])
+        self.assertEqual(set(result['stats']['candidates']), {'JPEG', 'WEBP'})
+
+    def test_no_usable_auto_format_is_an_error(self):
+        with mock.patch.object(ENCODERS['AVIF'], 'available', return_value=False):
+            with self.assertRaises(ValueError):
+                CompressionEngine(workers=1, auto_formats=('AVIF',))
+
+
+class JobQueueTestMixin:
+    """Queue behaviour shared by both brokers; subclasses provide make_broker()"""
+
+    def setUp(self):
+        self.queue = JobQueue(self.make_broker(), max_retries=2, retry_backoff=10, autostart=False, lease=60)
+        self.calls = []
+
+        @self.queue.task('echo')
+        def echo(value):
+            self.calls.append(value)
+            return {'value': value}
+
+        @self.queue.task('flaky')
+        def flaky():
+            raise RuntimeError('try again')
+
+        @self.queue.task('broken')
+        def broken():
+            raise PermanentJobError('bad input')
+
+    def make_ready(self, job_id):
+        self.queue.broker.update(job_id, run_after=0)
+
+    def test_enqueue_and_run(self):
+        job_id = self.queue.enqueue('echo', value=1)
+        self.assertEqual(self.queue.get_job(job_id)['state'], QUEUED)
+
+        self.assertEqual(self.queue.run_pending(), 1)
+        job = self.queue.get_job(job_id)
+        self.assertEqual((job['state'], job['attempts'], job['result']), (DONE, 1, {'value': 1}))
+        self.assertEqual(self.calls, [1])
+
+    def test_enqueue_many_and_get_jobs(self):
+        job_ids = self.queue.enqueue_many('echo', [('first', {'value': 1}), (None, {'value': 2})])
+        self.assertEqual(job_ids[0], 'first')
+        self.assertEqual(self.queue.run_pending(), 2)
+
+        jobs = self.queue.get_jobs(job_ids + [None, 'unknown'])
+        self.assertEqual(set(jobs), set(job_ids))
+        self.assertEqual({job['state'] for job in jobs.values()}, {DONE})
+        self.assertEqual(sorted(self.calls), [1, 2])
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(KeyError):
+            self.queue.enqueue('missing')
+
+    def test_retry_backoff_doubles_until_failed(self):
+        job_id = self.queue.enqueue('flaky')
+        for attempt, delay in [(1, 10), (2, 20)]:
+            before = time.time()
+            self.queue.run_pending()
+            job = self.queue.broker.get(job_id)
+            self.assertEqual((job['state'], job['attempts'], job['error']), (QUEUED, attempt, 'try again'))
+            self.assertAlmostEqual(job['run_after'] - before, delay, delta=1)
+            # Not runnable again until the backoff has passed
+            self.assertEqual(self.queue.run_pending(), 0)
+            self.make_ready(job_id)
+
+        self.queue.run_pending()
+        job = self.queue.get_job(job_id)
+        self.assertEqual((job['state'], job['attempts']), (FAILED, 3))
+
+    def test_permanent_error_is_not_retried(self):
+        job_id = self.queue.enqueue('broken')
+        self.queue.run_pending()
+        job = self.queue.get_job(job_id)
+        self.assertEqual((job['state'], job['attempts'], job['error']), (FAILED, 1, 'bad input'))
+
+
+class InMemoryJobQueueTests(JobQueueTestMixin, SimpleTestCase):
+    def make_broker(self):
+        return InMemoryBroker()
+
+
+class SQLiteJobQueueTests(JobQueueTestMixin, SimpleTestCase):
+    def make_broker(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'jobs.sqlite3')
+        return SQLiteBroker(self.path)
+
+    def age(self, job_id, seconds):
+        """Make a running job's lease look ``seconds`` old"""
+        self.queue.broker._connect().execute(
+            'UPDATE jobs SET updated_at = ? WHERE id = ?', (time.time() - seconds, job_id)
+        )
+
+    def test_jobs_survive_a_new_broker(self):
+        job_id = self.queue.enqueue('echo', value=3)
+        other = JobQueue(SQLiteBroker(self.path), autostart=False)
+        other.tasks = self.queue.tasks
+        self.assertEqual(other.run_pending(), 1)
+        self.assertEqual(self.queue.get_job(job_id)['state'], DONE)
+
+    def test_recover_requeues_only_expired_leases(self):
+        expired, live = self.queue.enqueue('echo', value=1), self.queue.enqueue('echo', value=2)
+        broker = self.queue.broker
+        broker.claim('dead-worker')
+        broker.claim('live-worker')
+        self.age(expired, 120)
+        self.age(live, 120)
+        # The live worker's heartbeat renews its lease
+        self.assertEqual(broker.heartbeat('live-worker'), 1)
+
+        self.assertEqual(broker.recover(60), 1)
+        self.assertEqual(broker.get(expired)['state'], QUEUED)
+        self.assertIsNone(broker.get(expired)['worker'])
+        self.assertEqual(broker.get(live)['state'], RUNNING)
+
+        # The requeued job runs again; its attempt count carries over
+        self.assertEqual(self.queue.run_pending(), 1)
+        job = self.queue.get_job(expired)
+        self.assertEqual((job['state'], job['attempts']), (DONE, 2))
+
+    def test_fresh_claim_is_not_recovered(self):
+        job_id = self.queue.enqueue('echo', value=1)
+        self.queue.broker.claim('worker')
+        self.assertEqual(self.queue.broker.recover(60), 0)
+        self.assertEqual(self.queue.broker.get(job_id)['state'], RUNNING)
+
+
+class VQZTests(SimpleTestCase):
+    def header(self, tiles=1, grid=8, bits=4):
+        return vqz.VQZHeader(width=64, height=64, tiled=tiles > 1, tile_overlap=0, grid_h=grid, grid_w=grid, index_bits=bits, tiles=tiles)
+
+    def skewed(self, tiles=1, grid=16, bits=6):
+        # Mostly a few codes, as a real codebook is used
+        rng = np.random.default_rng(0)
+        return rng.choice([0, 1, 2, 3, 40], p=[0.6, 0.2, 0.1, 0.05, 0.05], size=(tiles, grid, grid))
+
+    def round_trip(self, indices, header, global_freqs=None):
+        blob = vqz.encode(indices, header, global_freqs)
+        decoded_header, decoded = vqz.decode(blob, global_freqs)
+        self.assertEqual(decoded_header, header)
+        np.testing.assert_array_equal(decoded, indices)
+        return blob
+
+    def test_packed_round_trip(self):
+        # Uniform indices: an entropy coder's table costs more than it saves
+        indices = np.random.default_rng(0).integers(0, 16, size=(2, 8, 8))
+        header = self.header(tiles=2)
+        self.round_trip(indices, header)
+        self.assertEqual(header.coding, vqz.CODING_PACKED)
+
+    def test_rans_round_trip(self):
+        header = self.header(grid=16, bits=6)
+        self.round_trip(self.skewed(), header)
+        self.assertEqual(header.coding, vqz.CODING_RANS)
+
+    def test_global_table_round_trip(self):
+        indices = self.skewed()
+        global_freqs = vqz.normalize_frequencies(np.bincount(indices.ravel(), minlength=64), keep_all=True)
+        header = self.header(grid=16, bits=6)
+        blob = self.round_trip(indices, header, global_freqs)
+        self.assertEqual(header.coding, vqz.CODING_RANS_GLOBAL)
+
+        with self.assertRaises(vqz.VQZError):
+            vqz.decode(blob)
+        with self.assertRaises(vqz.VQZError):
+            vqz.decode(blob, vqz.normalize_frequencies(np.ones(64), keep_all=True))
+
+    def test_empty_grid(self):
+        header = self.header(tiles=0)
+        blob = self.round_trip(np.zeros((0, 8, 8), dtype=np.int64), header)
+        self.assertEqual(len(blob), vqz.HEADER.size)
+
+    def test_single_symbol(self):
+        freqs = vqz.normalize_frequencies(np.bincount([5] * 300, minlength=16))
+        self.assertEqual(freqs[5], vqz.PROB_SCALE)
+        stream = vqz.rans_encode(np.full(300, 5), freqs)
+        np.testing.assert_array_equal(vqz.rans_decode(stream, 0, 300, freqs), np.full(300, 5))
+
+        header = self.header(grid=16)
+        self.round_trip(np.full((1, 16, 16), 5), header)
+        self.assertEqual(header.coding, vqz.CODING_RANS)
+
+    def test_out_of_range_index_is_rejected(self):
+        with self.assertRaises(vqz.VQZError):
+            vqz.encode(np.full((1, 8, 8), 16), self.header(bits=4))
+
+    def test_truncated_data_raises_vqz_error(self):
+        indices = self.skewed()
+        global_freqs = vqz.normalize_frequencies(np.bincount(indices.ravel(), minlength=64), keep_all=True)
+        blobs = [
+            vqz.encode(np.random.default_rng(0).integers(0, 16, size=(1, 8, 8)), self.header()),
+            vqz.encode(indices, self.header(grid=16, bits=6)),
+            vqz.encode(indices, self.header(grid=16, bits=6), global_freqs),
+        ]
+        for blob in blobs:
+            for end in range(len(blob)):
+                with self.subTest(coding=blob[5], end=end), self.assertRaises(vqz.VQZError):
+                    vqz.decode(blob[:end], global_freqs)
+
+    def test_bad_magic_version_and_coding(self):
+        blob = bytearray(vqz.encode(np.zeros((1, 8, 8), dtype=np.int64), self.header()))
+        for offset, value, message in [(0, ord('X'), 'Not a .vqz file'), (3, 9, 'version'), (5, 7, 'coding')]:
+            corrupt = bytearray(blob)
+            corrupt[offset] = value
+            with self.subTest(message=message), self.assertRaisesMessage(vqz.VQZError, message):
+                vqz.decode(bytes(corrupt))
+
+
+@skipUnless(torch, 'needs torch')
+class VectorQuantizerTests(SimpleTestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        # Chunks smaller than the input, and not a divisor of it
+        self.quantizer = VectorQuantizerEMA(num_embeddings=16, embedding_dim=4, chunk_size=7).double()
+        self.flat = torch.randn(50, 4, dtype=torch.float64)
+
+    def assert_matches_cdist(self):
+        expected = torch.cdist(self.flat, self.quantizer.embedding.t()).argmin(dim=1)
+        self.assertTrue(torch.equal(self.quantizer.nearest(self.flat), expected))
+        self.assertTrue(torch.allclose(self.quantizer.embedding_sq_norm, (self.quantizer.embedding ** 2).sum(dim=0)))
+
+    def test_chunked_search_matches_cdist(self):
+        self.assert_matches_cdist()
+
+    def test_norms_refresh_after_load_state_dict(self):
+        other = VectorQuantizerEMA(num_embeddings=16, embedding_dim=4).double()
+        self.quantizer.load_state_dict(other.state_dict())
+        self.assertTrue(torch.equal(self.quantizer.embedding, other.embedding))
+        self.assert_matches_cdist()
+
+    def test_norms_refresh_after_ema_step(self):
+        before = self.quantizer.embedding.clone()
+        self.quantizer.train()
+        self.quantizer(self.flat.view(2, 5, 5, 4).permute(0, 3, 1, 2))
+        self.assertFalse(torch.equal(self.quantizer.embedding, before))
+        self.quantizer.eval()
+        self.assert_matches_cdist()
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            (None, None),
+            ('bytes=0-3', (0, 3)),
+            ('bytes=5-', (5, 9)),
+            ('bytes=5-100', (5, 9)),
+            ('bytes=-3', (7, 9)),
+            ('bytes=-30', (0, 9)),
+            # Malformed, reversed and multi-range headers send the whole file
+            ('bytes=-', None),
+            ('bytes=4-2', None),
+            ('items=0-3', None),
+            ('bytes=0-1,3-4', None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 10), expected)
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=10-', 'bytes=10-20', 'bytes=-0'):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_range(header, 10)
+
+
+@override_settings(MEDIA_OFFLOAD='')
+class DownloadTests(ImageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(100))
+        self.etag = f'"{sha256(self.data).hexdigest()}"'
+        self.image.processed_image.save('processed.bin', ContentFile(self.data))
+        self.url = f'/image/download/{self.image.pk}/'
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertIn('Last-Modified', response)
+        # The hash is stored for rows that predate it
+        self.assertEqual(f'"{Image.objects.get(pk=self.image.pk).processed_hash}"', self.etag)
+
+    def test_revalidation_is_304(self):
+        response = self.client.get(self.url, headers={'If-None-Match': self.etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertNotIn('Content-Disposition', response)
+
+    def test_versioned_url_is_immutable(self):
+        response = self.client.get(self.url, {'v': self.etag.strip('"')})
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_range_is_206(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.body(response), self.data[10:20])
+
+    def test_if_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=-5', 'If-Range': self.etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[-5:])
+
+        # A stale validator gets the whole, current file
+        response = self.client.get(self.url, headers={'Range': 'bytes=-5', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_unsatisfiable_range_is_416(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-'})
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_multiple_ranges_fall_back_to_200(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-1,5-6'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Range', response)
+        self.assertEqual(self.body(response), self.data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UploadHandlerTests(SimpleTestCase):
+    def upload(self, files, **options):
+        """Parse a multipart request of ``files`` through the handler; returns (FILES, handler)"""
+        request = RequestFactory().post('/', files)
+        handler = StreamingImageUploadHandler(request, **options)
+        request.upload_handlers = [handler]
+        return request.FILES, handler
+
+    def test_type_is_sniffed_not_taken_from_the_client(self):
+        data = png_bytes()
+        files, handler = self.upload({'image': SimpleUploadedFile('photo.txt', data, 'text/plain')})
+
+        upload = files['image']
+        self.assertEqual(upload.content_type, 'image/png')
+        self.assertEqual(upload.size, len(data))
+        self.assertEqual(upload.content_hash, sha256(data).hexdigest())
+        self.assertEqual(upload.read(), data)
+        self.assertEqual(handler.rejected, [])
+
+    def test_spoofed_content_type_is_415(self):
+        files, handler = self.upload({
+            'image': SimpleUploadedFile('photo.png', b'<?php echo "not an image"; ?>', 'image/png'),
+            'short': SimpleUploadedFile('tiny.png', b'\x89PNG', 'image/png'),
+        })
+
+        self.assertNotIn('image', files)
+        self.assertNotIn('short', files)
+        self.assertEqual([(item['name'], item['status']) for item in handler.rejected], [('photo.png', 415), ('tiny.png', 415)])
+
+    def test_file_over_the_limit_is_413_and_others_still_arrive(self):
+        files, handler = self.upload(
+            {'big': SimpleUploadedFile('big.png', png_bytes() + bytes(200), 'image/png'),
+             'small': SimpleUploadedFile('small.gif', b'GIF89a' + bytes(10), 'image/gif')},
+            max_size=100,
+        )
+
+        self.assertNotIn('big', files)
+        self.assertEqual(files['small'].content_type, 'image/gif')
+        self.assertEqual(handler.rejected[0]['status'], 413)
+        self.assertEqual(handler.rejected[0]['error'], 'File is larger than the 100 byte limit')
+
+    def test_oversized_request_is_refused_unparsed(self):
+        files, handler = self.upload({'image': SimpleUploadedFile('a.png', png_bytes(), 'image/png')}, max_request_size=10)
+
+        self.assertEqual(len(files), 0)
+        self.assertEqual(handler.rejected[0]['status'], 413)
+        self.assertEqual(handler.rejected[0]['error'], 'Upload is larger than the 10 byte limit')
+
+    def test_archives_only_with_max_archive_size(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.png', png_bytes() + bytes(1000))
+        upload = lambda: {'files': SimpleUploadedFile('photos.zip', archive.getvalue(), 'application/zip')}
+
+        files, handler = self.upload(upload())
+        self.assertEqual(handler.rejected[0]['status'], 415)
+
+        # Larger than an image may be, within the archive limit
+        files, handler = self.upload(upload(), max_size=500, max_archive_size=10 * 1024)
+        self.assertEqual(files['files'].content_type, 'application/zip')
+        self.assertEqual(handler.rejected, [])
+
+
+class UploadImageTests(ImageTestCase):
+    def test_upload_stores_sniffed_file_and_hash(self):
+        data = png_bytes('green')
+        with mock.patch.object(job_queue, 'autostart', False):
+            response = self.client.post('/image/upload/', {'image': SimpleUploadedFile('photo.jpg', data, 'image/jpeg')})
+
+        self.assertEqual(response.status_code, 200)
+        row = Image.objects.get(pk=response.json()['image']['id'])
+        self.assertEqual(row.content_hash, sha256(data).hexdigest())
+        self.assertEqual(row.image.read(), data)
+
+    @override_settings(MAX_FILE_SIZE=100)
+    def test_oversized_upload_reports_the_request_limit(self):
+        response = self.client.post('/image/upload/', {'image': SimpleUploadedFile('a.png', bytes(70 * 1024), 'image/png')})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertIn(f'{100 + 64 * 1024} byte limit', response.json()['error'])
+
+
+class QualitySearchTests(SimpleTestCase):
+    def setUp(self):
+        self.img = PILImage.linear_gradient('L').resize((64, 64)).convert('RGB')
+        self.qualities = []
+        # Scores rise with quality: SSIM quality / 100 and PSNR quality dB
+        patch = mock.patch.object(ImageMetrics, 'measure', lambda metrics, data: {'ssim': len(data) / 10000, 'psnr': len(data) / 100})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def encode(self, img, quality):
+        # Output size grows with quality: 100 bytes per step
+        self.qualities.append(quality)
+        return bytes(quality * 100)
+
+    def test_byte_target_stops_within_tolerance(self):
+        result = search_quality(self.img, self.encode, max_bytes=5000)
+
+        # 4900 bytes is within 5% of the target, so 50 is never tried
+        self.assertEqual((result['quality'], result['target_met']), (49, True))
+        self.assertEqual(self.qualities, [52, 30, 41, 46, 49])
+        self.assertEqual(result['encodes'], 5)
+
+    def test_ssim_target_finds_lowest_quality(self):
+        result = search_quality(self.img, self.encode, min_ssim=0.8)
+        self.assertEqual((result['quality'], result['ssim'], result['target_met']), (80, 0.8, True))
+
+    def test_psnr_target_without_early_stop(self):
+        result = search_quality(self.img, self.encode, min_psnr=60.1)
+
+        self.assertEqual((result['quality'], result['target_met']), (61, True))
+        # Each quality is encoded once, however often the search revisits it
+        self.assertEqual(len(self.qualities), len(set(self.qualities)))
+
+    def test_unreachable_targets_return_closest_end(self):
+        result = search_quality(self.img, self.encode, max_bytes=500)
+        self.assertEqual((result['quality'], result['target_met']), (MIN_QUALITY, False))
+
+        result = search_quality(self.img, self.encode, min_ssim=0.99)
+        self.assertEqual((result['quality'], result['target_met']), (MAX_QUALITY, False))
+
+    def test_target_is_required(self):
+        with self.assertRaises(ValueError):
+            search_quality(self.img, self.encode)
+
+
+class QualityMetricTests(SimpleTestCase):
+    def test_identical_images(self):
+        a = np.random.default_rng(0).uniform(0, 255, size=(32, 32))
+        self.assertAlmostEqual(ssim(a, a), 1.0)
+        self.assertEqual(psnr(a, a), MAX_PSNR)
+
+    def test_known_psnr(self):
+        a = np.zeros((8, 8))
+        self.assertAlmostEqual(psnr(a, a + 1), 20 * np.log10(255), places=6)
+
+    def test_ssim_drops_with_noise(self):
+        rng = np.random.default_rng(0)
+        a = np.tile(np.linspace(0, 255, 32), (32, 1))
+        slight, heavy = a + rng.normal(0, 2, a.shape), a + rng.normal(0, 40, a.shape)
+        self.assertGreater(ssim(a, slight), ssim(a, heavy))
+        self.assertAlmostEqual(ssim(a, heavy), ssim(heavy, a))
+        self.assertLess(ssim(a, heavy), 0.9)
+
+    def test_jpeg_search_meets_ssim_target(self):
+        img = PILImage.linear_gradient('L').resize((64, 64)).convert('RGB')
+        encode = lambda img, quality: ENCODERS['JPEG'].encode(img, quality)
+
+        result = search_quality(img, encode, min_ssim=0.95)
+
+        self.assertTrue(result['target_met'])
+        self.assertGreaterEqual(ImageMetrics(img).measure(result['data'])['ssim'], 0.95)
+
+
+class CaptionCacheTests(SimpleTestCase):
+    # Has bit 63 set, so the disk tier stores it as a negative integer
+    KEY = 0xF0E1D2C3B4A59687
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(lambda: [os.remove(path) for path in (self.path, self.path + '-wal', self.path + '-shm') if os.path.exists(path)])
+        self.now = 1000.0
+        self.enterContext(mock.patch.object(time, 'time', lambda: self.now))
+
+    def cache(self, **kwargs):
+        return CaptionCache(path=self.path, **kwargs)
+
+    def rows(self):
+        with sqlite3.connect(self.path) as conn:
+            return [row[0] for row in conn.execute('SELECT caption FROM captions ORDER BY caption')]
+
+    def flip(self, *bits):
+        return self.KEY ^ sum(1 << bit for bit in bits)
+
+    def spread(self, i):
+        # i in every band, so distinct values are at least BANDS bits apart
+        return i * 0x0001000100010001
+
+    def test_disk_lookup_matches_within_distance(self):
+        self.cache().set(self.KEY, 'a cat')
+        # A fresh instance has an empty memory tier, so lookups go to disk
+        cache = self.cache()
+
+        self.assertEqual(cache.get(self.KEY), 'a cat')
+        # Three bits in three different bands: the fourth band still matches
+        self.assertEqual(cache.get(self.flip(0, 16, 32)), 'a cat')
+        # Four bits, one in every band, is past max_distance anyway
+        self.assertIsNone(cache.get(self.flip(0, 16, 32, 48)))
+
+    def test_disk_lookup_prefers_the_closest_hash(self):
+        cache = self.cache()
+        cache.set(self.flip(1, 2), 'farther')
+        cache.set(self.flip(1), 'closer')
+
+        self.assertEqual(self.cache().get(self.KEY), 'closer')
+
+    def test_wide_distance_scans_every_row(self):
+        # With max_distance >= BANDS no band is sure to match, so none is required
+        self.cache().set(self.KEY, 'a cat')
+        self.assertEqual(self.cache(max_distance=4).get(self.flip(0, 16, 32, 48)), 'a cat')
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.cache(ttl=60)
+        cache.set(self.KEY, 'a cat')
+
+        self.now += 60
+        self.assertIsNone(cache.get(self.KEY))
+        self.assertIsNone(self.cache(ttl=60).get(self.KEY))
+
+    def test_disk_tier_prunes_every_few_writes(self):
+        cache = self.cache(ttl=60, disk_max_entries=3, prune_every=3)
+        counts = []
+        for i in range(5):
+            cache.set(self.spread(i), f'caption {i}')
+            counts.append(len(self.rows()))
+            self.now += 1
+        # Pruned on the first write and again on the fourth, down to the three newest
+        self.assertEqual(counts, [1, 2, 3, 3, 4])
+        self.assertIsNone(self.cache().get(self.spread(0)))
+        self.assertEqual(self.cache().get(self.spread(1)), 'caption 1')
+
+        # The next prune also drops rows past their ttl, under the row limit or not
+        self.now += 60
+        for i in range(5, 7):
+            cache.set(self.spread(i), f'caption {i}')
+        self.assertEqual(self.rows(), ['caption 5', 'caption 6'])
@@ -1,11 +1,12 @@
+import hashlib
 import os
-import requests
 import logging
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from urllib.parse import urlparse
-import tempfile
+from django.core.files.base import ContentFile
+from .http_client import PooledHTTPClient, AsyncPooledHTTPClient
+from .dedup_cache import ProcessedImageCache
+from .models import STARTABLE, StatusConflict
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +17,38 @@ class ClickDropTextRemovalService:
         self.api_key = getattr(settings, 'CLICKDROP_API_KEY', '')
         self.api_url = getattr(settings, 'CLICKDROP_API_URL', 'https://api.clickdrop.co/api/v1')
         
+        # One keep-alive session shared by every worker thread
+        self.http = PooledHTTPClient(
+            pool_connections=getattr(settings, 'CLICKDROP_POOL_CONNECTIONS', 4),
+            pool_maxsize=getattr(settings, 'CLICKDROP_POOL_MAXSIZE', 10),
+            max_per_host=getattr(settings, 'CLICKDROP_MAX_CONCURRENCY_PER_HOST', 4),
+            connect_timeout=getattr(settings, 'CLICKDROP_CONNECT_TIMEOUT', 5.0),
+            read_timeout=getattr(settings, 'CLICKDROP_READ_TIMEOUT', 60.0),
+        )
+        # Same limits for the async views, which use httpx
+        self.async_http = AsyncPooledHTTPClient(
+            pool_maxsize=getattr(settings, 'CLICKDROP_POOL_MAXSIZE', 10),
+            max_per_host=getattr(settings, 'CLICKDROP_MAX_CONCURRENCY_PER_HOST', 4),
+            connect_timeout=getattr(settings, 'CLICKDROP_CONNECT_TIMEOUT', 5.0),
+            read_timeout=getattr(settings, 'CLICKDROP_READ_TIMEOUT', 60.0),
+        )
+        
+        # Results are reused for uploads whose bytes were already processed
+        self.cache = ProcessedImageCache(
+            max_bytes=getattr(settings, 'PROCESSED_CACHE_MAX_BYTES', 0),
+        )
+        
         if not self.api_key:
             logger.warning("ClickDrop API key not configured. Set CLICKDROP_API_KEY environment variable.")
     
-    def remove_text_from_image(self, image_instance):
-        """Remove text from an image using ClickDrop API"""
+    def remove_text_from_image(self, image_instance, from_states=STARTABLE):
+        """
+        Remove text from an image using ClickDrop API. Raises StatusConflict
+        when the image is not in one of ``from_states``, e.g. already being
+        processed, or when another run completed it meanwhile; the job queue
+        passes RESUMABLE so a retry can resume a run a crashed worker left
+        'processing'.
+        """
         
         if not self.api_key:
             return {
@@ -28,88 +56,174 @@ class ClickDropTextRemovalService:
                 'error': 'API key not configured'
             }
         
+        claimed = False
         try:
-            # Update status to processing
-            image_instance.text_removal_status = 'processing'
-            image_instance.save()
-            
-            # Prepare the image file for API
-            image_path = image_instance.image.path
+            cached_result = self._start(image_instance, from_states)
+            if cached_result:
+                return cached_result
+            claimed = True
             
             # Make API request to Clipdrop (synchronous binary response)
-            with open(image_path, 'rb') as image_file:
-                files = {'image_file': image_file}
-                headers = {'x-api-key': self.api_key}
-                
-                response = requests.post(
+            with open(image_instance.image.path, 'rb') as image_file:
+                response = self.http.post(
                     f'{self.api_url}/remove-text/v1',
-                    files=files,
-                    headers=headers,
-                    timeout=60
+                    files={'image_file': image_file},
+                    headers={'x-api-key': self.api_key}
                 )
             
-            if response.status_code == 200:
-                # Response is image bytes; save directly as processed image
-                try:
-                    # Create a temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                        temp_file.write(response.content)
-                        temp_file_path = temp_file.name
-
-                    # Save to Django model
-                    with open(temp_file_path, 'rb') as f:
-                        original_filename = os.path.basename(image_instance.image.name)
-                        processed_filename = f"processed_{original_filename}"
-
-                        image_instance.processed_image.save(
-                            processed_filename,
-                            File(f),
-                            save=True
-                        )
-
-                    # Clean up temp file
-                    os.unlink(temp_file_path)
-
-                    # Update status
-                    image_instance.text_removal_status = 'completed'
-                    image_instance.text_removed = True
-                    image_instance.save()
+            if response.status_code != 200:
+                raise Exception(self._api_error(response))
+            return self._complete(image_instance, response.content)
+                
+        except StatusConflict:
+            raise
+        except Exception as e:
+            return self._fail(image_instance, e)
+        except BaseException:
+            # Interrupted mid-run: release the claim so the image can be retried
+            if claimed:
+                image_instance.release('text_removal_status', 'Text removal was interrupted')
+            raise
+    
+    async def aremove_text_from_image(self, image_instance, from_states=STARTABLE):
+        """Async variant of remove_text_from_image for ASGI views.
 
-                    return {
-                        'success': True,
-                        'status': 'completed',
-                        'message': 'Text removal completed successfully',
-                        'processed_image_url': image_instance.processed_image.url
-                    }
-                except Exception as save_err:
-                    raise Exception(f"Failed to save processed image: {str(save_err)}")
+        The ClickDrop call goes through the async HTTP client, so the event
+        loop keeps serving other requests while the API works.
+        """
+        
+        if not self.api_key:
+            return {
+                'success': False,
+                'error': 'API key not configured'
+            }
+        
+        claimed = False
+        try:
+            cached_result = await sync_to_async(self._start)(image_instance, from_states)
+            if cached_result:
+                return cached_result
+            claimed = True
             
-            else:
-                error_msg = f"API request failed with status {response.status_code}"
-                # Try to parse an error body
-                try:
-                    error_data = response.json()
-                    if isinstance(error_data, dict):
-                        error_msg = error_data.get('error', error_data.get('message', error_msg))
-                except Exception:
-                    # Fall back to text preview (often HTML for blocked/invalid requests)
-                    preview = response.text[:200] if hasattr(response, 'text') else '<no text>'
-                    error_msg = f"{error_msg}. Preview: {preview}"
-
-                raise Exception(error_msg)
+            image_bytes = await sync_to_async(self._read_image)(image_instance)
+            response = await self.async_http.post(
+                f'{self.api_url}/remove-text/v1',
+                files={'image_file': (os.path.basename(image_instance.image.name), image_bytes)},
+                headers={'x-api-key': self.api_key}
+            )
+            
+            if response.status_code != 200:
+                raise Exception(self._api_error(response))
+            return await sync_to_async(self._complete)(image_instance, response.content)
                 
+        except StatusConflict:
+            raise
         except Exception as e:
-            logger.error(f"Text removal failed for image {image_instance.id}: {str(e)}")
-            
-            # Update status to failed
-            image_instance.text_removal_status = 'failed'
-            image_instance.text_removal_error = str(e)
-            image_instance.save()
+            return await sync_to_async(self._fail)(image_instance, e)
+        except BaseException:
+            # Cancelled (the client went away): release the claim so later
+            # requests are not refused with 409 for good
+            if claimed:
+                await image_instance.arelease('text_removal_status', 'Text removal was interrupted')
+            raise
+    
+    def _read_image(self, image_instance):
+        with open(image_instance.image.path, 'rb') as image_file:
+            return image_file.read()
+    
+    def _start(self, image_instance, from_states=STARTABLE):
+        """Reuse a cached result if there is one, otherwise mark the image processing"""
+        # Identical uploads share one processed result
+        if not image_instance.content_hash:
+            image_instance.content_hash = self.cache.hash_file(image_instance.image)
+        cached_name = self.cache.lookup(image_instance.content_hash, exclude_id=image_instance.id)
+        if cached_name:
+            image_instance.processed_image.name = cached_name
+            image_instance.processed_hash = None  # hashed on first download
+            image_instance.text_removed = True
+            image_instance.text_removal_error = None
+            image_instance.transition(
+                'text_removal_status', 'completed', from_states,
+                update_fields=['content_hash', 'processed_image', 'processed_hash', 'text_removed', 'text_removal_error'],
+            )
             
             return {
-                'success': False,
-                'error': str(e)
+                'success': True,
+                'status': 'completed',
+                'cached': True,
+                'message': 'Text removal result reused from an identical upload',
+                'processed_image_url': image_instance.processed_image.url
             }
+        
+        # Claim the image; a concurrent run gets StatusConflict
+        image_instance.transition('text_removal_status', 'processing', from_states, update_fields=['content_hash'])
+        return None
+    
+    def _complete(self, image_instance, content):
+        """Store the processed image bytes and mark the image completed"""
+        
+        # Response is image bytes; stream them straight into storage
+        try:
+            original_filename = os.path.basename(image_instance.image.name)
+            processed_filename = f"processed_{original_filename}"
+
+            image_instance.processed_image.save(
+                processed_filename,
+                ContentFile(content),
+                save=False
+            )
+            image_instance.processed_hash = hashlib.sha256(content).hexdigest()
+        except Exception as save_err:
+            raise Exception(f"Failed to save processed image: {str(save_err)}")
+
+        # Update status, writing only the result columns
+        image_instance.text_removed = True
+        try:
+            image_instance.transition(
+                'text_removal_status', 'completed', ['processing'],
+                update_fields=['processed_image', 'processed_hash', 'text_removed'],
+            )
+        except StatusConflict:
+            # Another run finished or reset the image first; its result stands
+            # and the file just written would be referenced by nothing
+            image_instance.processed_image.delete(save=False)
+            raise
+        self.cache.record(image_instance.processed_image.name)
+
+        return {
+            'success': True,
+            'status': 'completed',
+            'cached': False,
+            'message': 'Text removal completed successfully',
+            'processed_image_url': image_instance.processed_image.url
+        }
+    
+    def _api_error(self, response):
+        """Best-effort error message from a failed API response"""
+        
+        error_msg = f"API request failed with status {response.status_code}"
+        # Try to parse an error body
+        try:
+            error_data = response.json()
+            if isinstance(error_data, dict):
+                error_msg = error_data.get('error', error_data.get('message', error_msg))
+        except Exception:
+            # Fall back to text preview (often HTML for blocked/invalid requests)
+            preview = response.text[:200] if hasattr(response, 'text') else '<no text>'
+            error_msg = f"{error_msg}. Preview: {preview}"
+        return error_msg
+    
+    def _fail(self, image_instance, error):
+        logger.error(f"Text removal failed for image {image_instance.id}: {str(error)}")
+        
+        # Update status to failed
+        image_instance.text_removal_error = str(error)
+        image_instance.transition('text_removal_status', 'failed', update_fields=['text_removal_error'])
+        
+        return {
+            'success': False,
+            'error': str(error)
+        }
     
     def check_task_status(self, image_instance):
         """Check the status of a text removal task"""
@@ -130,34 +244,23 @@ class ClickDropTextRemovalService:
         
         try:
             # Download the processed image
-            response = requests.get(image_url, timeout=60)
+            response = self.http.get(image_url)
             response.raise_for_status()
             
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
-            
-            # Save to Django model
-            with open(temp_file_path, 'rb') as f:
-                # Generate filename
-                original_filename = os.path.basename(image_instance.image.name)
-                processed_filename = f"processed_{original_filename}"
-                
-                # Save the processed image
-                image_instance.processed_image.save(
-                    processed_filename,
-                    File(f),
-                    save=True
-                )
+            # Generate filename
+            original_filename = os.path.basename(image_instance.image.name)
+            processed_filename = f"processed_{original_filename}"
             
-            # Clean up temp file
-            os.unlink(temp_file_path)
+            # Save the processed image without an intermediate file
+            image_instance.processed_image.save(
+                processed_filename,
+                ContentFile(response.content),
+                save=False
+            )
             
             # Update status
-            image_instance.text_removal_status = 'completed'
             image_instance.text_removed = True
-            image_instance.save()
+            image_instance.transition('text_removal_status', 'completed', update_fields=['processed_image', 'text_removed'])
             
             return {
                 'success': True,
@@ -170,9 +273,8 @@ class ClickDropTextRemovalService:
             logger.error(f"Failed to download processed image for {image_instance.id}: {str(e)}")
             
             # Update status to failed
-            image_instance.text_removal_status = 'failed'
             image_instance.text_removal_error = f"Failed to download processed image: {str(e)}"
-            image_instance.save()
+            image_instance.transition('text_removal_status', 'failed', update_fields=['text_removal_error'])
             
             return {
                 'success': False,
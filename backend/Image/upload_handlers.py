@@ -0,0 +1,199 @@
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+# Leading bytes identifying each image type an upload may have
+MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+# Archives a batch upload may carry images in; plain tar is recognised by
+# the 'ustar' magic at offset 257
+ARCHIVE_MAGIC_NUMBERS = [
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'BZh', 'application/x-bzip2'),
+    (b'\xfd7zXZ\x00', 'application/x-xz'),
+]
+ARCHIVE_TYPES = [content_type for _, content_type in ARCHIVE_MAGIC_NUMBERS] + ['application/x-tar']
+SNIFF_BYTES = 12
+ARCHIVE_SNIFF_BYTES = 262
+COPY_CHUNK_SIZE = 64 * 1024
+# Allowance for form fields and multipart framing around a single file
+FORM_OVERHEAD = 64 * 1024
+
+
+def sniff_content_type(head):
+    """Image MIME type from the first SNIFF_BYTES of a file, or None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    return None
+
+
+def sniff_archive_type(head):
+    """Archive MIME type from the first ARCHIVE_SNIFF_BYTES of a file, or None"""
+    if head[257:262] == b'ustar':
+        return 'application/x-tar'
+    for magic, content_type in ARCHIVE_MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    return None
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    An upload written to a temporary file under MEDIA_ROOT. Storage moves
+    it into place with a rename instead of copying it, as it has
+    temporary_file_path().
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra, directory):
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=directory)
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.content_hash = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Already moved into storage
+            pass
+
+
+def spool_image(stream, name, max_size=None, allowed_types=None):
+    """
+    Copy an image read from ``stream`` (e.g. an archive member) to a
+    StreamedUploadedFile, sniffing its type and hashing it on the way, with
+    the same checks as StreamingImageUploadHandler.
+    Returns: (file, None), or (None, (status, error)) when it is refused
+    """
+    max_size = max_size if max_size is not None else getattr(settings, 'MAX_FILE_SIZE', 5 * 1024 * 1024)
+    allowed_types = allowed_types if allowed_types is not None else getattr(settings, 'ALLOWED_IMAGE_TYPES', [])
+    head = stream.read(SNIFF_BYTES)
+    content_type = sniff_content_type(head)
+    if content_type is None or content_type not in allowed_types:
+        return None, (415, f"Unsupported file type, use one of {', '.join(allowed_types)}")
+
+    directory = os.path.join(settings.MEDIA_ROOT, '.uploads')
+    os.makedirs(directory, exist_ok=True)
+    file = StreamedUploadedFile(name, content_type, None, None, directory)
+    digest = hashlib.sha256(head)
+    file.write(head)
+    size = len(head)
+    # Reads at most one chunk past the limit, whatever size the archive claims
+    while chunk := stream.read(COPY_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            file.close()
+            return None, (413, f'File is larger than the {max_size} byte limit')
+        digest.update(chunk)
+        file.write(chunk)
+    file.seek(0)
+    file.size = size
+    file.content_hash = digest.hexdigest()
+    return file, None
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams each file straight to a temporary file
+    beside storage while it hashes the bytes (SHA-256, kept as
+    ``content_hash``), and checks the upload as it arrives:
+
+    - the type is sniffed from the first bytes, ignoring the client's
+      Content-Type, and must be in ALLOWED_IMAGE_TYPES;
+    - a file is dropped as soon as it passes MAX_FILE_SIZE;
+    - with ``max_request_size``, a request whose Content-Length is larger
+      is refused before any of it is parsed;
+    - with ``max_archive_size``, zip and tar files (ARCHIVE_TYPES) up to
+      that size are accepted too, for the caller to unpack.
+
+    Rejected files are skipped (other files in the request still arrive)
+    and listed in ``rejected`` with the HTTP status to answer.
+    """
+
+    def __init__(self, request=None, max_size=None, allowed_types=None, max_request_size=None, max_archive_size=None):
+        super().__init__(request)
+        self.max_size = max_size if max_size is not None else getattr(settings, 'MAX_FILE_SIZE', 5 * 1024 * 1024)
+        self.allowed_types = allowed_types if allowed_types is not None else getattr(settings, 'ALLOWED_IMAGE_TYPES', [])
+        self.max_request_size = max_request_size
+        self.max_archive_size = max_archive_size
+        self.sniff_bytes = SNIFF_BYTES if max_archive_size is None else ARCHIVE_SNIFF_BYTES
+        self.directory = os.path.join(settings.MEDIA_ROOT, '.uploads')
+        self.rejected = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if self.max_request_size is not None and content_length > self.max_request_size:
+            self.rejected.append({
+                'field': None,
+                'name': None,
+                'status': 413,
+                'error': f'Upload is larger than the {self.max_request_size} byte limit',
+            })
+            # Handled: nothing is parsed
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = StreamedUploadedFile(self.file_name, self.content_type, self.charset, self.content_type_extra, self.directory)
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.sniffed = None
+        self.limit = self.max_size
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.sniffed is None and len(self.head) < self.sniff_bytes:
+            self.head += raw_data[:self.sniff_bytes - len(self.head)]
+            if len(self.head) == self.sniff_bytes:
+                self._check_type()
+        if self.size > self.limit:
+            self._reject(413, f'File is larger than the {self.limit} byte limit')
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        # Consumed; no other handler sees the chunk
+        return None
+
+    def file_complete(self, file_size):
+        if self.sniffed is None:
+            # Files shorter than the sniffed prefix
+            try:
+                self._check_type()
+            except SkipFile:
+                return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_type = self.sniffed
+        self.file.content_hash = self.digest.hexdigest()
+        return self.file
+
+    def _check_type(self):
+        self.sniffed = sniff_content_type(self.head)
+        if self.sniffed is None and self.max_archive_size is not None:
+            self.sniffed = sniff_archive_type(self.head)
+            if self.sniffed is not None:
+                self.limit = self.max_archive_size
+                return
+        if self.sniffed is None or self.sniffed not in self.allowed_types:
+            self._reject(415, f"Unsupported file type, use one of {', '.join(self.allowed_types)}")
+
+    def _reject(self, status, error):
+        self.rejected.append({'field': self.field_name, 'name': self.file_name, 'status': status, 'error': error})
+        self.file.close()
+        raise SkipFile(error)
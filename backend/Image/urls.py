@@ -1,16 +1,23 @@
 from django.urls import path, include
 from . import views
 
-from .image_to_text_api import ImageToTextAPIView
+from .image_to_text_api import image_to_text
 
 urlpatterns = [
     path('upload/', views.upload_image, name='upload_image'),
+    path('list/', views.image_list, name='image_list'),
+    path('upload-batch/', views.upload_batch, name='upload_batch'),
+    path('batch-status/<str:batch_id>/', views.batch_status, name='batch_status'),
     path('remove-text/<int:image_id>/', views.remove_text, name='remove_text'),
     path('status/<int:image_id>/', views.check_text_removal_status, name='check_status'),
     path('details/<int:image_id>/', views.get_image_details, name='get_image_details'),
     path('download/<int:image_id>/', views.download_processed, name='download_processed'),
     path('compress/<int:image_id>/', views.compress_image, name='compress_image'),
+    path('compress-batch/', views.compress_batch, name='compress_batch'),
     path('compression-status/<int:image_id>/', views.check_compression_status, name='check_compression_status'),
     path('download-compressed/<int:image_id>/', views.download_compressed, name='download_compressed'),
-    path('image2text/', ImageToTextAPIView.as_view(), name='image_to_text'),
+    path('download-codes/<int:image_id>/', views.download_codes, name='download_codes'),
+    path('<int:image_id>/rendition/', views.rendition, name='rendition'),
+    path('metrics/', views.cache_metrics, name='cache_metrics'),
+    path('image2text/', image_to_text, name='image_to_text'),
 ]
\ No newline at end of file
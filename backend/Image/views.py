@@ -1,17 +1,85 @@
-from django.http import JsonResponse, FileResponse, HttpResponseNotFound
+from django.http import JsonResponse, HttpResponseNotFound, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from .models import Image
+from .models import Image, STARTABLE, StatusConflict
 from .text_removal_service import text_removal_service
 from .compression_service import compression_service
+from .renditions import DEFAULT_FORMAT, rendition_cache
+from .downloads import serve_file, serve_path, stored_hash
+from .upload_handlers import FORM_OVERHEAD, StreamingImageUploadHandler
+from .bulk_ingest import batch_progress, ingest_batch
+from .listing import list_images
+from .job_queue import job_queue, QUEUED, RUNNING
+from .metrics import snapshot_all
+from .executors import run_blocking
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import TooManyFilesSent
+from django.urls import reverse
+from . import tasks  # noqa: F401 - registers queue tasks
+import asyncio
 import datetime
+import json
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
+def _request_data(request):
+    """Parameters from a JSON object body or form fields; raises ValueError on bad JSON"""
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('JSON body must be an object')
+        return data
+    return request.POST
+
+
+class JSONLinesStream:
+    """
+    NDJSON body for a StreamingHttpResponse from an async iterable of dicts
+    with a close() method, such as a CompressionBatch.
+
+    The source is closed when the stream ends, and also when Django closes
+    the response, which it does when the client goes away mid-stream, so a
+    suspended stream does not wait to be garbage collected to close it.
+    The source's close() must be safe to call more than once.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.closing = None
+
+    async def __aiter__(self):
+        try:
+            async for item in self.source:
+                yield json.dumps(item) + '\n'
+        finally:
+            await sync_to_async(self.source.close)()
+
+    def close(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # The ASGI handler closes responses from a worker thread
+            self.source.close()
+            return
+        # Closed on the event loop, where the ORM can't run: close the
+        # source from a task rather than blocking the loop
+        self.closing = loop.create_task(sync_to_async(self.source.close)())
+
+
 @csrf_exempt
-def upload_image(request):
+async def upload_image(request):
     if request.method == "POST":
+        # Stream the file to disk, hashing and validating it as it arrives;
+        # parsing runs off the event loop
+        handler = StreamingImageUploadHandler(request, max_request_size=settings.MAX_FILE_SIZE + FORM_OVERHEAD)
+        request.upload_handlers = [handler]
+        await sync_to_async(lambda: request.FILES)()
+        if handler.rejected:
+            rejected = handler.rejected[0]
+            return JsonResponse({"error": rejected['error']}, status=rejected['status'])
+
         image_file = request.FILES.get("image")
         created_by = request.POST.get("created_by", "anonymous")
         
@@ -23,18 +91,28 @@ def upload_image(request):
             return JsonResponse({"error": "No image file provided."}, status=400)
 
         try:
-            # Create image instance
-            image_instance = Image.objects.create(
+            # Create image instance; the job id is reserved up front so the
+            # worker never sees a row without it
+            job_id = job_queue.new_job_id()
+            image_instance = await Image.objects.acreate(
                 image=image_file,
                 created_by=created_by,
                 date=date,
                 time=time,
+                content_hash=image_file.content_hash,
+                text_removal_job_id=job_id,
             )
             
             logger.info(f"Image {image_instance.id} uploaded successfully")
             
-            # Start text removal process
-            text_removal_result = text_removal_service.remove_text_from_image(image_instance)
+            # Queue text removal instead of waiting on ClickDrop
+            await sync_to_async(job_queue.enqueue)('remove_text', job_id=job_id, image_id=image_instance.id)
+            text_removal_result = {
+                'success': True,
+                'status': QUEUED,
+                'job_id': job_id,
+                'message': 'Text removal queued'
+            }
             
             # Return successful response with text removal status
             return JsonResponse({
@@ -60,14 +138,103 @@ def upload_image(request):
     return JsonResponse({"error": "POST request required."}, status=405)
 
 @csrf_exempt
-def remove_text(request, image_id):
+async def upload_batch(request):
+    """Ingest many images, sent as files and/or zip/tar archives, as one batch with queued text removal"""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required."}, status=405)
+
+    # Every file is streamed to disk and checked on its own; a bad file is
+    # reported per item instead of failing the whole batch
+    handler = StreamingImageUploadHandler(request, max_archive_size=settings.MAX_ARCHIVE_SIZE)
+    request.upload_handlers = [handler]
+    try:
+        await sync_to_async(lambda: request.FILES)()
+    except TooManyFilesSent:
+        return JsonResponse({"error": f"A batch holds at most {settings.DATA_UPLOAD_MAX_NUMBER_FILES} files"}, status=413)
+
+    files = [file for _, field_files in request.FILES.lists() for file in field_files]
+    rejected = [{'name': item['name'], 'status': item['status'], 'error': item['error']} for item in handler.rejected]
+    if not files and not rejected:
+        return JsonResponse({"error": "No image files provided."}, status=400)
+
+    created_by = request.POST.get("created_by", "anonymous")
+    date = request.POST.get("date", datetime.date.today().strftime("%Y-%m-%d"))
+    time = request.POST.get("time", datetime.datetime.now().strftime("%H:%M:%S"))
+
+    try:
+        # Archive unpacking, file moves and the bulk INSERT run off the event loop
+        batch = await sync_to_async(ingest_batch)(files, created_by, date, time)
+    except Exception as e:
+        logger.error(f"Error saving batch: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+    rejected += batch['rejected']
+    items = [
+        {
+            "name": os.path.basename(image.image.name),
+            "status": QUEUED,
+            "id": image.id,
+            "url": image.image.url,
+            "job_id": image.text_removal_job_id,
+        }
+        for image in batch['images']
+    ] + [
+        {"name": item['name'], "status": "rejected", "code": item['status'], "error": item['error']}
+        for item in rejected
+    ]
+    if not batch['images'] and not rejected:
+        # e.g. an empty archive, or one holding only .DS_Store/__MACOSX entries
+        return JsonResponse({"error": "No images found in upload"}, status=400)
+    if not batch['images']:
+        return JsonResponse({"error": "No images were accepted", "items": items}, status=rejected[0]['status'])
+
+    return JsonResponse({
+        "success": True,
+        "batch_id": batch['batch_id'],
+        "status_url": reverse('batch_status', args=[batch['batch_id']]),
+        "accepted": len(batch['images']),
+        "rejected": len(rejected),
+        "items": items,
+    }, status=202)
+
+@csrf_exempt
+async def batch_status(request, batch_id):
+    """Per-image text removal progress of a bulk upload"""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    progress = await sync_to_async(batch_progress)(batch_id)
+    if progress is None:
+        return JsonResponse({"error": "Batch not found"}, status=404)
+    return JsonResponse({"success": True, **progress})
+
+@csrf_exempt
+async def image_list(request):
+    """Images newest first, filtered and paginated with an opaque ``cursor``"""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    try:
+        page = await sync_to_async(list_images)(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    next_url = None
+    if page['next_cursor']:
+        query = request.GET.copy()
+        query['cursor'] = page['next_cursor']
+        next_url = f"{request.path}?{query.urlencode()}"
+    return JsonResponse({"success": True, **page, "next": next_url})
+
+@csrf_exempt
+async def remove_text(request, image_id):
     """Remove text from a specific image"""
     if request.method == "POST":
         try:
-            image_instance = Image.objects.get(id=image_id)
+            image_instance = await Image.objects.aget(id=image_id)
             
             # Start text removal process
-            result = text_removal_service.remove_text_from_image(image_instance)
+            result = await text_removal_service.aremove_text_from_image(image_instance)
             
             return JsonResponse({
                 "success": True,
@@ -81,6 +248,8 @@ def remove_text(request, image_id):
             
         except Image.DoesNotExist:
             return JsonResponse({"error": "Image not found"}, status=404)
+        except StatusConflict:
+            return JsonResponse({"error": "Text removal already in progress"}, status=409)
         except Exception as e:
             logger.error(f"Error removing text from image {image_id}: {e}")
             return JsonResponse({"error": str(e)}, status=500)
@@ -88,13 +257,39 @@ def remove_text(request, image_id):
     return JsonResponse({"error": "POST request required"}, status=405)
 
 @csrf_exempt
-def check_text_removal_status(request, image_id):
+async def check_text_removal_status(request, image_id):
     """Check the status of text removal for a specific image"""
     if request.method == "GET":
         try:
-            image_instance = Image.objects.get(id=image_id)
+            image_instance = await Image.objects.aget(id=image_id)
+            job = await sync_to_async(job_queue.get_job)(image_instance.text_removal_job_id)
             
-            if image_instance.clickdrop_task_id:
+            if job:
+                # Queued or running jobs (including retries after a failed
+                # attempt) are still in progress whatever the row says
+                status = image_instance.text_removal_status
+                if job['state'] == QUEUED:
+                    status = 'pending'
+                elif job['state'] == RUNNING:
+                    status = 'processing'
+                
+                return JsonResponse({
+                    "success": True,
+                    "status": status,
+                    "job": {
+                        "id": job['id'],
+                        "state": job['state'],
+                        "attempts": job['attempts'],
+                        "error": job['error']
+                    },
+                    "image": {
+                        "id": image_instance.id,
+                        "text_removal_status": image_instance.text_removal_status,
+                        "text_removed": image_instance.text_removed,
+                        "processed_image_url": image_instance.processed_image.url if image_instance.processed_image else None
+                    }
+                })
+            elif image_instance.clickdrop_task_id:
                 # Check status from ClickDrop API
                 result = text_removal_service.check_task_status(image_instance)
                 
@@ -125,11 +320,11 @@ def check_text_removal_status(request, image_id):
     return JsonResponse({"error": "GET request required"}, status=405)
 
 @csrf_exempt
-def get_image_details(request, image_id):
+async def get_image_details(request, image_id):
     """Get detailed information about an image including text removal status"""
     if request.method == "GET":
         try:
-            image_instance = Image.objects.get(id=image_id)
+            image_instance = await Image.objects.aget(id=image_id)
             
             return JsonResponse({
                 "success": True,
@@ -137,13 +332,15 @@ def get_image_details(request, image_id):
                     "id": image_instance.id,
                     "original_url": image_instance.image.url,
                     "processed_url": image_instance.processed_image.url if image_instance.processed_image else None,
+                    "processed_hash": image_instance.processed_hash,
                     "created_by": image_instance.created_by,
                     "date": image_instance.date,
                     "time": image_instance.time,
                     "text_removal_status": image_instance.text_removal_status,
                     "text_removed": image_instance.text_removed,
                     "text_removal_error": image_instance.text_removal_error,
-                    "clickdrop_task_id": image_instance.clickdrop_task_id
+                    "clickdrop_task_id": image_instance.clickdrop_task_id,
+                    "text_removal_job_id": image_instance.text_removal_job_id
                 }
             })
             
@@ -169,17 +366,16 @@ def download_processed(request, image_id):
     if not image.processed_image:
         return HttpResponseNotFound("Processed image not available")
 
-    response = FileResponse(image.processed_image.open('rb'), as_attachment=True, filename=image.processed_image.name.split('/')[-1])
-    return response
+    return serve_file(request, image.processed_image, stored_hash(image, 'processed_image', 'processed_hash'))
 
 
 @csrf_exempt
-def compress_image(request, image_id):
+async def compress_image(request, image_id):
     if request.method != "POST":
         return JsonResponse({"error": "POST request required"}, status=405)
 
     try:
-        image = Image.objects.get(id=image_id)
+        image = await Image.objects.aget(id=image_id)
     except Image.DoesNotExist:
         return JsonResponse({"error": "Image not found"}, status=404)
 
@@ -187,36 +383,29 @@ def compress_image(request, image_id):
         return JsonResponse({"error": "No image to compress"}, status=400)
 
     try:
-        # Update status to processing
-        image.compression_status = 'processing'
-        image.save()
+        format, target = compression_service.parse_options(_request_data(request))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        # Compress the image
-        result = compression_service.compress_image(image.image.path)
+    try:
+        # Claim the image; a second request while this one runs gets a 409
+        await image.atransition('compression_status', 'processing', from_states=STARTABLE)
+    except StatusConflict:
+        return JsonResponse({"error": "Compression already in progress"}, status=409)
+
+    try:
+        # Compress the image off the event loop
+        result = await run_blocking(compression_service.compress_image, image.image.path, format, target)
         
-        if result['success']:
-            # Save compressed image
-            from django.core.files import File
-            with open(result['output_path'], 'rb') as f:
-                image.compressed_image.save(
-                    f"compressed_{image.image.name.split('/')[-1]}",
-                    File(f),
-                    save=True
-                )
-            
-            # Update model with compression results
-            image.compression_processed = True
-            image.compression_status = 'completed'
-            image.original_size = result['original_size']
-            image.compressed_size = result['compressed_size']
-            image.compression_ratio = result['compression_ratio']
-            image.compression_error = None
-            image.save()
-
-            # Clean up temporary file
-            if os.path.exists(result['output_path']):
-                os.remove(result['output_path'])
+        # Write the encoded bytes straight into storage, then record the
+        # outcome with one UPDATE of the result columns
+        await sync_to_async(compression_service.apply_result)(image, result)
+        await image.atransition(
+            'compression_status', image.compression_status, from_states=['processing'],
+            update_fields=compression_service.RESULT_FIELDS,
+        )
 
+        if result['success']:
             return JsonResponse({
                 'success': True,
                 'message': result['message'],
@@ -225,15 +414,17 @@ def compress_image(request, image_id):
                     'original_size': result['original_size'],
                     'compressed_size': result['compressed_size'],
                     'compression_ratio': result['compression_ratio'],
-                    'compressed_url': image.compressed_image.url if image.compressed_image else None
+                    'quality': result.get('quality'),
+                    'ssim': result.get('ssim'),
+                    'psnr': result.get('psnr'),
+                    'target_met': result.get('target_met'),
+                    'format': result.get('format'),
+                    'stats': result.get('stats'),
+                    'compressed_url': image.compressed_image.url if image.compressed_image else None,
+                    'codes_url': image.compressed_codes.url if image.compressed_codes else None
                 }
             })
         else:
-            # Update status to failed
-            image.compression_status = 'failed'
-            image.compression_error = result['error']
-            image.save()
-
             return JsonResponse({
                 'success': False,
                 'error': result['error'],
@@ -243,11 +434,13 @@ def compress_image(request, image_id):
                 }
             })
 
+    except StatusConflict as e:
+        # Another request failed or reset the image meanwhile; its state stands
+        return JsonResponse({"error": str(e)}, status=409)
     except Exception as e:
         logger.error(f"Compression error for image {image_id}: {e}")
-        image.compression_status = 'failed'
         image.compression_error = str(e)
-        image.save()
+        await image.atransition('compression_status', 'failed', update_fields=['compression_error'])
         
         return JsonResponse({
             'success': False,
@@ -257,15 +450,42 @@ def compress_image(request, image_id):
                 'error': str(e)
             }
         })
+    except BaseException:
+        # Cancelled (the client went away) or interrupted: release the claim
+        # so later requests are not refused with 409 for good
+        await image.arelease('compression_status', 'Compression was interrupted')
+        raise
+
+
+@csrf_exempt
+async def compress_batch(request):
+    """Compress many images; streams one JSON line per image as it finishes"""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required"}, status=405)
+
+    try:
+        data = json.loads(request.body or b'{}')
+        ids = [int(image_id) for image_id in data.get('ids')]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({"error": 'Body must be JSON like {"ids": [1, 2, 3]}'}, status=400)
+    if not ids:
+        return JsonResponse({"error": "No image ids provided"}, status=400)
+    try:
+        format, target = compression_service.parse_options(data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    batch = compression_service.batch(ids, format, target)
+    return StreamingHttpResponse(JSONLinesStream(batch), content_type='application/x-ndjson')
 
 
 @csrf_exempt
-def check_compression_status(request, image_id):
+async def check_compression_status(request, image_id):
     if request.method != "GET":
         return JsonResponse({"error": "GET request required"}, status=405)
 
     try:
-        image = Image.objects.get(id=image_id)
+        image = await Image.objects.aget(id=image_id)
     except Image.DoesNotExist:
         return JsonResponse({"error": "Image not found"}, status=404)
 
@@ -278,7 +498,14 @@ def check_compression_status(request, image_id):
             'original_size': image.original_size,
             'compressed_size': image.compressed_size,
             'compression_ratio': image.compression_ratio,
-            'compressed_url': image.compressed_image.url if image.compressed_image else None
+            'quality': image.compression_quality,
+            'ssim': image.compression_ssim,
+            'psnr': image.compression_psnr,
+            'stats': image.compression_stats,
+            'compressed_url': image.compressed_image.url if image.compressed_image else None,
+            'compressed_hash': image.compressed_hash,
+            'codes_url': image.compressed_codes.url if image.compressed_codes else None,
+            'codes_hash': image.codes_hash
         }
     })
 
@@ -296,5 +523,63 @@ def download_compressed(request, image_id):
     if not image.compressed_image:
         return HttpResponseNotFound("Compressed image not available")
 
-    response = FileResponse(image.compressed_image.open('rb'), as_attachment=True, filename=image.compressed_image.name.split('/')[-1])
-    return response
\ No newline at end of file
+    return serve_file(request, image.compressed_image, stored_hash(image, 'compressed_image', 'compressed_hash'))
+
+
+@csrf_exempt
+def download_codes(request, image_id):
+    """Download the .vqz codebook indices of a VQGAN-compressed image"""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    try:
+        image = Image.objects.get(id=image_id)
+    except Image.DoesNotExist:
+        return JsonResponse({"error": "Image not found"}, status=404)
+
+    if not image.compressed_codes:
+        return HttpResponseNotFound("Compressed codes not available")
+
+    return serve_file(request, image.compressed_codes, stored_hash(image, 'compressed_codes', 'codes_hash'),
+                      content_type='application/octet-stream')
+
+
+@csrf_exempt
+async def rendition(request, image_id):
+    """Resized copy of an image: ?w=<width>&fmt=<WEBP|AVIF|JPEG|PNG>, cached on disk"""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    try:
+        width = int(request.GET.get('w', ''))
+    except ValueError:
+        return JsonResponse({"error": "'w' must be a width in pixels"}, status=400)
+    if width <= 0:
+        return JsonResponse({"error": "'w' must be positive"}, status=400)
+
+    try:
+        image = await Image.objects.aget(id=image_id)
+    except Image.DoesNotExist:
+        return JsonResponse({"error": "Image not found"}, status=404)
+
+    try:
+        result = await run_blocking(rendition_cache.get, image, width, request.GET.get('fmt') or DEFAULT_FORMAT)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except FileNotFoundError:
+        return HttpResponseNotFound("No image available to render")
+
+    return serve_path(request, result['file'], etag=result['etag'], last_modified=result['last_modified'],
+                      content_type=result['content_type'])
+
+
+@csrf_exempt
+async def cache_metrics(request):
+    """Hit/miss counters for the result caches in this process"""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required"}, status=405)
+
+    return JsonResponse({
+        'success': True,
+        'caches': snapshot_all()
+    })
@@ -7,6 +7,9 @@ import torch.nn.functional as F
 from torchvision import transforms, models
 from PIL import Image
 import io
+import numpy as np
+from . import vqz
+from .imaging import reduce_on_load
 
 # ---------------------------
 # Utilities
@@ -24,18 +27,42 @@ def l2_normalize(x, eps=1e-8):
 # VectorQuantizerEMA (DeepMind style)
 # ---------------------------
 class VectorQuantizerEMA(nn.Module):
-    def __init__(self, num_embeddings, embedding_dim, commitment_cost=0.25, decay=0.99, eps=1e-5):
+    def __init__(self, num_embeddings, embedding_dim, commitment_cost=0.25, decay=0.99, eps=1e-5, chunk_size=4096):
         super().__init__()
         self.embedding_dim = embedding_dim
         self.num_embeddings = num_embeddings
         self.commitment_cost = commitment_cost
         self.decay = decay
         self.eps = eps
+        # Rows searched at a time in eval mode; bounds the distance block to chunk_size x N
+        self.chunk_size = chunk_size
 
         embed = torch.randn(embedding_dim, num_embeddings)
         self.register_buffer('embedding', embed)
         self.register_buffer('cluster_size', torch.zeros(num_embeddings))
         self.register_buffer('embed_avg', embed.clone())
+        # ||e||^2 per codebook entry; derived from the embedding, so never saved
+        self.register_buffer('embedding_sq_norm', torch.sum(embed ** 2, dim=0), persistent=False)
+        self.register_load_state_dict_post_hook(lambda module, incompatible_keys: module.refresh_codebook_norms())
+
+    def refresh_codebook_norms(self):
+        """Recompute the cached codebook norms after the embedding changes"""
+        with torch.no_grad():
+            self.embedding_sq_norm.copy_(torch.sum(self.embedding ** 2, dim=0))
+
+    def nearest(self, flat):
+        """Index of the closest codebook entry for each row of ``flat`` (M, C).
+
+        ||x||^2 is the same for every entry so it is left out of the argmin,
+        and rows are searched in blocks so only chunk_size x N distances
+        exist at once.
+        """
+        indices = torch.empty(flat.shape[0], dtype=torch.long, device=flat.device)
+        for start in range(0, flat.shape[0], self.chunk_size):
+            block = flat[start:start + self.chunk_size]
+            distances = torch.addmm(self.embedding_sq_norm, block, self.embedding, alpha=-2)
+            indices[start:start + self.chunk_size] = torch.argmin(distances, dim=1)
+        return indices
 
     def forward(self, inputs):
         # inputs: (B, C, H, W)
@@ -44,20 +71,19 @@ class VectorQuantizerEMA(nn.Module):
 
         flat = inputs.permute(0, 2, 3, 1).contiguous().view(-1, c)  # (BHW, C)
 
-        # distances: (BHW, N)
-        embedding = self.embedding  # (C, N)
-        distances = (
-            torch.sum(flat ** 2, dim=1, keepdim=True)
-            - 2 * torch.matmul(flat, embedding)
-            + torch.sum(embedding ** 2, dim=0, keepdim=True)
-        )
-
-        encoding_indices = torch.argmin(distances, dim=1)
-        encodings = F.one_hot(encoding_indices, self.num_embeddings).type(flat.dtype)
-
-        quantized = torch.matmul(encodings, embedding.t()).view(b, h, w, c).permute(0, 3, 1, 2).contiguous()
-
         if self.training:
+            # distances: (BHW, N); the one-hot encodings are needed for the EMA update
+            embedding = self.embedding  # (C, N)
+            distances = (
+                torch.sum(flat ** 2, dim=1, keepdim=True)
+                - 2 * torch.matmul(flat, embedding)
+                + torch.sum(embedding ** 2, dim=0, keepdim=True)
+            )
+
+            encoding_indices = torch.argmin(distances, dim=1)
+            encodings = F.one_hot(encoding_indices, self.num_embeddings).type(flat.dtype)
+            quantized = torch.matmul(encodings, embedding.t())
+
             enc_sum = encodings.sum(0)
             dw = torch.matmul(flat.t(), encodings)
 
@@ -67,6 +93,13 @@ class VectorQuantizerEMA(nn.Module):
             n = torch.sum(self.cluster_size)
             cluster_size = ((self.cluster_size + self.eps) / (n + self.num_embeddings * self.eps) * n)
             self.embedding.data.copy_(self.embed_avg / cluster_size.unsqueeze(0))
+            self.refresh_codebook_norms()
+        else:
+            # Gather codebook rows directly instead of a one-hot matmul
+            encoding_indices = self.nearest(flat)
+            quantized = self.embedding.t().index_select(0, encoding_indices)
+
+        quantized = quantized.view(b, h, w, c).permute(0, 3, 1, 2).contiguous()
 
         commitment_loss = self.commitment_cost * F.mse_loss(quantized.detach(), inputs)
         # straight-through
@@ -76,6 +109,10 @@ class VectorQuantizerEMA(nn.Module):
         indices = encoding_indices.view(b, h, w)
         return quantized, commitment_loss, indices
 
+    def lookup(self, indices):
+        """Codebook vectors for an index grid (B, H, W) -> (B, C, H, W)"""
+        return self.embedding.t()[indices].permute(0, 3, 1, 2).contiguous()
+
 
 # ---------------------------
 # Encoder / Decoder (small ResNet-ish convs)
@@ -149,13 +186,19 @@ class VQGANModel(nn.Module):
     
     def decode(self, z_q):
         return self.decoder(z_q)
+    
+    def decode_indices(self, indices):
+        return self.decode(self.quantizer.lookup(indices))
 
 
 # ---------------------------
 # VQGAN Compression Service
 # ---------------------------
 class VQGANCompressionService:
-    def __init__(self, model_path=None, device=None):
+    TILE_SIZE = 64  # VQGAN is trained on 64x64 crops
+
+    def __init__(self, model_path=None, device=None, tiled=False, tile_overlap=16, tile_batch_size=32,
+                 frequency_table=None):
         self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
         self.transform = transforms.Compose([
@@ -163,6 +206,16 @@ class VQGANCompressionService:
             transforms.ToTensor(),
             transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
         ])
+        # Tiled mode keeps full resolution by running overlapping 64x64 tiles
+        self.tiled = tiled
+        self.tile_overlap = max(0, min(int(tile_overlap), self.TILE_SIZE // 2))
+        self.tile_batch_size = max(1, int(tile_batch_size))
+        # Optional global symbol frequencies shared by every .vqz file
+        self.frequency_table = frequency_table
+        self.to_tensor = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+        ])
         
         if model_path and os.path.exists(model_path):
             self.load_model(model_path)
@@ -199,10 +252,220 @@ class VQGANCompressionService:
         arr = (arr * 255).astype("uint8")
         return Image.fromarray(arr)
     
-    def compress_image(self, image_path, output_path=None):
+    def tile_positions(self, length, overlap=None):
+        """Start offsets of overlapping tiles covering ``length`` pixels"""
+        tile = self.TILE_SIZE
+        stride = tile - (self.tile_overlap if overlap is None else overlap)
+        positions = list(range(0, max(length - tile, 0) + 1, stride))
+        if positions[-1] + tile < length:
+            positions.append(length - tile)
+        return positions
+    
+    def tile_grid(self, height, width, overlap=None):
+        """Tile origins for an image; images smaller than a tile are padded up to one"""
+        tile = self.TILE_SIZE
+        padded_h, padded_w = max(height, tile), max(width, tile)
+        positions = [
+            (y, x)
+            for y in self.tile_positions(padded_h, overlap)
+            for x in self.tile_positions(padded_w, overlap)
+        ]
+        return padded_h, padded_w, positions
+    
+    def blend_window(self, overlap=None):
+        """Per-pixel tile weights that ramp down across the overlap to hide seams"""
+        tile = self.TILE_SIZE
+        overlap = self.tile_overlap if overlap is None else overlap
+        ramp = torch.ones(tile)
+        if overlap:
+            edge = (torch.arange(overlap, dtype=torch.float32) + 0.5) / overlap
+            ramp[:overlap] = edge
+            ramp[-overlap:] = edge.flip(0)
+        return torch.outer(ramp, ramp)
+    
+    def _blend_tiles(self, batches, positions, height, width, padded_h, padded_w, overlap=None):
+        """Accumulate (positions, patches) batches into one de-seamed image tensor"""
+        tile = self.TILE_SIZE
+        window = self.blend_window(overlap)
+        output = torch.zeros(3, padded_h, padded_w)
+        weights = torch.zeros(padded_h, padded_w)
+        for batch_positions, patches in batches:
+            for (y, x), patch in zip(batch_positions, patches):
+                output[:, y:y + tile, x:x + tile] += patch * window
+                weights[y:y + tile, x:x + tile] += window
+        return (output / weights)[:, :height, :width]
+    
+    def _run_tiles(self, batch):
+        """Forward a batch of 64x64 tiles; returns (reconstructions, per-tile vq_loss, indices)"""
+        z_e = self.model.encoder(batch)
+        z_q, _, indices = self.model.quantizer(z_e)
+        losses = self.model.quantizer.commitment_cost * ((z_q - z_e) ** 2).mean(dim=(1, 2, 3))
+        return self.model.decoder(z_q), losses, indices
+    
+    def reconstruct_tiled(self, img):
+        """
+        Run a full-resolution image through VQGAN as overlapping 64x64 tiles.
+        Tiles go through the model tile_batch_size at a time, so memory is
+        bounded however large the image is.
+        Returns: (reconstructed PIL image, mean vq_loss, indices of shape (tiles, h, w))
+        """
+        return self.reconstruct_many([img])[0]
+    
+    def reconstruct_many(self, images):
+        """
+        Reconstruct several RGB PIL images, packing tiles from all of them
+        into shared forward passes of up to tile_batch_size tiles.
+        Returns: list of (PIL image, mean vq_loss, indices) in input order
+        """
+        if not self.tiled:
+            batch = torch.stack([self.transform(img) for img in images]).to(self.device)
+            with torch.no_grad():
+                recon, losses, indices = self._run_tiles(batch)
+            return [
+                (self.tensor_to_pil(patch), loss.item(), idx.unsqueeze(0))
+                for patch, loss, idx in zip(recon.cpu(), losses.cpu(), indices.cpu())
+            ]
+        
+        tile = self.TILE_SIZE
+        window = self.blend_window()
+        layouts = []
+        jobs = []
+        for number, img in enumerate(images):
+            pixels = self.to_tensor(img)
+            _, height, width = pixels.shape
+            padded_h, padded_w, positions = self.tile_grid(height, width)
+            if (padded_h, padded_w) != (height, width):
+                pixels = F.pad(pixels.unsqueeze(0), (0, padded_w - width, 0, padded_h - height), mode='replicate')[0]
+            layouts.append({
+                'pixels': pixels, 'height': height, 'width': width,
+                'output': torch.zeros(3, padded_h, padded_w),
+                'weights': torch.zeros(padded_h, padded_w),
+                'losses': [], 'indices': [],
+            })
+            jobs.extend((number, y, x) for y, x in positions)
+        
+        with torch.no_grad():
+            for start in range(0, len(jobs), self.tile_batch_size):
+                chunk = jobs[start:start + self.tile_batch_size]
+                batch = torch.stack([
+                    layouts[number]['pixels'][:, y:y + tile, x:x + tile] for number, y, x in chunk
+                ]).to(self.device)
+                recon, losses, indices = self._run_tiles(batch)
+                
+                for (number, y, x), patch, loss, idx in zip(chunk, recon.cpu(), losses.cpu(), indices.cpu()):
+                    layout = layouts[number]
+                    layout['output'][:, y:y + tile, x:x + tile] += patch * window
+                    layout['weights'][y:y + tile, x:x + tile] += window
+                    layout['losses'].append(loss.item())
+                    layout['indices'].append(idx)
+        
+        results = []
+        for layout in layouts:
+            output = (layout['output'] / layout['weights'])[:, :layout['height'], :layout['width']]
+            losses = layout['losses']
+            results.append((self.tensor_to_pil(output), sum(losses) / len(losses), torch.stack(layout['indices'])))
+        return results
+    
+    def reconstruct(self, img):
+        """Reconstruct an RGB PIL image; returns (PIL image, vq_loss, indices)"""
+        if self.tiled:
+            return self.reconstruct_tiled(img)
+        
+        # Transform to tensor
+        img_tensor = self.transform(img).unsqueeze(0).to(self.device)
+        
+        # Compress using VQGAN
+        with torch.no_grad():
+            recon_img, vq_loss, indices = self.model(img_tensor)
+        
+        # Convert back to PIL
+        return self.tensor_to_pil(recon_img[0]), vq_loss.item(), indices.cpu()
+    
+    def load_image(self, fp):
+        """
+        Open an image as RGB; returns (image, original (width, height)).
+        Untiled mode only needs a 64x64 input, so big files are decoded at a reduced scale.
+        """
+        with Image.open(fp) as source:
+            size = source.size
+            if not self.tiled:
+                source = reduce_on_load(source, (self.TILE_SIZE, self.TILE_SIZE), fit=False)
+            return source.convert("RGB"), size
+    
+    def encode_vqz(self, img, size=None):
+        """
+        Encode an RGB PIL image to a .vqz blob holding only its codebook indices.
+        ``size`` is the original image size when ``img`` was reduced on load.
+        Returns: (vqz bytes, vq_loss)
+        """
+        _, vq_loss, indices = self.reconstruct(img)
+        width, height = size or img.size
+        return self.codes_for(width, height, indices), vq_loss
+    
+    def codes_for(self, width, height, indices):
+        """Serialise the (tiles, h, w) index grid of a width x height image to .vqz"""
+        tiles, grid_h, grid_w = indices.shape
+        header = vqz.VQZHeader(
+            width=width,
+            height=height,
+            tiled=self.tiled,
+            tile_overlap=self.tile_overlap if self.tiled else 0,
+            grid_h=grid_h,
+            grid_w=grid_w,
+            index_bits=max(1, (self.model.quantizer.num_embeddings - 1).bit_length()),
+            tiles=tiles,
+        )
+        return vqz.encode(indices.numpy(), header, self.frequency_table)
+    
+    def decompress_vqz(self, data):
+        """Decode a .vqz blob back to an RGB PIL image with VQGANModel.decode"""
+        header, indices = vqz.decode(data, self.frequency_table)
+        if 1 << header.index_bits < self.model.quantizer.num_embeddings:
+            raise vqz.VQZError('Index width does not match the loaded codebook')
+        indices = torch.from_numpy(np.ascontiguousarray(indices))
+        
+        if not header.tiled:
+            with torch.no_grad():
+                recon = self.model.decode_indices(indices.to(self.device))
+            return self.tensor_to_pil(recon[0]).resize((header.width, header.height), Image.Resampling.BICUBIC)
+        
+        padded_h, padded_w, positions = self.tile_grid(header.height, header.width, header.tile_overlap)
+        if len(positions) != header.tiles:
+            raise vqz.VQZError('Tile count does not match the image size')
+        
+        def batches():
+            with torch.no_grad():
+                for start in range(0, len(positions), self.tile_batch_size):
+                    batch = indices[start:start + self.tile_batch_size].to(self.device)
+                    yield positions[start:start + self.tile_batch_size], self.model.decode_indices(batch).cpu()
+        
+        output = self._blend_tiles(
+            batches(), positions, header.height, header.width, padded_h, padded_w, header.tile_overlap
+        )
+        return self.tensor_to_pil(output)
+    
+    def _encode_result(self, img, original_size, format='JPEG', size=None):
+        """Encode to .vqz and render the preview from the stored codes"""
+        codes, vq_loss = self.encode_vqz(img, size)
+        preview = self.decompress_vqz(codes)
+        output = io.BytesIO()
+        preview.save(output, format=format, quality=95)
+        compressed_size = len(codes)
+        return {
+            'success': True,
+            'original_size': original_size,
+            'compressed_size': compressed_size,
+            'compression_ratio': compressed_size / original_size if original_size > 0 else 0,
+            'codes_bytes': codes,
+            'compressed_bytes': output.getvalue(),
+            'vq_loss': vq_loss,
+        }
+    
+    def compress_image(self, image_path):
         """
         Compress image using VQGAN
-        Returns: dict with compression results
+        Returns: dict with compression results; the .vqz codes are in
+        'codes_bytes' and a JPEG preview decoded from them in 'compressed_bytes'
         """
         if not self.model:
             return {
@@ -213,36 +476,16 @@ class VQGANCompressionService:
         
         try:
             # Load and preprocess image
-            img = Image.open(image_path).convert("RGB")
+            img, size = self.load_image(image_path)
             original_size = os.path.getsize(image_path)
             
-            # Transform to tensor
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-            
-            # Compress using VQGAN
-            with torch.no_grad():
-                recon_img, vq_loss, indices = self.model(img_tensor)
-            
-            # Convert back to PIL
-            recon_pil = self.tensor_to_pil(recon_img[0])
-            
-            # Save compressed image
-            if output_path is None:
-                output_path = image_path.replace('.', '_vqgan_compressed.')
-            
-            recon_pil.save(output_path, 'JPEG', quality=95)
-            compressed_size = os.path.getsize(output_path)
-            compression_ratio = compressed_size / original_size if original_size > 0 else 0
-            
-            return {
-                'success': True,
-                'original_size': original_size,
-                'compressed_size': compressed_size,
-                'compression_ratio': compression_ratio,
-                'output_path': output_path,
-                'vq_loss': vq_loss.item(),
-                'message': f'VQGAN compressed from {original_size} to {compressed_size} bytes ({compression_ratio:.2%} of original)'
-            }
+            # Only the codebook indices are stored; the JPEG is a preview decoded from them
+            result = self._encode_result(img, original_size, size=size)
+            result['message'] = (
+                f"VQGAN compressed from {original_size} to {result['compressed_size']} bytes "
+                f"({result['compression_ratio']:.2%} of original)"
+            )
+            return result
             
         except Exception as e:
             return {
@@ -251,6 +494,50 @@ class VQGANCompressionService:
                 'message': f'VQGAN compression failed: {str(e)}'
             }
     
+    def compress_images(self, image_paths):
+        """
+        Compress several files with their tiles batched together
+        Returns: list of result dicts (as compress_image) in input order
+        """
+        if not self.model:
+            return [{'success': False, 'error': 'VQGAN model not loaded'} for _ in image_paths]
+        
+        results = [None] * len(image_paths)
+        loaded = []
+        for position, image_path in enumerate(image_paths):
+            try:
+                img, size = self.load_image(image_path)
+                loaded.append((position, img, size, os.path.getsize(image_path)))
+            except Exception as e:
+                results[position] = {'success': False, 'error': str(e)}
+        
+        try:
+            reconstructions = self.reconstruct_many([img for _, img, _, _ in loaded]) if loaded else []
+        except Exception as e:
+            for position, *_ in loaded:
+                results[position] = {'success': False, 'error': str(e)}
+            return results
+        
+        for (position, img, size, original_size), (recon_pil, vq_loss, indices) in zip(loaded, reconstructions):
+            # The forward pass already ran the decoder on these indices, so its
+            # output is the preview that decompress_vqz would produce
+            codes = self.codes_for(*size, indices)
+            if recon_pil.size != size:
+                recon_pil = recon_pil.resize(size, Image.Resampling.BICUBIC)
+            output = io.BytesIO()
+            recon_pil.save(output, 'JPEG', quality=95)
+            compressed_size = len(codes)
+            results[position] = {
+                'success': True,
+                'original_size': original_size,
+                'compressed_size': compressed_size,
+                'compression_ratio': compressed_size / original_size if original_size > 0 else 0,
+                'codes_bytes': codes,
+                'compressed_bytes': output.getvalue(),
+                'vq_loss': vq_loss,
+            }
+        return results
+    
     def compress_image_bytes(self, image_bytes, format='JPEG'):
         """
         Compress image from bytes using VQGAN
@@ -263,29 +550,10 @@ class VQGANCompressionService:
         
         try:
             # Load image from bytes
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            img, size = self.load_image(io.BytesIO(image_bytes))
             original_size = len(image_bytes)
             
-            # Transform to tensor
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-            
-            # Compress using VQGAN
-            with torch.no_grad():
-                recon_img, vq_loss, indices = self.model(img_tensor)
-            
-            # Convert back to PIL and then to bytes
-            recon_pil = self.tensor_to_pil(recon_img[0])
-            output = io.BytesIO()
-            recon_pil.save(output, format=format, quality=95)
-            compressed_bytes = output.getvalue()
-            
-            return {
-                'success': True,
-                'compressed_bytes': compressed_bytes,
-                'original_size': original_size,
-                'compressed_size': len(compressed_bytes),
-                'vq_loss': vq_loss.item()
-            }
+            return self._encode_result(img, original_size, format, size)
             
         except Exception as e:
             return {
@@ -0,0 +1,303 @@
+import struct
+import zlib
+from dataclasses import dataclass
+import numpy as np
+
+# Container layout (all integers big-endian):
+#   magic 'VQZ' | version u8 | flags u8 | coding u8 | width u32 | height u32
+#   tile_overlap u8 | grid_h u8 | grid_w u8 | index_bits u8 | tiles u32
+# followed by the payload for ``coding``.
+MAGIC = b'VQZ'
+VERSION = 1
+HEADER = struct.Struct('>3sBBBIIBBBBI')
+
+FLAG_TILED = 0x01
+
+CODING_PACKED = 0    # fixed-width bit packing, no entropy coding
+CODING_RANS = 1      # rANS with a frequency table stored in the file
+CODING_RANS_GLOBAL = 2  # rANS with a shared table; the file stores its CRC
+
+# rANS parameters: 32-bit state, byte-wise renormalisation
+PROB_BITS = 15
+PROB_SCALE = 1 << PROB_BITS
+RANS_L = 1 << 23
+
+
+class VQZError(ValueError):
+    """Raised for malformed or unsupported .vqz data"""
+
+
+@dataclass
+class VQZHeader:
+    width: int
+    height: int
+    tiled: bool
+    tile_overlap: int
+    grid_h: int
+    grid_w: int
+    index_bits: int
+    tiles: int
+    coding: int = CODING_PACKED
+
+    @property
+    def count(self):
+        return self.tiles * self.grid_h * self.grid_w
+
+
+# ---------------------------
+# Fixed-width packing
+# ---------------------------
+
+def pack_indices(indices, bits):
+    """Pack non-negative integers into ``bits`` bits each, MSB first"""
+    values = np.asarray(indices, dtype=np.uint32).ravel()
+    shifts = np.arange(bits - 1, -1, -1, dtype=np.uint32)
+    bit_array = ((values[:, None] >> shifts) & 1).astype(np.uint8)
+    return np.packbits(bit_array.ravel()).tobytes()
+
+
+def unpack_indices(data, count, bits):
+    needed = (count * bits + 7) // 8
+    if len(data) < needed:
+        raise VQZError('Truncated index data')
+    bit_array = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=needed))[:count * bits]
+    weights = (1 << np.arange(bits - 1, -1, -1)).astype(np.int64)
+    return bit_array.reshape(count, bits).astype(np.int64) @ weights
+
+
+# ---------------------------
+# Frequency tables
+# ---------------------------
+
+def normalize_frequencies(counts, scale_bits=PROB_BITS, keep_all=False):
+    """Scale symbol counts to sum to 2**scale_bits.
+
+    Every symbol with a non-zero count (or every symbol, with ``keep_all``)
+    keeps a frequency of at least one so it stays encodable.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    scale = 1 << scale_bits
+    if keep_all:
+        counts = counts + 1
+    present = counts > 0
+    if present.sum() > scale:
+        raise VQZError('Too many distinct symbols for the probability scale')
+
+    freqs = np.zeros(len(counts), dtype=np.int64)
+    freqs[present] = np.maximum(1, np.floor(counts[present] * scale / counts.sum()))
+
+    # Hand the rounding error to the most frequent symbols
+    diff = scale - int(freqs.sum())
+    order = np.argsort(-freqs, kind='stable')
+    i = 0
+    while diff != 0:
+        symbol = order[i % len(order)]
+        if diff > 0:
+            freqs[symbol] += 1
+            diff -= 1
+        elif freqs[symbol] > 1:
+            freqs[symbol] -= 1
+            diff += 1
+        i += 1
+    return freqs
+
+
+def table_checksum(freqs):
+    return zlib.crc32(np.asarray(freqs, dtype='>u4').tobytes())
+
+
+def load_frequency_table(path, num_symbols):
+    """Load a global table of per-symbol counts saved with ``np.save``"""
+    counts = np.load(path)
+    if counts.shape != (num_symbols,):
+        raise VQZError(f'Frequency table has shape {counts.shape}, expected ({num_symbols},)')
+    return normalize_frequencies(counts, keep_all=True)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise VQZError('Truncated varint')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def write_table(freqs):
+    """Sparse table: count, then (symbol delta, frequency - 1) varint pairs"""
+    out = bytearray()
+    symbols = np.flatnonzero(freqs)
+    _write_varint(out, len(symbols))
+    previous = 0
+    for symbol in symbols:
+        _write_varint(out, int(symbol) - previous)
+        _write_varint(out, int(freqs[symbol]) - 1)
+        previous = int(symbol)
+    return bytes(out)
+
+
+def read_table(data, pos, num_symbols):
+    freqs = np.zeros(num_symbols, dtype=np.int64)
+    entries, pos = _read_varint(data, pos)
+    symbol = 0
+    for _ in range(entries):
+        delta, pos = _read_varint(data, pos)
+        freq, pos = _read_varint(data, pos)
+        symbol += delta
+        if symbol >= num_symbols:
+            raise VQZError('Frequency table symbol out of range')
+        freqs[symbol] = freq + 1
+    if freqs.sum() != PROB_SCALE:
+        raise VQZError('Corrupt frequency table')
+    return freqs, pos
+
+
+# ---------------------------
+# rANS
+# ---------------------------
+
+def rans_encode(symbols, freqs):
+    """Encode ``symbols`` with static rANS; ``freqs`` must sum to PROB_SCALE"""
+    freqs = [int(f) for f in freqs]
+    cum = [0] * len(freqs)
+    total = 0
+    for symbol, freq in enumerate(freqs):
+        cum[symbol] = total
+        total += freq
+
+    out = bytearray()
+    x = RANS_L
+    # rANS is last-in first-out, so encode backwards
+    for symbol in reversed(np.asarray(symbols).ravel().tolist()):
+        freq = freqs[symbol]
+        if not freq:
+            raise VQZError(f'Symbol {symbol} has zero frequency')
+        x_max = ((RANS_L >> PROB_BITS) << 8) * freq
+        while x >= x_max:
+            out.append(x & 0xFF)
+            x >>= 8
+        x = ((x // freq) << PROB_BITS) + (x % freq) + cum[symbol]
+    for _ in range(4):
+        out.append(x & 0xFF)
+        x >>= 8
+    out.reverse()
+    return bytes(out)
+
+
+def rans_decode(data, pos, count, freqs):
+    freqs = [int(f) for f in freqs]
+    cum = [0] * len(freqs)
+    total = 0
+    for symbol, freq in enumerate(freqs):
+        cum[symbol] = total
+        total += freq
+    slot_to_symbol = np.repeat(np.arange(len(freqs)), freqs).tolist()
+
+    if len(data) < pos + 4:
+        raise VQZError('Truncated rANS stream')
+    x = int.from_bytes(data[pos:pos + 4], 'big')
+    pos += 4
+    mask = PROB_SCALE - 1
+    end = len(data)
+    symbols = [0] * count
+    for i in range(count):
+        slot = x & mask
+        symbol = slot_to_symbol[slot]
+        symbols[i] = symbol
+        x = freqs[symbol] * (x >> PROB_BITS) + slot - cum[symbol]
+        while x < RANS_L:
+            if pos >= end:
+                raise VQZError('Truncated rANS stream')
+            x = (x << 8) | data[pos]
+            pos += 1
+    return np.asarray(symbols, dtype=np.int64)
+
+
+# ---------------------------
+# Container
+# ---------------------------
+
+def encode(indices, header, global_freqs=None):
+    """Serialise an index grid of shape (tiles, grid_h, grid_w).
+
+    Packed, per-image rANS and (when ``global_freqs`` is given) global-table
+    rANS payloads are all built and the smallest is kept.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if indices.shape != (header.tiles, header.grid_h, header.grid_w):
+        raise VQZError(f'Index grid has shape {indices.shape}, header describes '
+                       f'{(header.tiles, header.grid_h, header.grid_w)}')
+    num_symbols = 1 << header.index_bits
+    if indices.size and (indices.min() < 0 or indices.max() >= num_symbols):
+        raise VQZError('Index out of range for the codebook')
+
+    candidates = {CODING_PACKED: pack_indices(indices, header.index_bits)}
+    if indices.size:
+        freqs = normalize_frequencies(np.bincount(indices.ravel(), minlength=num_symbols))
+        candidates[CODING_RANS] = write_table(freqs) + rans_encode(indices, freqs)
+        if global_freqs is not None:
+            candidates[CODING_RANS_GLOBAL] = (
+                struct.pack('>I', table_checksum(global_freqs)) + rans_encode(indices, global_freqs)
+            )
+
+    coding = min(candidates, key=lambda c: len(candidates[c]))
+    header.coding = coding
+    return HEADER.pack(
+        MAGIC, VERSION, FLAG_TILED if header.tiled else 0, coding,
+        header.width, header.height, header.tile_overlap,
+        header.grid_h, header.grid_w, header.index_bits, header.tiles,
+    ) + candidates[coding]
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise VQZError('Data too short for a .vqz header')
+    (magic, version, flags, coding, width, height, tile_overlap,
+     grid_h, grid_w, index_bits, tiles) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise VQZError('Not a .vqz file')
+    if version != VERSION:
+        raise VQZError(f'Unsupported .vqz version {version}')
+    return VQZHeader(
+        width=width, height=height, tiled=bool(flags & FLAG_TILED),
+        tile_overlap=tile_overlap, grid_h=grid_h, grid_w=grid_w,
+        index_bits=index_bits, tiles=tiles, coding=coding,
+    )
+
+
+def decode(data, global_freqs=None):
+    """Parse a .vqz blob; returns (header, indices of shape (tiles, grid_h, grid_w))"""
+    header = read_header(data)
+    pos = HEADER.size
+    count = header.count
+    num_symbols = 1 << header.index_bits
+
+    if header.coding == CODING_PACKED:
+        indices = unpack_indices(data[pos:], count, header.index_bits)
+    elif header.coding == CODING_RANS:
+        freqs, pos = read_table(data, pos, num_symbols)
+        indices = rans_decode(data, pos, count, freqs)
+    elif header.coding == CODING_RANS_GLOBAL:
+        if global_freqs is None:
+            raise VQZError('File was coded with a global frequency table that is not loaded')
+        if len(data) < pos + 4:
+            raise VQZError('Truncated frequency table checksum')
+        (checksum,) = struct.unpack_from('>I', data, pos)
+        if checksum != table_checksum(global_freqs):
+            raise VQZError('File was coded with a different global frequency table')
+        indices = rans_decode(data, pos + 4, count, global_freqs)
+    else:
+        raise VQZError(f'Unknown .vqz coding {header.coding}')
+
+    return header, indices.reshape(header.tiles, header.grid_h, header.grid_w)
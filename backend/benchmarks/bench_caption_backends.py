@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Compare BLIP caption accuracy and latency across CPU inference backends.
+
+Captions a fixed image set with every backend and reports per-image
+latency, speedup over fp32 and how closely the captions match the fp32
+baseline (exact matches and mean word overlap):
+
+    python benchmarks/bench_caption_backends.py --images media/uploads --threads 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from PIL import Image  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_images(directory, limit):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    images = []
+    for name in names:
+        with Image.open(os.path.join(directory, name)) as image:
+            images.append(image.convert('RGB'))
+    return names, images
+
+
+def word_overlap(a, b):
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def caption_all(blip, images, repeats):
+    from Image.image_to_text_api import generate_captions
+
+    generate_captions(images[:1], blip=blip)  # warm up
+    captions, latencies = [], []
+    for image in images:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            caption = generate_captions([image], blip=blip)[0]
+            timings.append(time.perf_counter() - start)
+        captions.append(caption)
+        latencies.append(statistics.median(timings))
+    return captions, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=os.path.join('media', 'uploads'), help='Directory of test images')
+    parser.add_argument('--limit', type=int, default=12, help='Maximum number of images')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per image (median is kept)')
+    parser.add_argument('--threads', type=int, default=0, help='torch.set_num_threads (0 = default)')
+    parser.add_argument('--backends', nargs='+', default=['fp32', 'int8', 'traced'])
+    parser.add_argument('--show-captions', action='store_true')
+    args = parser.parse_args()
+
+    from Image.image_to_text_api import load_blip
+
+    names, images = load_images(args.images, args.limit)
+    print(f"{len(images)} images from {args.images}")
+
+    baseline = None
+    print(f"{'backend':<8} {'ms/image':>9} {'speedup':>8} {'exact':>6} {'overlap':>8}")
+    for backend in args.backends:
+        blip = load_blip(backend=backend, num_threads=args.threads)
+        captions, latencies = caption_all(blip, images, args.repeats)
+        mean_ms = statistics.mean(latencies) * 1000
+        if baseline is None:
+            baseline = (captions, mean_ms)
+        exact = sum(c == b for c, b in zip(captions, baseline[0])) / len(captions)
+        overlap = statistics.mean(word_overlap(c, b) for c, b in zip(captions, baseline[0]))
+        print(f"{backend:<8} {mean_ms:>9.1f} {baseline[1] / mean_ms:>7.2f}x {exact:>6.0%} {overlap:>8.2f}")
+        if args.show_captions:
+            for name, caption in zip(names, captions):
+                print(f"    {name}: {caption}")
+
+
+if __name__ == '__main__':
+    main()
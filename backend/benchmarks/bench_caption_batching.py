@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark BLIP captioning throughput against latency for micro-batching settings.
+
+Fires concurrent caption requests at a MicroBatcher for each
+(max batch size, max wait) pair and reports images/sec with p50/p99
+latency. Batch size 1 is the old one-image-per-request behaviour:
+
+    python benchmarks/bench_caption_batching.py --requests 64 --concurrency 16 --batch-sizes 1 4 8 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from PIL import Image  # noqa: E402
+
+
+def sample_images(count, size=(480, 360)):
+    images = []
+    for i in range(count):
+        image = Image.linear_gradient('L').resize(size).convert('RGB')
+        images.append(image.rotate(i * 37 % 360))
+    return images
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(batcher, images, concurrency):
+    latencies = []
+
+    def request(image):
+        start = time.perf_counter()
+        batcher(image)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(request, images))
+    elapsed = time.perf_counter() - start
+    return len(images) / elapsed, statistics.median(latencies), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--max-wait-ms', type=float, nargs='+', default=[5, 20])
+    args = parser.parse_args()
+
+    from Image.batching import MicroBatcher
+    from Image.image_to_text_api import generate_captions
+
+    images = sample_images(args.requests)
+    generate_captions(images[:1])  # warm up
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent")
+    print(f"{'batch':>5} {'wait ms':>8} {'img/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for batch_size in args.batch_sizes:
+        for max_wait_ms in (args.max_wait_ms if batch_size > 1 else [0]):
+            batcher = MicroBatcher(generate_captions, max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+            throughput, p50, p99 = run(batcher, images, args.concurrency)
+            print(f"{batch_size:>5} {max_wait_ms:>8.0f} {throughput:>8.2f} {p50 * 1000:>9.0f} {p99 * 1000:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Benchmark PIL compression throughput on 1..N worker processes.
+
+Synthetic photos are compressed by the CompressionEngine with each worker
+count, against a baseline that compresses them one by one in the calling
+thread (the old request-thread path). Pools are warmed up first, so
+spawning the workers is not timed:
+
+    python benchmarks/bench_compression_engine.py --images 32 --width 4000 --height 3000 --max-workers 8
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from Image.compression_engine import CompressionEngine, encode_image  # noqa: E402
+
+
+def make_photo(width, height, seed):
+    # Smooth noise compresses like a photo rather than like flat colour or pure noise
+    noise = Image.effect_noise((width // 8, height // 8), 64 + seed % 32)
+    base = Image.merge('RGB', [noise, noise.rotate(90, expand=False), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+    output = io.BytesIO()
+    base.resize((width, height), Image.Resampling.BICUBIC).save(output, 'JPEG', quality=92)
+    return output.getvalue()
+
+
+def in_thread(images, engine):
+    for data in images:
+        encode_image(io.BytesIO(data), len(data), engine.max_width, engine.max_height, engine.quality)
+
+
+def on_engine(images, engine):
+    futures = [engine.submit_bytes(data) for data in images]
+    for future in futures:
+        if not future.result()['success']:
+            raise RuntimeError(future.result()['error'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    images = [make_photo(args.width, args.height, seed) for seed in range(args.images)]
+    megabytes = sum(len(data) for data in images) / 1e6
+    print(f"{args.images} images of {args.width}x{args.height}, {megabytes:.1f} MB of JPEG input, "
+          f"{os.cpu_count()} CPUs\n")
+
+    start = time.perf_counter()
+    in_thread(images, CompressionEngine(workers=1))
+    baseline = args.images / (time.perf_counter() - start)
+    print(f"{'in-thread':<12} {baseline:7.2f} images/s   1.00x")
+
+    for workers in range(1, args.max_workers + 1):
+        engine = CompressionEngine(workers=workers)
+        try:
+            # Start every worker before timing
+            on_engine([make_photo(64, 64, 0)] * workers * 2, engine)
+            start = time.perf_counter()
+            on_engine(images, engine)
+            throughput = args.images / (time.perf_counter() - start)
+        finally:
+            engine.shutdown()
+        print(f"{f'{workers} worker(s)':<12} {throughput:7.2f} images/s   {throughput / baseline:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
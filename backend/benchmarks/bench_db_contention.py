@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Benchmark SQLite write-lock contention between worker processes.
+
+Writer processes replay a processing run against random Image rows: read
+the row, then save it three times (processing, result, completed) in one
+transaction. Reader processes poll status at the same time, like the
+status endpoints. Every process is a separate Django worker on the same
+database file, run once per configuration of Backend/database.py:
+
+- before: Django's SQLite defaults (rollback journal, synchronous=FULL,
+  5s busy timeout, DEFERRED transactions);
+- after:  the defaults of Backend/database.py (WAL, synchronous=NORMAL,
+  20s busy timeout, IMMEDIATE transactions).
+
+    python benchmarks/bench_db_contention.py --writers 4 --readers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    'before': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_BUSY_TIMEOUT': '5',
+        'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+    },
+    'after': {},
+}
+
+WORKER_SCRIPT = """
+import json, os, random, sys, time
+role, rows, start_at, seconds = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), float(sys.argv[4])
+os.environ['DJANGO_SETTINGS_MODULE'] = 'Backend.settings'
+os.environ['JOB_QUEUE_BACKEND'] = 'memory'
+os.environ['JOB_QUEUE_AUTOSTART'] = 'False'
+import django
+django.setup()
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from Image.models import Image
+
+if role == 'seed':
+    call_command('migrate', verbosity=0)
+    Image.objects.bulk_create(
+        Image(image=f'uploads/{index}.jpg', created_by='bench', date='2025-01-01', time='00:00:00')
+        for index in range(rows)
+    )
+    sys.exit()
+
+def write(pk):
+    with transaction.atomic():
+        image = Image.objects.get(pk=pk)
+        image.compression_status = 'processing'
+        image.save()
+        image.compressed_size = random.randrange(1, 1 << 20)
+        image.save()
+        image.compression_status = 'completed'
+        image.save()
+
+def read(pk):
+    Image.objects.filter(pk=pk).values('id', 'text_removal_status', 'compression_status').first()
+
+operation = write if role == 'writer' else read
+connection.ensure_connection()
+time.sleep(max(0, start_at - time.time()))
+latencies, errors = [], 0
+deadline = time.perf_counter() + seconds
+while time.perf_counter() < deadline:
+    start = time.perf_counter()
+    try:
+        operation(random.randint(1, rows))
+    except OperationalError:
+        # "database is locked"
+        errors += 1
+        continue
+    latencies.append((time.perf_counter() - start) * 1000)
+print(json.dumps({'latencies': latencies, 'errors': errors}))
+"""
+
+
+def run_config(name, args):
+    with tempfile.TemporaryDirectory() as root:
+        env = dict(os.environ, DB_ENGINE='sqlite', SQLITE_PATH=os.path.join(root, 'bench.sqlite3'), **CONFIGS[name])
+        command = [sys.executable, '-c', WORKER_SCRIPT]
+        subprocess.run(command + ['seed', str(args.rows), '0', '0'], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+        # Workers start together once every interpreter has set up Django
+        start_at = str(time.time() + 5)
+        roles = ['writer'] * args.writers + ['reader'] * args.readers
+        processes = [
+            (role, subprocess.Popen(
+                command + [role, str(args.rows), start_at, str(args.seconds)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            ))
+            for role in roles
+        ]
+        results = {'writer': {'latencies': [], 'errors': 0}, 'reader': {'latencies': [], 'errors': 0}}
+        for role, process in processes:
+            output = json.loads(process.communicate()[0].strip().splitlines()[-1])
+            results[role]['latencies'] += output['latencies']
+            results[role]['errors'] += output['errors']
+        return results
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer and {args.readers} reader processes for {args.seconds:.0f}s per configuration\n")
+    print(f"{'config':<8} {'role':<7} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>9} {'locked':>7}")
+    for name in CONFIGS:
+        results = run_config(name, args)
+        for role, result in results.items():
+            latencies = result['latencies']
+            print(
+                f"{name:<8} {role:<7} {len(latencies) / args.seconds:>8.0f} "
+                f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.99):>9.1f} {result['errors']:>7}"
+            )
+
+
+if __name__ == '__main__':
+    main()
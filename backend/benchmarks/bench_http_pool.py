@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmark ClickDrop requests with and without the pooled keep-alive session.
+
+Runs against a local stub server, so no API key or network is needed:
+
+    python benchmarks/bench_http_pool.py --requests 500 --threads 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_clickdrop import start_stub_server  # noqa: E402
+from Image.http_client import PooledHTTPClient  # noqa: E402
+
+PAYLOAD = b'\xff' * 32 * 1024
+
+
+def post_unpooled(url):
+    # What the service used to do: a fresh connection per call
+    return requests.post(url, files={'image_file': PAYLOAD}, timeout=60)
+
+
+def run(label, send, url, total, threads, server):
+    server.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for response in pool.map(lambda _: send(url), range(total)):
+            response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {total / elapsed:10.1f} req/s   {elapsed:7.2f}s   {server.connections:5d} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub server delay per request (seconds)')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency)
+    url = f'{base_url}/remove-text/v1'
+    client = PooledHTTPClient(pool_maxsize=args.threads, max_per_host=args.threads)
+
+    print(f"{args.requests} requests, {args.threads} threads, {args.latency * 1000:.0f} ms stub latency")
+    run('unpooled', post_unpooled, url, args.requests, args.threads, server)
+    run('pooled', lambda u: client.post(u, files={'image_file': PAYLOAD}), url, args.requests, args.threads, server)
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Benchmark image listing queries over a large seeded table.
+
+Seeds a throwaway SQLite database with --rows images, then times each
+listing query two ways:
+
+- before: no composite indexes, OFFSET pagination and full model rows,
+  as a listing built on Image.objects would page;
+- after:  the Meta.indexes listing indexes, keyset pagination and the
+  .values() projection of Image/listing.py.
+
+    python benchmarks/bench_image_listing.py --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+os.environ['JOB_QUEUE_BACKEND'] = 'memory'
+os.environ['JOB_QUEUE_AUTOSTART'] = 'False'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from Image.listing import encode_cursor, list_images  # noqa: E402
+from Image.models import Image  # noqa: E402
+
+LIMIT = 50
+USERS = 1000
+STATUSES = ['pending'] * 5 + ['processing'] + ['completed'] * 93 + ['failed']
+
+
+def seed(rows, chunk=50000):
+    """Insert ``rows`` images spread over a year, oldest first, in raw batches"""
+    random.seed(0)
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    step = 365 * 24 * 3600 / rows
+    columns = [
+        'image', 'created_at', 'created_by', 'date', 'time', 'text_removed', 'text_removal_status',
+        'compression_processed', 'compression_status',
+    ]
+    sql = f"INSERT INTO {Image._meta.db_table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, chunk):
+            batch = []
+            for index in range(offset, min(rows, offset + chunk)):
+                created_at = start + datetime.timedelta(seconds=index * step)
+                status = random.choice(STATUSES)
+                batch.append((
+                    f'uploads/{index}.jpg', created_at.strftime('%Y-%m-%d %H:%M:%S.%f'), f'user{random.randrange(USERS)}',
+                    created_at.strftime('%Y-%m-%d'), created_at.strftime('%H:%M:%S'), status == 'completed', status,
+                    False, 'pending',
+                ))
+            cursor.executemany(sql, batch)
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def offset_page(filters, offset):
+    queryset = Image.objects.filter(**filters).order_by('-created_at', '-id')
+    return list(queryset[offset:offset + LIMIT])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        connection.settings_dict['NAME'] = os.path.join(root, 'bench.sqlite3')
+        call_command('migrate', verbosity=0)
+        with connection.schema_editor() as editor:
+            for index in Image._meta.indexes:
+                editor.remove_index(Image, index)
+
+        start = time.perf_counter()
+        seed(args.rows)
+        print(f"Seeded {args.rows} rows in {time.perf_counter() - start:.1f}s\n")
+
+        depth = args.rows // 2
+        week = {
+            'created_at__gte': datetime.datetime(2025, 7, 1, tzinfo=datetime.timezone.utc),
+            'created_at__lte': datetime.datetime(2025, 7, 7, 23, 59, 59, 999999, tzinfo=datetime.timezone.utc),
+        }
+        cases = [
+            ('first page', {}, {}, 0),
+            (f'page at row {depth}', {}, {}, depth),
+            ('created_by', {'created_by': 'user7'}, {'created_by': 'user7'}, 0),
+            ('status=failed', {'text_removal_status': 'failed'}, {'text_removal_status': 'failed'}, 0),
+            ('created_at week', week, {'created_after': '2025-07-01', 'created_before': '2025-07-07'}, 0),
+        ]
+
+        before = {name: timed(lambda: offset_page(filters, offset), args.repeat) for name, filters, _, offset in cases}
+
+        start = time.perf_counter()
+        with connection.schema_editor() as editor:
+            for index in Image._meta.indexes:
+                editor.add_index(Image, index)
+        print(f"Built listing indexes in {time.perf_counter() - start:.1f}s\n")
+
+        after = {}
+        for name, filters, params, offset in cases:
+            params = dict(params, limit=str(LIMIT))
+            if offset:
+                row = Image.objects.filter(**filters).order_by('-created_at', '-id').values('id', 'created_at')[offset - 1]
+                params['cursor'] = encode_cursor(row)
+            after[name] = timed(lambda: list_images(params), args.repeat)
+
+        print(f"{'query (50 rows)':<22} {'before ms':>10} {'after ms':>10} {'speedup':>9}")
+        for name, *_ in cases:
+            print(f"{name:<22} {before[name]:>10.2f} {after[name]:>10.2f} {before[name] / after[name]:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
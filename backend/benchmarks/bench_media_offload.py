@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Benchmark MB/s of media served by one Django worker in each download mode.
+
+A file is requested repeatedly from /media/ in a fresh interpreter per
+mode, driving the ASGI or WSGI application directly (no network), and the
+throughput and peak RSS growth of that worker are reported (Linux only):
+
+- fileresponse: plain FileResponse under ASGI, as static() and the download
+  views served files before. Django reads the whole file into memory first.
+- stream:       MEDIA_OFFLOAD unset under ASGI; the file is read in chunks
+  in a worker thread.
+- wsgi:         MEDIA_OFFLOAD unset under WSGI; the server's file_wrapper
+  sends the file with os.sendfile(), as gunicorn does.
+- x-accel-redirect / x-sendfile: only headers leave Python and the front
+  proxy sends the file. MB/s is what one worker can hand off.
+
+    python benchmarks/bench_media_offload.py --size-mb 64 --requests 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ['fileresponse', 'stream', 'wsgi', 'x-accel-redirect', 'x-sendfile']
+
+SERVE_SCRIPT = """
+import asyncio, io, json, os, sys, time, types, warnings
+mode, root, requests = sys.argv[1], sys.argv[2], int(sys.argv[3])
+os.environ['DJANGO_SETTINGS_MODULE'] = 'Backend.settings'
+os.environ['JOB_QUEUE_BACKEND'] = 'memory'
+os.environ['JOB_QUEUE_AUTOSTART'] = 'False'
+os.environ['MEDIA_OFFLOAD'] = mode if mode.startswith('x-') else ''
+warnings.simplefilter('ignore')
+
+import django
+django.setup()
+from django.conf import settings
+from django.urls import re_path
+from django.views.static import serve
+from Image.downloads import serve_media
+settings.MEDIA_ROOT = root
+urls = types.ModuleType('bench_urls')
+urls.urlpatterns = [
+    re_path(r'^legacy/(?P<path>.*)$', serve, {'document_root': root}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+]
+sys.modules['bench_urls'] = urls
+settings.ROOT_URLCONF = 'bench_urls'
+
+def memory_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+async def asgi_get(app, path):
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 1)}
+    sent = False
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Event().wait()
+    total = 0
+    async def send(message):
+        nonlocal total
+        if message['type'] == 'http.response.body':
+            total += len(message.get('body', b''))
+    await app(scope, receive, send)
+    return total
+
+def wsgi_get(app, path, sink):
+    class SendfileWrapper:
+        def __init__(self, f, block_size):
+            self.f = f
+        def close(self):
+            self.f.close()
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+               'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+               'wsgi.file_wrapper': SendfileWrapper}
+    result = app(environ, lambda status, headers: None)
+    total = 0
+    try:
+        if isinstance(result, SendfileWrapper):
+            # What gunicorn does with a file_wrapper: the kernel copies the bytes
+            fd, offset = result.f.fileno(), result.f.tell()
+            while sent := os.sendfile(sink, fd, offset + total, 1 << 20):
+                total += sent
+        else:
+            for chunk in result:
+                total += len(chunk)
+    finally:
+        result.close()
+    return total
+
+path = '/legacy/bench.bin' if mode == 'fileresponse' else '/media/bench.bin'
+if mode == 'wsgi':
+    from django.core.wsgi import get_wsgi_application
+    app = get_wsgi_application()
+    sink = os.open(os.devnull, os.O_WRONLY)
+    fetch = lambda: wsgi_get(app, path, sink)
+    fetch_small = lambda: wsgi_get(app, '/media/small.bin', sink)
+else:
+    from django.core.asgi import get_asgi_application
+    app = get_asgi_application()
+    fetch = lambda: asyncio.run(asgi_get(app, path))
+    fetch_small = lambda: asyncio.run(asgi_get(app, '/media/small.bin'))
+
+fetch_small()
+baseline_kb = memory_kb('VmRSS')
+size = os.path.getsize(os.path.join(root, 'bench.bin'))
+start = time.perf_counter()
+for _ in range(requests):
+    fetch()
+seconds = time.perf_counter() - start
+print(json.dumps({
+    'mb_per_s': size * requests / seconds / 1e6,
+    'requests_per_s': requests / seconds,
+    'peak_mb': (memory_kb('VmHWM') - baseline_kb) / 1024,
+}))
+"""
+
+
+def measure(mode, root, requests):
+    output = subprocess.run(
+        [sys.executable, '-c', SERVE_SCRIPT, mode, root, str(requests)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, 'bench.bin'), 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        with open(os.path.join(root, 'small.bin'), 'wb') as f:
+            f.write(b'x' * 1024)
+
+        print(f"{args.requests} requests for a {args.size_mb} MB file per mode, one worker\n")
+        print(f"{'mode':<18} {'MB/s':>10} {'req/s':>10} {'peak MB':>9}")
+        for mode in args.modes:
+            result = measure(mode, root, args.requests)
+            print(f"{mode:<18} {result['mb_per_s']:>10.0f} {result['requests_per_s']:>10.1f} {result['peak_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Benchmark decode time and peak RSS with and without reduce-on-load.
+
+For each input size a synthetic photo is decoded and shrunk the way
+compression (fit in 1920x1080), captioning (384x384) and untiled VQGAN
+(64x64) need it: once by decoding at full resolution first, as before, and
+once through Image.imaging.reduce_on_load. Every measurement runs in a
+fresh interpreter so peak RSS is that decode's alone (Linux only):
+
+    python benchmarks/bench_reduce_on_load.py --megapixels 2 6 12 24 48 --format JPEG
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'compress': ((1920, 1080), True),
+    'caption': ((384, 384), False),
+    'vqgan': ((64, 64), False),
+}
+
+DECODE_SCRIPT = """
+import json, statistics, sys, time
+from PIL import Image
+from Image.imaging import reduce_on_load
+
+path, mode, width, height, fit, repeats = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5] == '1', int(sys.argv[6])
+def memory_kb(field):
+    # VmHWM is the peak RSS of this process image; unlike ru_maxrss it is not
+    # inherited from the (large) benchmark process across exec
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+baseline_kb = memory_kb('VmRSS')
+timings = []
+for _ in range(repeats):
+    start = time.perf_counter()
+    with Image.open(path) as source:
+        img = reduce_on_load(source, (width, height), fit=fit) if mode == 'reduced' else source
+        img = img.convert('RGB')
+    if fit:
+        img.thumbnail((width, height), Image.Resampling.LANCZOS)
+    else:
+        img = img.resize((width, height), Image.Resampling.BICUBIC)
+    timings.append(time.perf_counter() - start)
+peak_kb = memory_kb('VmHWM')
+print(json.dumps({'seconds': statistics.median(timings), 'peak_mb': (peak_kb - baseline_kb) / 1024}))
+"""
+
+
+def make_photo(path, megapixels, format):
+    from PIL import Image
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    noise = Image.effect_noise((width // 16, height // 16), 64)
+    photo = Image.merge('RGB', [noise, noise.transpose(Image.Transpose.FLIP_TOP_BOTTOM), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)])
+    photo.resize((width, height), Image.Resampling.BICUBIC).save(path, format, quality=92)
+    return width, height
+
+
+def measure(path, mode, size, fit, repeats):
+    output = subprocess.run(
+        [sys.executable, '-c', DECODE_SCRIPT, path, mode, str(size[0]), str(size[1]), '1' if fit else '0', str(repeats)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[2, 6, 12, 24, 48])
+    parser.add_argument('--format', default='JPEG', choices=['JPEG', 'PNG'])
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'input':>16} {'target':>9}  {'full ms':>8} {'full MB':>8}  {'reduced ms':>10} {'reduced MB':>10}  speedup")
+    with tempfile.TemporaryDirectory() as directory:
+        for megapixels in args.megapixels:
+            path = os.path.join(directory, f'photo_{megapixels}.{args.format.lower()}')
+            width, height = make_photo(path, megapixels, args.format)
+            for target in args.targets:
+                size, fit = TARGETS[target]
+                full = measure(path, 'full', size, fit, args.repeats)
+                reduced = measure(path, 'reduced', size, fit, args.repeats)
+                print(
+                    f"{f'{width}x{height}':>16} {target:>9}  "
+                    f"{full['seconds'] * 1000:>8.1f} {full['peak_mb']:>8.1f}  "
+                    f"{reduced['seconds'] * 1000:>10.1f} {reduced['peak_mb']:>10.1f}  "
+                    f"{full['seconds'] / reduced['seconds']:>6.1f}x"
+                )
+
+
+if __name__ == '__main__':
+    main()
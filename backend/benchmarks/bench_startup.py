@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Benchmark Django startup cost with lazy vs. eager model loading.
+
+Each run is a fresh interpreter that sets up Django and imports the
+URLconf, which is what manage.py commands and worker boots pay. The
+eager run also loads the models up front, as the app did before the
+model registry existed:
+
+    python benchmarks/bench_startup.py --runs 3 --models blip vqgan
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+import django
+django.setup()
+import Backend.urls
+names = sys.argv[1:]
+if names:
+    # The old compression_service imported torch via vqgan_model unconditionally
+    import Image.vqgan_model
+    from Image.model_registry import registry
+    registry.warm_up(names)
+elapsed = time.perf_counter() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({'seconds': elapsed, 'rss_mb': rss_mb}))
+"""
+
+
+def measure(models):
+    env = dict(os.environ, MODEL_WARMUP='')
+    output = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT, *models],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--models', nargs='+', default=['blip', 'vqgan'], help='Models the eager run loads')
+    args = parser.parse_args()
+
+    for label, models in (('lazy', []), ('eager', args.models)):
+        results = [measure(models) for _ in range(args.runs)]
+        seconds = statistics.median(r['seconds'] for r in results)
+        rss_mb = statistics.median(r['rss_mb'] for r in results)
+        print(f"{label:<6} startup {seconds:6.2f}s   peak RSS {rss_mb:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
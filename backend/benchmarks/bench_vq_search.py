@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Benchmark VectorQuantizerEMA nearest-codebook search: dense vs. chunked.
+
+The dense path is the original one: a full (BHW x N) distance matrix,
+then a (BHW x N) one-hot matrix multiplied back into the codebook. The
+chunked path is the eval-mode forward. Each measurement runs in a fresh
+interpreter, so the peak RSS growth above the inputs is that path's alone:
+
+    python benchmarks/bench_vq_search.py --batch-sizes 1 8 32 128 --chunk-size 4096
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEARCH_SCRIPT = """
+import json, resource, statistics, sys, time
+import torch
+import torch.nn.functional as F
+from Image.vqgan_model import VectorQuantizerEMA
+
+mode, batch_size, chunk_size, repeats = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+torch.manual_seed(0)
+torch.set_num_threads(1)
+quantizer = VectorQuantizerEMA(1024, 256, chunk_size=chunk_size).eval()
+inputs = torch.randn(batch_size, 256, 16, 16)  # encoder output for batch_size 64x64 tiles
+
+def dense(inputs):
+    b, c, h, w = inputs.shape
+    flat = inputs.permute(0, 2, 3, 1).contiguous().view(-1, c)
+    embedding = quantizer.embedding
+    distances = (
+        torch.sum(flat ** 2, dim=1, keepdim=True)
+        - 2 * torch.matmul(flat, embedding)
+        + torch.sum(embedding ** 2, dim=0, keepdim=True)
+    )
+    encoding_indices = torch.argmin(distances, dim=1)
+    encodings = F.one_hot(encoding_indices, quantizer.num_embeddings).type(flat.dtype)
+    quantized = torch.matmul(encodings, embedding.t()).view(b, h, w, c).permute(0, 3, 1, 2).contiguous()
+    return quantized, encoding_indices.view(b, h, w)
+
+def chunked(inputs):
+    quantized, _, indices = quantizer(inputs)
+    return quantized, indices
+
+run = dense if mode == 'dense' else chunked
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+timings = []
+with torch.no_grad():
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _, indices = run(inputs)
+        timings.append(time.perf_counter() - start)
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'seconds': statistics.median(timings),
+    'peak_mb': (peak_kb - baseline_kb) / 1024,
+    'checksum': int(indices.sum()),
+}))
+"""
+
+
+def measure(mode, batch_size, chunk_size, repeats):
+    output = subprocess.run(
+        [sys.executable, '-c', SEARCH_SCRIPT, mode, str(batch_size), str(chunk_size), str(repeats)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--chunk-size', type=int, default=4096, help='Rows per argmin block')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'tiles':>6} {'rows':>7}  {'dense ms':>9} {'dense MB':>9}  {'chunked ms':>10} {'chunked MB':>10}  same")
+    for batch_size in args.batch_sizes:
+        dense = measure('dense', batch_size, args.chunk_size, args.repeats)
+        chunked = measure('chunked', batch_size, args.chunk_size, args.repeats)
+        same = 'yes' if dense['checksum'] == chunked['checksum'] else 'NO'
+        print(
+            f"{batch_size:>6} {batch_size * 256:>7}  "
+            f"{dense['seconds'] * 1000:>9.1f} {dense['peak_mb']:>9.1f}  "
+            f"{chunked['seconds'] * 1000:>10.1f} {chunked['peak_mb']:>10.1f}  {same}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark disk I/O and latency of storing processed/compressed results.
+
+Compares the old write path (temporary file, reopen, copy into storage,
+delete) against writing the in-memory buffer straight into storage with
+ContentFile. I/O is read from /proc/self/io, so this needs Linux:
+
+    python benchmarks/bench_write_path.py --size 2000000 --iterations 200
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from django.core.files import File  # noqa: E402
+from django.core.files.base import ContentFile  # noqa: E402
+from django.core.files.storage import FileSystemStorage  # noqa: E402
+
+
+def read_io_counters():
+    counters = {}
+    with open('/proc/self/io') as f:
+        for line in f:
+            key, value = line.split(':')
+            counters[key] = int(value)
+    return counters
+
+
+def save_via_temp_file(storage, name, data):
+    # Old path: response/encoder output -> temp file -> reopen -> storage
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
+        temp_file.write(data)
+        temp_file_path = temp_file.name
+    with open(temp_file_path, 'rb') as f:
+        storage.save(name, File(f))
+    os.unlink(temp_file_path)
+
+
+def save_direct(storage, name, data):
+    storage.save(name, ContentFile(data))
+
+
+def run(label, save, data, iterations):
+    location = tempfile.mkdtemp()
+    storage = FileSystemStorage(location=location)
+    try:
+        before = read_io_counters()
+        start = time.perf_counter()
+        for i in range(iterations):
+            save(storage, f'processed/result_{i}.png', data)
+        elapsed = time.perf_counter() - start
+        after = read_io_counters()
+    finally:
+        shutil.rmtree(location)
+
+    read_bytes = (after['rchar'] - before['rchar']) / iterations
+    written_bytes = (after['wchar'] - before['wchar']) / iterations
+    print(
+        f"{label:<10} {elapsed / iterations * 1000:8.3f} ms/request   "
+        f"read {read_bytes / 1024:9.1f} KiB/request   written {written_bytes / 1024:9.1f} KiB/request"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2_000_000, help='Result size in bytes')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    print(f"{args.iterations} results of {args.size / 1024:.0f} KiB")
+    run('temp file', save_via_temp_file, data, args.iterations)
+    run('direct', save_direct, data, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Load test the async views in a single ASGI worker.
+
+Starts a local stub of the ClickDrop API with an artificial delay, fires
+long-running remove-text requests at the ASGI application and, while
+they are in flight, hammers the status endpoint with concurrent polls:
+
+    python benchmarks/load_test_async.py --jobs 20 --polls 1000 --concurrency 200 --latency 2
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_clickdrop import start_stub_server  # noqa: E402
+
+
+def setup_django(api_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    os.environ['CLICKDROP_API_URL'] = api_url
+    os.environ['CLICKDROP_API_KEY'] = 'load-test'
+    os.environ['JOB_QUEUE_BACKEND'] = 'memory'
+    os.environ['JOB_QUEUE_AUTOSTART'] = 'False'
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    settings.MEDIA_ROOT = tempfile.mkdtemp()
+    # A file-backed database; shared-cache in-memory SQLite locks whole tables
+    connection.settings_dict['TEST']['NAME'] = os.path.join(settings.MEDIA_ROOT, 'load_test.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+
+
+def seed_images(count):
+    from PIL import Image as PILImage
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from Image.models import Image
+
+    ids = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (64, 64), (i % 256, 0, 0)).save(buffer, 'PNG')
+        image = Image.objects.create(
+            image=SimpleUploadedFile(f'load_{i}.png', buffer.getvalue()),
+            created_by='load-test',
+            date='2025-01-01',
+            time='00:00:00',
+        )
+        ids.append(image.id)
+    return ids
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(ids, polls, concurrency):
+    import httpx
+    from Backend.asgi import application
+
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost', timeout=None) as client:
+        # The first request imports the URLconf and its services; keep that out of the numbers
+        await client.get('/image/metrics/')
+
+        job_start = time.perf_counter()
+        jobs = [asyncio.create_task(client.post(f'/image/remove-text/{image_id}/')) for image_id in ids]
+
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def poll(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(f'/image/status/{ids[i % len(ids)]}/')
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        await asyncio.sleep(0.05)  # let the long jobs reach the stub first
+        poll_start = time.perf_counter()
+        await asyncio.gather(*(poll(i) for i in range(polls)))
+        poll_elapsed = time.perf_counter() - poll_start
+        in_flight = sum(1 for job in jobs if not job.done())
+
+        responses = await asyncio.gather(*jobs)
+        job_elapsed = time.perf_counter() - job_start
+
+    completed = sum(1 for r in responses if r.json().get('result', {}).get('success'))
+    print(f"status polls:   {polls} in {poll_elapsed:.2f}s ({polls / poll_elapsed:.0f} req/s), "
+          f"{in_flight} remove-text jobs still in flight when polling finished")
+    print(f"poll latency:   p50 {statistics.median(latencies) * 1000:.1f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms   max {max(latencies) * 1000:.1f} ms")
+    print(f"remove-text:    {completed}/{len(ids)} completed in {job_elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20, help='Concurrent remove-text requests')
+    parser.add_argument('--polls', type=int, default=1000, help='Status requests to send')
+    parser.add_argument('--concurrency', type=int, default=200, help='Status requests in flight at once')
+    parser.add_argument('--latency', type=float, default=2.0, help='Stub ClickDrop delay (seconds)')
+    args = parser.parse_args()
+
+    server, api_url = start_stub_server(latency=args.latency)
+    setup_django(api_url)
+    ids = seed_images(args.jobs)
+    asyncio.run(run_load(ids, args.polls, args.concurrency))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
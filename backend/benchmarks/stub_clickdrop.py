@@ -0,0 +1,67 @@
+"""
+Local stand-in for the ClickDrop remove-text API used by the benchmarks.
+
+Answers every POST to /remove-text/v1 with a fixed PNG body after an
+optional artificial delay, speaking HTTP/1.1 so clients can keep the
+connection alive.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 1x1 transparent PNG
+PNG_BYTES = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+class StubClickDropHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(PNG_BYTES)))
+        self.end_headers()
+        self.wfile.write(PNG_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubClickDropServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        # Every accepted socket is a new TCP connection
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+def start_stub_server(latency=0.0, host='127.0.0.1', port=0):
+    """Start the stub in a background thread; returns (server, base_url)"""
+    handler = type('Handler', (StubClickDropHandler,), {'latency': latency})
+    server = StubClickDropServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    server, url = start_stub_server()
+    print(f'Stub ClickDrop API listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -12,8 +12,11 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-68((jhbnogo-*drf-6@m%
 
 # API Configuration
 CLICKDROP_API_URL = 'https://api.clickdrop.co/api/v1'
-CLICKDROP_TIMEOUT = 60  # seconds
+CLICKDROP_CONNECT_TIMEOUT = 5  # seconds
+CLICKDROP_READ_TIMEOUT = 60  # seconds
 
-# File Upload Configuration
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp'] 
\ No newline at end of file
+# File Upload Configuration (enforced through Backend/settings.py, which reads the same variables)
+MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', str(5 * 1024 * 1024)))  # 5MB
+ALLOWED_IMAGE_TYPES = [name.strip() for name in os.environ.get('ALLOWED_IMAGE_TYPES', 'image/jpeg,image/png,image/gif,image/webp').split(',') if name.strip()]
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', '500'))
+MAX_ARCHIVE_SIZE = int(os.environ.get('MAX_ARCHIVE_SIZE', str(512 * 1024 * 1024)))  # 512MB